@@ -1,13 +1,68 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
+import time
 import asyncio
-from litellm import acompletion
+import logging
+from litellm import acompletion, get_supported_openai_params, stream_chunk_builder, token_counter
+from common.resilience import (
+    CIRCUIT_OPEN,
+    FATAL,
+    RetryPolicy,
+    circuit_breaker,
+    classify_error,
+    hedged,
+    latency_tracker,
+    retry_after_seconds,
+)
+from common.run_metrics import run_metrics
+
+logger = logging.getLogger(__name__)
 # Semaphore to limit concurrent API calls (used in batch simulations)
 MAX_CONCURRENT_API_CALLS = 5
 api_semaphore = asyncio.Semaphore(MAX_CONCURRENT_API_CALLS)
 
 
+def find_stream_cutoff(text: str, stop: List[str] = None, end_tokens: List[str] = None) -> Optional[int]:
+    """Return where a streamed generation should be cut, or None to keep streaming.
+
+    Stop sequences (e.g. the next speaker tag) cut the text right before them.
+    End tokens (e.g. [DONE]) are kept, and the text is cut at the end of the line
+    they appear on so the rest of that utterance survives.
+    """
+    positions = []
+    for sequence in stop or []:
+        idx = text.find(sequence)
+        if idx != -1:
+            positions.append(idx)
+    for token in end_tokens or []:
+        idx = text.find(token)
+        if idx != -1:
+            line_end = text.find("\n", idx + len(token))
+            if line_end != -1:
+                positions.append(line_end)
+    return min(positions) if positions else None
+
+
+def merge_generation_stats(stats_list: List[dict]) -> dict:
+    """Combine the generation stats of several LLM calls made for one turn."""
+    if not stats_list:
+        return {}
+    return {
+        'llm_calls': len(stats_list),
+        'latency': sum(s.get('latency', 0) for s in stats_list),
+        'time_to_first_token': stats_list[0].get('time_to_first_token'),
+        'completion_tokens': sum(s.get('completion_tokens', 0) for s in stats_list),
+        'dropped_tokens': sum(s.get('dropped_tokens', 0) for s in stats_list),
+        'halted_on_stop': any(s.get('halted_on_stop') for s in stats_list),
+    }
+
+
+def choice_reasoning(choice) -> str:
+    """Reasoning/thinking content of one choice, or an empty string if the model did not return any."""
+    return getattr(choice.message, 'reasoning_content', None) or ''
+
+
 class AIClient(ABC):
     """Abstract base class for AI clients"""
 
@@ -16,13 +71,23 @@ class AIClient(ABC):
 
 
     @abstractmethod
-    async def async_chat_completion(self, messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float, tools: List[dict] = None, tool_choice: str = None) -> dict:
+    async def async_chat_completion(self, messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float, tools: List[dict] = None, tool_choice: str = None,
+                                    stop: List[str] = None, stream: bool = False, end_tokens: List[str] = None, n: int = 1,
+                                    response_format: dict = None) -> dict:
         """Generate a chat completion response asynchronously
 
+        Args:
+            stop: Stop sequences passed to the provider (and enforced client-side when streaming)
+            stream: Stream the completion and terminate it as soon as a stop sequence or end token is emitted
+            end_tokens: Tokens that end the conversation; streaming stops at the end of their line
+            n: Number of samples to generate for the same prompt; 'choices' holds one entry per sample
+            response_format: Structured output format passed to the provider, e.g. a JSON schema
+
         Returns:
             dict: {
                 'choices': str,    # The actual response content
                 'reasoning': str,  # The reasoning/thinking process (empty string if not available)
+                'generation_stats': dict,  # Timing and token accounting for this call
             }
         """
         pass
@@ -31,8 +96,19 @@ class LiteLLMClient(AIClient):
     """LiteLLM client implementation supporting multiple providers"""
 
     def __init__(self, api_key: str = None, organization: str = None, base_url: str = None,
-                 custom_api_key: str = None, custom_api_key_env: str = None, extra_headers: dict = None, **kwargs):
+                 custom_api_key: str = None, custom_api_key_env: str = None, extra_headers: dict = None,
+                 native_n: bool = None, retry_policy: RetryPolicy = None, max_attempts: int = None,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_min_samples: int = 20, **kwargs):
         super().__init__()
+        # Whether the provider accepts the `n` parameter; None detects it from the model's provider
+        self.native_n = native_n
+        self.retry_policy = retry_policy or RetryPolicy()
+        if max_attempts is not None:
+            self.retry_policy.max_attempts = max_attempts
+        # Hedged requests duplicate a call once it runs past the endpoint's recent hedge_quantile latency
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
 
         # Store configuration for LiteLLM
         self.config = {}
@@ -71,8 +147,155 @@ class LiteLLMClient(AIClient):
         for key, value in kwargs.items():
             self.config[key] = value
 
-    async def async_chat_completion(self, messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float, tools: List[dict] = None, tool_choice: str = None) -> dict:
+    async def _stream_completion(self, llm_params: dict, stop: List[str], end_tokens: List[str], start_time: float):
+        """
+        Stream a completion, closing the stream once the text reaches a cutoff.
+        Returns (response, time_to_first_token, dropped_tokens). When the stream was
+        cut, the response's text and usage describe the kept text, and dropped_tokens
+        counts the streamed tokens past the cutoff; otherwise dropped_tokens is None.
+        """
+        stream = await acompletion(**llm_params, stream=True)
+        chunks = []
+        text = ''
+        time_to_first_token = None
+        cutoff = None
+        async for chunk in stream:
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start_time
+            chunks.append(chunk)
+            if chunk.choices:
+                text += chunk.choices[0].delta.content or ''
+            cutoff = find_stream_cutoff(text, stop, end_tokens)
+            if cutoff is not None:
+                break
+
+        if cutoff is not None:
+            close = getattr(stream, 'aclose', None)
+            if close is not None:
+                await close()
+
+        response = stream_chunk_builder(chunks, messages=llm_params['messages'])
+        if cutoff is None:
+            return response, time_to_first_token, None
+        kept = text[:cutoff]
+        response.choices[0].message.content = kept
+        # Both counts use the same tokenizer, so their difference is the cut suffix
+        kept_tokens = token_counter(model=llm_params['model'], text=kept) if kept else 0
+        dropped_tokens = max(token_counter(model=llm_params['model'], text=text) - kept_tokens, 0)
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            usage.completion_tokens = kept_tokens
+            usage.total_tokens = (getattr(usage, 'prompt_tokens', 0) or 0) + kept_tokens
+        return response, time_to_first_token, dropped_tokens
+
+    async def _complete_once(self, llm_params: dict, stream: bool, stop: List[str], end_tokens: List[str]):
+        """One provider call; returns (response, latency, time_to_first_token, dropped_tokens)."""
+        time_to_first_token = None
+        dropped_tokens = None
+        async with api_semaphore:
+            # Timed from the slot, so latencies (and the hedge threshold) exclude queueing
+            start_time = time.perf_counter()
+            if stream:
+                response, time_to_first_token, dropped_tokens = await self._stream_completion(llm_params, stop, end_tokens, start_time)
+            else:
+                response = await acompletion(**llm_params)
+            latency = time.perf_counter() - start_time
+        return response, latency, time_to_first_token, dropped_tokens
+
+    async def _resilient_completion(self, llm_params: dict, stream: bool, stop: List[str], end_tokens: List[str]):
+        """
+        Call the provider with retries, the endpoint's circuit breaker and optional hedging.
+        Returns _complete_once's result plus the number of attempts and whether the call was hedged.
+        """
+        model = llm_params['model']
+        endpoint = f"{self.config.get('base_url', 'default')}/{model}"
+        breaker = circuit_breaker(endpoint)
+        tracker = latency_tracker(endpoint)
+        policy = self.retry_policy
+        for attempt in range(policy.max_attempts):
+            try:
+                breaker.before_call()
+                hedge_after = tracker.quantile(self.hedge_quantile, self.hedge_min_samples) if self.hedge else None
+                # Hedge only into a free slot, so duplicates never queue ahead of first attempts
+                result, was_hedged = await hedged(
+                    lambda: self._complete_once(llm_params, stream, stop, end_tokens), hedge_after,
+                    can_hedge=lambda: not api_semaphore.locked(),
+                )
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except Exception as e:
+                error_class = classify_error(e)
+                if error_class != CIRCUIT_OPEN:
+                    run_metrics.observe_llm_call(model, 0.0, error=True)
+                if error_class == FATAL:
+                    breaker.release_probe()
+                    raise
+                if error_class != CIRCUIT_OPEN:
+                    breaker.record_failure()
+                if attempt == policy.max_attempts - 1:
+                    raise
+                delay = policy.delay(error_class, attempt, retry_after_seconds(e))
+                logger.warning(f"{model}: {error_class} error on attempt {attempt + 1}/{policy.max_attempts}, "
+                               f"retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            breaker.record_success()
+            response, latency, time_to_first_token, dropped_tokens = result
+            tracker.observe(latency)
+            return response, latency, time_to_first_token, dropped_tokens, attempt + 1, was_hedged
+
+    def supports_native_n(self, model: str) -> bool:
+        """
+        Whether the model's provider (as LiteLLM resolves it, e.g. openai or hosted_vllm)
+        samples n choices from one prefill. Unknown providers are fanned out.
+        """
+        if self.native_n is not None:
+            return self.native_n
+        try:
+            params = get_supported_openai_params(model=model, custom_llm_provider=self.config.get('custom_llm_provider'))
+        except Exception:
+            return False
+        return 'n' in (params or [])
+
+    async def _fan_out_completion(self, n: int, **kwargs) -> dict:
+        """Emulate `n` for providers without it by sending n concurrent single-sample requests."""
+        responses = await asyncio.gather(*[self.async_chat_completion(n=1, **kwargs) for _ in range(n)])
+        return {
+            'choices': [choice for response in responses for choice in response['choices']],
+            'reasoning': responses[0]['reasoning'],
+            'generation_stats': merge_generation_stats([response['generation_stats'] for response in responses]),
+        }
+
+    async def async_chat_completion(self, messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float, tools: List[dict] = None, tool_choice: str = None,
+                                    stop: List[str] = None, stream: bool = False, end_tokens: List[str] = None, n: int = 1,
+                                    response_format: dict = None) -> dict:
         """Generate a chat completion response using LiteLLM asynchronously"""
+        request = dict(messages=messages, model=model, max_tokens=max_tokens, temperature=temperature, tools=tools,
+                       tool_choice=tool_choice, stop=stop, stream=stream, end_tokens=end_tokens, response_format=response_format)
+        # Streaming cuts off a single choice, so sampled streams are always fanned out
+        if n > 1 and (stream or not self.supports_native_n(model)):
+            return await self._fan_out_completion(n, **request)
+        result = await self._chat_completion_once(n=n, **request)
+        missing = n - len(result['choices'])
+        if n > 1 and missing > 0:
+            # Some servers accept n but return fewer choices; sample the rest one at a time
+            logger.warning(f"{model}: asked for {n} choices, got {len(result['choices'])}; fanning out for the rest")
+            extra = await self._fan_out_completion(missing, **request)
+            result = {
+                'choices': list(result['choices']) + extra['choices'],
+                'reasoning': result['reasoning'],
+                'generation_stats': merge_generation_stats([result['generation_stats'], extra['generation_stats']]),
+            }
+            result['generation_stats']['samples'] = n
+        return result
+
+    async def _chat_completion_once(self, messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float,
+                                    tools: List[dict] = None, tool_choice: str = None, stop: List[str] = None,
+                                    stream: bool = False, end_tokens: List[str] = None, n: int = 1,
+                                    response_format: dict = None) -> dict:
+        """One resilient completion request, with n passed to the provider as is."""
         try:
             # Build LiteLLM parameters
             llm_params = {
@@ -88,18 +311,49 @@ class LiteLLMClient(AIClient):
                 llm_params['tools'] = tools
             if tool_choice:
                 llm_params['tool_choice'] = tool_choice
+            if stop:
+                llm_params['stop'] = stop
+            if n > 1:
+                llm_params['n'] = n
+            if response_format:
+                llm_params['response_format'] = response_format
 
-            async with api_semaphore:
-                response = await acompletion(**llm_params)
+            response, latency, time_to_first_token, dropped_tokens, attempts, was_hedged = \
+                await self._resilient_completion(llm_params, stream, stop, end_tokens)
+            terminated_early = dropped_tokens is not None
 
             # Extract reasoning content if available (for models that support it)
-            reasoning = ''
-            if hasattr(response.choices[0].message, 'reasoning_content') and response.choices[0].message.reasoning_content:
-                reasoning = response.choices[0].message.reasoning_content
+            reasoning = choice_reasoning(response.choices[0])
+
+            usage = getattr(response, 'usage', None)
+            completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+            run_metrics.observe_llm_call(model, latency, completion_tokens)
+            finish_reason = response.choices[0].finish_reason
+            # vLLM reports which stop sequence ended the generation; other providers
+            # only say 'stop', which is indistinguishable from a natural end of turn.
+            provider_fields = getattr(response.choices[0], 'provider_specific_fields', None) or {}
+            matched_stop = getattr(response.choices[0], 'stop_reason', None) or provider_fields.get('stop_reason')
+            halted = terminated_early or (bool(stop) and matched_stop in stop)
+            generation_stats = {
+                'latency': latency,
+                'time_to_first_token': time_to_first_token,
+                'completion_tokens': completion_tokens,
+                'finish_reason': 'early_termination' if terminated_early else finish_reason,
+                'halted_on_stop': halted,
+                # Streamed past the cutoff and discarded; provider-side stops generate no suffix
+                'dropped_tokens': dropped_tokens or 0,
+            }
+            if n > 1:
+                generation_stats['samples'] = len(response.choices)
+            if attempts > 1:
+                generation_stats['attempts'] = attempts
+            if was_hedged:
+                generation_stats['hedged'] = True
 
             return {
                 'choices': response.choices,
-                'reasoning': reasoning
+                'reasoning': reasoning,
+                'generation_stats': generation_stats
             }
 
         except Exception as e:
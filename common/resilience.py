@@ -0,0 +1,196 @@
+"""
+Retry, circuit-breaking and hedging for LLM calls.
+
+LiteLLMClient runs every completion through these pieces:
+
+- classify_error sorts failures into rate limits, timeouts, server and
+  connection errors (retried) and client errors such as bad requests or
+  authentication failures (raised at once).
+- RetryPolicy waits a full-jitter exponential backoff between attempts,
+  with a longer base delay for rate limits and honouring Retry-After.
+- CircuitBreaker, one per endpoint (base URL and model), opens after a run of
+  consecutive retryable failures so callers back off together instead of
+  hammering a provider that is down, then lets a single probe through.
+- hedged fires a duplicate request once the primary has run longer than the
+  endpoint's recent p95 latency, and keeps whichever answers first. The
+  client skips the hedge while every API slot is taken.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+RATE_LIMIT = "rate_limit"
+TIMEOUT = "timeout"
+SERVER = "server"
+CONNECTION = "connection"
+CIRCUIT_OPEN = "circuit_open"
+FATAL = "fatal"
+RETRYABLE_ERRORS = (RATE_LIMIT, TIMEOUT, SERVER, CONNECTION, CIRCUIT_OPEN)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while an endpoint's circuit is open."""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"Circuit open for {endpoint}, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def classify_error(error: BaseException) -> str:
+    """Error class of a provider exception, from its status code or exception type."""
+    if isinstance(error, CircuitOpenError):
+        return CIRCUIT_OPEN
+    status = getattr(error, "status_code", None)
+    name = type(error).__name__.lower()
+    if status == 429 or "ratelimit" in name:
+        return RATE_LIMIT
+    if status in (408, 504) or "timeout" in name or isinstance(error, asyncio.TimeoutError):
+        return TIMEOUT
+    if "connection" in name or isinstance(error, ConnectionError):
+        return CONNECTION
+    if (isinstance(status, int) and status >= 500) or "serviceunavailable" in name or "internalserver" in name:
+        return SERVER
+    return FATAL
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The provider's Retry-After hint, when the exception carries response headers."""
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    # Rate limits clear on the provider's schedule, so they back off from a longer base
+    rate_limit_base_delay: float = 5.0
+    max_delay: float = 60.0
+
+    def delay(self, error_class: str, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff before retry number attempt (0-based)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay) + random.uniform(0, self.base_delay)
+        base = self.rate_limit_base_delay if error_class == RATE_LIMIT else self.base_delay
+        return random.uniform(0, min(self.max_delay, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive retryable failures; half-opens after cooldown."""
+
+    def __init__(self, endpoint: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go ahead."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(self.endpoint, remaining)
+            if self.probe_in_flight:
+                raise CircuitOpenError(self.endpoint, self.cooldown / 4)
+            self.probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.probe_in_flight or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+    def release_probe(self):
+        """A probe that ended without a verdict (e.g. a client error or cancellation)."""
+        with self._lock:
+            self.probe_in_flight = False
+
+
+class LatencyTracker:
+    """Recent successful-call latencies of one endpoint."""
+
+    def __init__(self, size: int = 200):
+        self.latencies = deque(maxlen=size)
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+# Shared by every client in the process, so concurrent conversations see the same endpoint state
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_latency_trackers: Dict[str, LatencyTracker] = {}
+
+
+def circuit_breaker(endpoint: str) -> CircuitBreaker:
+    return _circuit_breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+
+
+def latency_tracker(endpoint: str) -> LatencyTracker:
+    return _latency_trackers.setdefault(endpoint, LatencyTracker())
+
+
+async def hedged(call: Callable[[], Awaitable], hedge_after: Optional[float],
+                 can_hedge: Optional[Callable[[], bool]] = None) -> Tuple[object, bool]:
+    """
+    Await call(), starting a duplicate call() if the first has not finished after
+    hedge_after seconds and can_hedge() allows it. Returns (result, hedged). The
+    slower call is cancelled; if one call fails, the other is still awaited.
+    """
+    primary = asyncio.ensure_future(call())
+    if hedge_after is None:
+        return await primary, False
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result(), False
+    if can_hedge is not None and not can_hedge():
+        return await primary, False
+
+    pending = {primary, asyncio.ensure_future(call())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
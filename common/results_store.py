@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Results store: compressed JSONL segments with a sidecar offset index.
+
+Layout of a store directory:
+    manifest.json              format version and writer settings
+    segment-00000.jsonl.gz     records as JSON lines, compressed in independent gzip blocks
+    index.jsonl                one line per record: conversation_id -> segment, block offset/length, line
+    products.jsonl             compact stores: recommended catalog products, one line per catalog id
+    chunks.jsonl               compact stores: retrieved knowledge chunks, one line per content hash
+
+Each gzip block holds up to ``block_records`` records, so reading a single
+conversation only decompresses its block. Readers stream records one at a
+time instead of loading a whole results.json.
+
+Compact stores (format version 2) do not repeat retrieved text in every turn:
+a salesperson turn's ``recommended_items`` becomes ``{"$products": [catalog ids]}``
+and its ``knowledge_used`` becomes ``{"$chunks": [content hashes]}``, resolved
+against the shared tables. Readers rehydrate records to the original schema
+unless asked for compact records (``rehydrate=False``); the tables are loaded
+once per store on first use.
+
+Usage:
+    python3 -m common.results_store convert results.json {STORE_DIR}
+    python3 -m common.results_store export-parquet {STORE_DIR} turns.parquet
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+STORE_FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.jsonl"
+PRODUCTS_FILE = "products.jsonl"
+CHUNKS_FILE = "chunks.jsonl"
+# Separator between retrieved chunks in a turn's knowledge_used text
+KNOWLEDGE_SEPARATOR = "\n---\n"
+PRODUCTS_REF = "$products"
+CHUNKS_REF = "$chunks"
+# Name of the store directory inside a simulation output directory
+RESULTS_STORE_DIR = "results"
+LEGACY_RESULTS_FILE = "results.json"
+
+
+def _as_document(item) -> dict:
+    """A recommended item (Document or its serialized dict) as a plain dict."""
+    if isinstance(item, dict):
+        return item
+    return {"page_content": item.page_content, "metadata": item.metadata}
+
+
+def _chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+
+class ResultTables:
+    """The shared product and chunk tables of a compact store."""
+
+    def __init__(self):
+        self.products: Dict[str, dict] = {}
+        self.chunks: Dict[str, str] = {}
+        # Entries added since the tables were last written
+        self.new_products: List[dict] = []
+        self.new_chunks: List[dict] = []
+
+    @classmethod
+    def load(cls, path: str) -> "ResultTables":
+        tables = cls()
+        for name, handle in ((PRODUCTS_FILE, tables._load_product), (CHUNKS_FILE, tables._load_chunk)):
+            table_path = os.path.join(path, name)
+            if os.path.exists(table_path):
+                with open(table_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            handle(json.loads(line))
+        return tables
+
+    def _load_product(self, entry: dict):
+        self.products[entry["id"]] = {"page_content": entry["page_content"], "metadata": entry["metadata"]}
+
+    def _load_chunk(self, entry: dict):
+        self.chunks[entry["hash"]] = entry["text"]
+
+    def product_ref(self, item) -> str:
+        """Catalog id of a recommended item, interning it on first sight."""
+        document = _as_document(item)
+        ref = str(document.get("metadata", {}).get("id", ""))
+        existing = self.products.get(ref)
+        if not ref or (existing is not None and existing != document):
+            # No catalog id, or a different product under the same id: key by content instead
+            ref = "sha1:" + _chunk_hash(json.dumps(document, sort_keys=True, ensure_ascii=False))
+            existing = self.products.get(ref)
+        if existing is None:
+            self.products[ref] = document
+            self.new_products.append({"id": ref, **document})
+        return ref
+
+    def chunk_ref(self, text: str) -> str:
+        ref = _chunk_hash(text)
+        if ref not in self.chunks:
+            self.chunks[ref] = text
+            self.new_chunks.append({"hash": ref, "text": text})
+        return ref
+
+    def write_new(self, path: str):
+        for name, entries in ((PRODUCTS_FILE, self.new_products), (CHUNKS_FILE, self.new_chunks)):
+            if entries:
+                with open(os.path.join(path, name), 'a', encoding='utf-8') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.new_products = []
+        self.new_chunks = []
+
+
+def compact_record(record: dict, tables: ResultTables) -> dict:
+    """Replace recommended items and retrieved knowledge in each turn with table references."""
+    conversation = record.get("conversation")
+    if not isinstance(conversation, list):
+        return record
+    turns = []
+    for turn in conversation:
+        items = turn.get("recommended_items")
+        knowledge = turn.get("knowledge_used")
+        if items or (isinstance(knowledge, str) and knowledge):
+            turn = dict(turn)
+            if items and isinstance(items, list):
+                turn["recommended_items"] = {PRODUCTS_REF: [tables.product_ref(item) for item in items]}
+            if isinstance(knowledge, str) and knowledge:
+                turn["knowledge_used"] = {CHUNKS_REF: [tables.chunk_ref(c) for c in knowledge.split(KNOWLEDGE_SEPARATOR)]}
+        turns.append(turn)
+    return {**record, "conversation": turns}
+
+
+def resolve_recommended_items(turn: dict, tables: ResultTables) -> list:
+    items = turn.get("recommended_items", [])
+    if isinstance(items, dict) and PRODUCTS_REF in items:
+        return [tables.products[ref] for ref in items[PRODUCTS_REF]]
+    return items
+
+
+def resolve_knowledge(turn: dict, tables: ResultTables) -> str:
+    knowledge = turn.get("knowledge_used", "")
+    if isinstance(knowledge, dict) and CHUNKS_REF in knowledge:
+        return KNOWLEDGE_SEPARATOR.join(tables.chunks[ref] for ref in knowledge[CHUNKS_REF])
+    return knowledge
+
+
+def rehydrate_record(record: dict, tables: ResultTables) -> dict:
+    """The original record for a compact one; records without references are returned as is."""
+    conversation = record.get("conversation")
+    if not isinstance(conversation, list):
+        return record
+    for turn in conversation:
+        if isinstance(turn.get("recommended_items"), dict):
+            turn["recommended_items"] = resolve_recommended_items(turn, tables)
+        if isinstance(turn.get("knowledge_used"), dict):
+            turn["knowledge_used"] = resolve_knowledge(turn, tables)
+    return record
+
+
+class ResultsStore:
+    """Append-only store of result records with random access by conversation_id."""
+
+    def __init__(self, path: str, segment_records: int = 5000, block_records: int = 64,
+                 default: Optional[Callable[[Any], Any]] = None, compact: bool = True):
+        self.path = path
+        self.segment_records = segment_records
+        self.block_records = block_records
+        self.default = default
+        # Whether appended records are written with product and chunk references
+        self.compact = compact
+        self._index: Optional[Dict[str, dict]] = None
+        self._tables: Optional[ResultTables] = None
+        self._pending: List[dict] = []
+        self._segment = 0
+        self._segment_count = 0
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+    @property
+    def tables(self) -> ResultTables:
+        """Product and chunk tables, loaded on first use."""
+        if self._tables is None:
+            self._tables = ResultTables.load(self.path)
+        return self._tables
+
+    # Writing
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:05d}.jsonl.gz")
+
+    def open_for_append(self):
+        """Prepare the directory for writing, continuing after any existing records."""
+        os.makedirs(self.path, exist_ok=True)
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                # Stores written before compaction existed keep appending full records
+                self.compact = self.compact and json.load(f).get("compact", False)
+            entries = list(self._read_index_entries())
+            if entries:
+                self._segment = max(e["segment"] for e in entries)
+                self._segment_count = sum(1 for e in entries if e["segment"] == self._segment)
+        else:
+            with open(manifest_path, 'w') as f:
+                json.dump({
+                    "format_version": STORE_FORMAT_VERSION,
+                    "segment_records": self.segment_records,
+                    "block_records": self.block_records,
+                    "compact": self.compact,
+                }, f, indent=2)
+        return self
+
+    def append(self, record: dict):
+        self._pending.append(compact_record(record, self.tables) if self.compact else record)
+        if len(self._pending) >= self.block_records:
+            self.flush()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def flush(self):
+        """Write pending records as one gzip block and index them."""
+        while self._pending:
+            room = self.segment_records - self._segment_count
+            if room <= 0:
+                self._segment += 1
+                self._segment_count = 0
+                room = self.segment_records
+            block, self._pending = self._pending[:room], self._pending[room:]
+            self._write_block(block)
+
+    def _write_block(self, records: List[dict]):
+        if self._tables is not None:
+            # Table entries go first, so every written reference resolves
+            self._tables.write_new(self.path)
+        lines = [json.dumps(r, default=self.default, ensure_ascii=False) for r in records]
+        payload = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+        segment_path = self._segment_path(self._segment)
+        with open(segment_path, 'ab') as f:
+            offset = f.tell()
+            f.write(payload)
+
+        with open(os.path.join(self.path, INDEX_FILE), 'a', encoding='utf-8') as f:
+            for line_no, record in enumerate(records):
+                entry = {
+                    "conversation_id": str(record.get("conversation_id", f"{self._segment}:{offset}:{line_no}")),
+                    "segment": self._segment,
+                    "offset": offset,
+                    "length": len(payload),
+                    "line": line_no,
+                }
+                f.write(json.dumps(entry) + "\n")
+                if self._index is not None:
+                    self._index[entry["conversation_id"]] = entry
+        self._segment_count += len(records)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self.open_for_append()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Reading
+
+    def _read_index_entries(self) -> Iterator[dict]:
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    @property
+    def index(self) -> Dict[str, dict]:
+        if self._index is None:
+            self._index = {e["conversation_id"]: e for e in self._read_index_entries()}
+        return self._index
+
+    def ids(self) -> List[str]:
+        return list(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, conversation_id) -> bool:
+        return str(conversation_id) in self.index
+
+    def _read_block(self, segment: int, offset: int, length: int) -> List[str]:
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        return gzip.decompress(data).decode("utf-8").splitlines()
+
+    def get(self, conversation_id: str, rehydrate: bool = True) -> Optional[dict]:
+        """Read one record by conversation_id, decompressing only its block."""
+        entry = self.index.get(str(conversation_id))
+        if entry is None:
+            return None
+        lines = self._read_block(entry["segment"], entry["offset"], entry["length"])
+        record = json.loads(lines[entry["line"]])
+        return rehydrate_record(record, self.tables) if rehydrate else record
+
+    def iter_records(self, rehydrate: bool = True) -> Iterator[dict]:
+        """Stream every record in write order, one block in memory at a time."""
+        segment = 0
+        while os.path.exists(self._segment_path(segment)):
+            with gzip.open(self._segment_path(segment), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        yield rehydrate_record(record, self.tables) if rehydrate else record
+            segment += 1
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.iter_records()
+
+
+def write_results_store(results, path: str, default: Optional[Callable[[Any], Any]] = None,
+                        compact: bool = True) -> ResultsStore:
+    """Write an iterable of records to a new store at path, replacing any previous store."""
+    if ResultsStore.exists(path):
+        for name in os.listdir(path):
+            if name in (MANIFEST_FILE, INDEX_FILE, PRODUCTS_FILE, CHUNKS_FILE) or name.startswith("segment-"):
+                os.remove(os.path.join(path, name))
+    store = ResultsStore(path, default=default, compact=compact)
+    with store:
+        store.extend(results)
+    return store
+
+
+def resolve_results_path(path: str) -> str:
+    """Resolve a simulation output directory, store directory or legacy JSON file to what should be read."""
+    if os.path.isdir(path):
+        if ResultsStore.exists(path):
+            return path
+        store_path = os.path.join(path, RESULTS_STORE_DIR)
+        if ResultsStore.exists(store_path):
+            return store_path
+        legacy_path = os.path.join(path, LEGACY_RESULTS_FILE)
+        if os.path.exists(legacy_path):
+            return legacy_path
+        raise FileNotFoundError(f"No results store or {LEGACY_RESULTS_FILE} found in {path}")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Results not found: {path}")
+    return path
+
+
+def _load_legacy_records(path: str) -> List[dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # Handle arrays, {"simulations": [...]} wrappers and single objects
+    if isinstance(data, dict):
+        data = data["simulations"] if "simulations" in data else [data]
+    return data
+
+
+def iter_results(path: str, rehydrate: bool = True) -> Iterator[dict]:
+    """
+    Stream result records from a store, an output directory or a legacy results.json.
+    With rehydrate=False, records of a compact store keep their table references;
+    resolve them with resolve_recommended_items / resolve_knowledge when needed.
+    """
+    path = resolve_results_path(path)
+    if ResultsStore.exists(path):
+        yield from ResultsStore(path).iter_records(rehydrate=rehydrate)
+    else:
+        yield from _load_legacy_records(path)
+
+
+def get_result(path: str, conversation_id: str) -> Optional[dict]:
+    """Random access to one record; legacy JSON files fall back to a scan."""
+    path = resolve_results_path(path)
+    if ResultsStore.exists(path):
+        return ResultsStore(path).get(conversation_id)
+    for record in _load_legacy_records(path):
+        if str(record.get("conversation_id")) == str(conversation_id):
+            return record
+    return None
+
+
+def convert_legacy_results(json_path: str, store_path: str) -> ResultsStore:
+    """Convert a legacy results.json into a results store."""
+    return write_results_store(_load_legacy_records(json_path), store_path)
+
+
+def flatten_turns(record: dict) -> Iterator[dict]:
+    """Flat per-turn rows for columnar export."""
+    conversation = record.get("conversation", [])
+    if isinstance(conversation, str):
+        return
+    for turn in conversation:
+        yield {
+            "conversation_id": str(record.get("conversation_id", "")),
+            "scenario_id": record.get("scenario_id"),
+            "outcome": record.get("outcome"),
+            "total_turns": record.get("total_turns"),
+            "shopper_emotion": record.get("shopper_emotion"),
+            "turn": turn.get("turn"),
+            "speaker": turn.get("speaker"),
+            "text": turn.get("text"),
+            "recommended_items_count": turn.get("recommended_items_count"),
+        }
+
+
+def export_parquet(path: str, parquet_path: str, batch_rows: int = 10000):
+    """Export the flat per-turn fields of a results store to Parquet (requires pyarrow)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+
+    writer = None
+    rows = []
+
+    def write_rows():
+        nonlocal writer
+        table = pa.Table.from_pylist(rows)
+        if writer is None:
+            writer = pq.ParquetWriter(parquet_path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+
+    for record in iter_results(path):
+        rows.extend(flatten_turns(record))
+        if len(rows) >= batch_rows:
+            write_rows()
+            rows = []
+    if rows:
+        write_rows()
+    if writer is not None:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Results store utilities')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='Convert a legacy results.json into a results store')
+    convert_parser.add_argument('json_path', help='Legacy results.json')
+    convert_parser.add_argument('store_path', help='Output store directory')
+
+    parquet_parser = subparsers.add_parser('export-parquet', help='Export flat per-turn fields to Parquet')
+    parquet_parser.add_argument('results_path', help='Results store, output directory or legacy results.json')
+    parquet_parser.add_argument('parquet_path', help='Output Parquet file')
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        store = convert_legacy_results(args.json_path, args.store_path)
+        print(f"Converted {len(store)} records to {args.store_path}")
+    elif args.command == 'export-parquet':
+        export_parquet(args.results_path, args.parquet_path)
+        print(f"Exported per-turn fields to {args.parquet_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Live progress metrics for simulation runs.
+
+A process-wide RunMetrics records conversation starts and outcomes (reported
+by the simulation driver) and every LLM call (reported by the AI client). The
+driver can serve the metrics in Prometheus text format on a local port and
+print a console panel at a fixed interval, so backend saturation or a stuck
+provider shows up mid-run.
+
+Worker processes buffer their events and forward them to the parent, which
+replays them into its own RunMetrics (see drain_events / apply_events).
+"""
+
+import bisect
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Upper bounds (seconds) of the LLM latency histogram buckets
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+# Rates (conversations per minute, tokens per second) are computed over this window
+RATE_WINDOW_SECONDS = 60.0
+# Latency percentiles are computed over the most recent calls
+LATENCY_SAMPLE_SIZE = 2048
+
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class RunMetrics:
+    """Thread-safe counters and rolling windows for one simulation run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.forward = False
+        self._pending: List[tuple] = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.start_time = time.monotonic()
+            self.started = 0
+            self.completed = 0
+            self.outcomes = Counter()
+            self.llm_calls = Counter()
+            self.llm_errors = Counter()
+            self.completion_tokens = 0
+            self.latency_bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+            self.latency_sum = 0.0
+            self.recent_latencies = deque(maxlen=LATENCY_SAMPLE_SIZE)
+            self.last_llm_response: Optional[float] = None
+            self._completion_times = deque()
+            self._token_times = deque()
+
+    # Events are applied locally, or buffered for the parent process when forwarding
+
+    def _event(self, event: tuple):
+        with self._lock:
+            if self.forward:
+                self._pending.append(event)
+                return
+            self._apply(event, time.monotonic())
+
+    def conversation_started(self):
+        self._event(("start",))
+
+    def conversation_finished(self, outcome: str):
+        self._event(("finish", outcome))
+
+    def observe_llm_call(self, model: str, latency: float, completion_tokens: int = 0, error: bool = False):
+        self._event(("llm", model, latency, completion_tokens, error))
+
+    def drain_events(self) -> List[tuple]:
+        with self._lock:
+            events, self._pending = self._pending, []
+        return events
+
+    def apply_events(self, events: List[tuple]):
+        now = time.monotonic()
+        with self._lock:
+            for event in events:
+                self._apply(tuple(event), now)
+
+    def _apply(self, event: tuple, now: float):
+        kind = event[0]
+        if kind == "start":
+            self.started += 1
+        elif kind == "finish":
+            self.completed += 1
+            self.outcomes[event[1]] += 1
+            self._completion_times.append(now)
+        elif kind == "llm":
+            _, model, latency, completion_tokens, error = event
+            self.llm_calls[model] += 1
+            if error:
+                self.llm_errors[model] += 1
+                return
+            self.last_llm_response = now
+            self.latency_bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self.latency_sum += latency
+            self.recent_latencies.append(latency)
+            self.completion_tokens += completion_tokens
+            self._token_times.append((now, completion_tokens))
+
+    def _trim_windows(self, now: float):
+        cutoff = now - RATE_WINDOW_SECONDS
+        while self._completion_times and self._completion_times[0] < cutoff:
+            self._completion_times.popleft()
+        while self._token_times and self._token_times[0][0] < cutoff:
+            self._token_times.popleft()
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            self._trim_windows(now)
+            # Rates cover the last minute, or the whole run while it is shorter than that
+            window = min(RATE_WINDOW_SECONDS, max(now - self.start_time, 1.0))
+            latencies = sorted(self.recent_latencies)
+            calls = sum(self.llm_calls.values())
+            errors = sum(self.llm_errors.values())
+            return {
+                "elapsed_seconds": now - self.start_time,
+                "started": self.started,
+                "completed": self.completed,
+                "in_flight": self.started - self.completed,
+                "conversations_per_minute": len(self._completion_times) * 60.0 / window,
+                "outcomes": dict(self.outcomes),
+                "error_rate": self.outcomes.get("error", 0) / self.completed if self.completed else 0.0,
+                "llm_calls": calls,
+                "llm_errors": errors,
+                "llm_latency_p50": _percentile(latencies, 0.50),
+                "llm_latency_p90": _percentile(latencies, 0.90),
+                "llm_latency_p99": _percentile(latencies, 0.99),
+                "completion_tokens": self.completion_tokens,
+                "tokens_per_second": sum(tokens for _, tokens in self._token_times) / window,
+                "seconds_since_llm_response": now - self.last_llm_response if self.last_llm_response else None,
+            }
+
+    def render_prometheus(self) -> str:
+        """The metrics in Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        with self._lock:
+            llm_calls = dict(self.llm_calls)
+            llm_errors = dict(self.llm_errors)
+            bucket_counts = list(self.latency_bucket_counts)
+            latency_sum = self.latency_sum
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        metric("salessim_conversations_started_total", "counter", "Conversations started.", [({}, snapshot["started"])])
+        metric("salessim_conversations_completed_total", "counter", "Conversations finished, by outcome.",
+               [({"outcome": outcome}, count) for outcome, count in sorted(snapshot["outcomes"].items())])
+        metric("salessim_conversations_in_flight", "gauge", "Conversations started and not yet finished.",
+               [({}, snapshot["in_flight"])])
+        metric("salessim_conversations_per_minute", "gauge", "Conversations finished per minute over the last minute.",
+               [({}, round(snapshot["conversations_per_minute"], 3))])
+        metric("salessim_llm_calls_total", "counter", "LLM calls, by model.",
+               [({"model": model}, count) for model, count in sorted(llm_calls.items())])
+        metric("salessim_llm_errors_total", "counter", "Failed LLM calls, by model.",
+               [({"model": model}, count) for model, count in sorted(llm_errors.items())])
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), bucket_counts):
+            cumulative += count
+            buckets.append(({"le": "+Inf" if bound == float("inf") else bound}, cumulative))
+        metric("salessim_llm_latency_seconds", "histogram", "Latency of successful LLM calls.", [])
+        lines.extend(f'salessim_llm_latency_seconds_bucket{{le="{labels["le"]}"}} {count}' for labels, count in buckets)
+        lines.append(f"salessim_llm_latency_seconds_sum {latency_sum}")
+        lines.append(f"salessim_llm_latency_seconds_count {cumulative}")
+        metric("salessim_completion_tokens_total", "counter", "Completion tokens generated.",
+               [({}, snapshot["completion_tokens"])])
+        metric("salessim_completion_tokens_per_second", "gauge", "Completion tokens per second over the last minute.",
+               [({}, round(snapshot["tokens_per_second"], 3))])
+        if snapshot["seconds_since_llm_response"] is not None:
+            metric("salessim_seconds_since_llm_response", "gauge", "Time since the last successful LLM call.",
+                   [({}, round(snapshot["seconds_since_llm_response"], 3))])
+        return "\n".join(lines) + "\n"
+
+
+run_metrics = RunMetrics()
+
+
+def format_panel(snapshot: Dict, total: Optional[int] = None) -> str:
+    """A compact multi-line progress panel for the console."""
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "-"
+
+    progress = f"{snapshot['completed']}/{total}" if total else f"{snapshot['completed']}"
+    outcomes = ", ".join(f"{outcome} {count}" for outcome, count in sorted(snapshot["outcomes"].items())) or "-"
+    stalled = snapshot["seconds_since_llm_response"]
+    return "\n".join([
+        f"[{snapshot['elapsed_seconds'] / 60:.1f} min] conversations {progress} done, {snapshot['in_flight']} in flight, "
+        f"{snapshot['conversations_per_minute']:.1f}/min, error rate {snapshot['error_rate']:.1%}",
+        f"  outcomes: {outcomes}",
+        f"  LLM: {snapshot['llm_calls']} calls ({snapshot['llm_errors']} failed), latency p50 {seconds(snapshot['llm_latency_p50'])} "
+        f"p90 {seconds(snapshot['llm_latency_p90'])} p99 {seconds(snapshot['llm_latency_p99'])}, "
+        f"{snapshot['tokens_per_second']:.1f} tokens/s, last response {seconds(stalled)} ago",
+    ])
+
+
+class MetricsServer:
+    """Serves GET /metrics from a RunMetrics on a background thread."""
+
+    def __init__(self, metrics: RunMetrics, port: int, host: str = "127.0.0.1"):
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics_ref.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ConsolePanel:
+    """Prints format_panel every interval seconds on a background thread."""
+
+    def __init__(self, metrics: RunMetrics, interval: float, total: Optional[int] = None):
+        self.metrics = metrics
+        self.interval = interval
+        self.total = total
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            print("\n" + format_panel(self.metrics.snapshot(), self.total), flush=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Lightweight span tracing for simulation runs.
+
+Spans are recorded as Chrome trace-event "complete" events. Every process
+appends its spans to {trace_dir}/spans.{process}.{pid}.jsonl, and merge_traces
+combines them into one trace.json that loads in chrome://tracing or
+https://ui.perfetto.dev. Trace context (trace id and parent span id) crosses
+the HTTP hop to the lookup service in a W3C traceparent header, so service
+spans nest under the tool call that made the request.
+
+Tracing is off, and span() is a no-op, unless enable_tracing() is called or
+SALESSIM_TRACE_DIR is set. Setting the variable also enables tracing in
+child processes such as the lookup service and simulation workers.
+
+Usage:
+    python3 -m common.tracing summary {OUTPUT_SIMULATIONS_DIR}/trace.json
+    python3 -m common.tracing merge {OUTPUT_SIMULATIONS_DIR}/trace_spans {OUTPUT_SIMULATIONS_DIR}/trace.json
+"""
+
+import argparse
+import atexit
+import contextvars
+import functools
+import glob
+import heapq
+import json
+import os
+import re
+import secrets
+import shutil
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+TRACE_DIR_ENV = "SALESSIM_TRACE_DIR"
+TRACE_FILE = "trace.json"
+TRACE_SPANS_DIR = "trace_spans"
+TRACEPARENT_HEADER = "traceparent"
+# Buffered spans are appended to the process's span file once this many accumulate
+FLUSH_EVERY = 5000
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    # Trace-viewer row of the span in this process; None for a parent in another process
+    lane: Optional[int]
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("salessim_current_span", default=None)
+
+
+class Tracer:
+    """Buffers finished spans of one process and appends them to its span file."""
+
+    def __init__(self):
+        self.trace_dir: Optional[str] = None
+        self.process_name = os.path.basename(sys.argv[0]) or "python"
+        self._events: List[dict] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._free_lanes: List[int] = []
+        self._next_lane = 1
+        self._wrote_metadata = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.trace_dir is not None
+
+    def _check_fork(self):
+        # A forked worker inherits the parent's buffer; its spans belong to the parent
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._events = []
+            self._free_lanes = []
+            self._next_lane = 1
+            self._wrote_metadata = False
+
+    def acquire_lane(self) -> int:
+        """Lowest free row, so concurrent conversations never overlap on one row."""
+        with self._lock:
+            self._check_fork()
+            if self._free_lanes:
+                return heapq.heappop(self._free_lanes)
+            lane = self._next_lane
+            self._next_lane += 1
+            return lane
+
+    def release_lane(self, lane: int):
+        with self._lock:
+            heapq.heappush(self._free_lanes, lane)
+
+    def record(self, event: dict):
+        with self._lock:
+            self._check_fork()
+            event["pid"] = self._pid
+            self._events.append(event)
+            full = len(self._events) >= FLUSH_EVERY
+        if full:
+            self.flush()
+
+    def span_file(self) -> str:
+        return os.path.join(self.trace_dir, f"spans.{self.process_name}.{os.getpid()}.jsonl")
+
+    def flush(self):
+        """Append buffered spans to this process's span file."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._check_fork()
+            events, self._events = self._events, []
+            if not events:
+                return
+            if not self._wrote_metadata:
+                events.insert(0, {"name": "process_name", "ph": "M", "pid": self._pid,
+                                  "args": {"name": f"{self.process_name} ({self._pid})"}})
+                self._wrote_metadata = True
+            os.makedirs(self.trace_dir, exist_ok=True)
+            with open(self.span_file(), "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event) + "\n")
+
+
+_tracer = Tracer()
+atexit.register(_tracer.flush)
+
+
+def enable_tracing(trace_dir: str, process_name: Optional[str] = None, propagate: bool = True, clear: bool = False):
+    """
+    Record spans of this process into trace_dir; with propagate, child processes inherit
+    the setting. clear removes span files left in trace_dir by earlier runs, which would
+    otherwise be merged into this run's trace.
+    """
+    _tracer.trace_dir = os.path.abspath(trace_dir)
+    if process_name:
+        _tracer.process_name = process_name
+    if clear:
+        shutil.rmtree(_tracer.trace_dir, ignore_errors=True)
+    os.makedirs(_tracer.trace_dir, exist_ok=True)
+    if propagate:
+        os.environ[TRACE_DIR_ENV] = _tracer.trace_dir
+
+
+def configure_from_env(process_name: Optional[str] = None):
+    """Enable tracing if a parent process set SALESSIM_TRACE_DIR."""
+    trace_dir = os.environ.get(TRACE_DIR_ENV)
+    if trace_dir:
+        enable_tracing(trace_dir, process_name, propagate=False)
+
+
+configure_from_env()
+
+
+def tracing_enabled() -> bool:
+    return _tracer.enabled
+
+
+def flush_spans():
+    _tracer.flush()
+
+
+@contextmanager
+def span(name: str, category: str = "sim", **args):
+    """Time the enclosed block as a child of the current span, or as the root of a new trace."""
+    if not _tracer.enabled:
+        yield
+        return
+    parent = _current_span.get()
+    trace_id = parent.trace_id if parent else secrets.token_hex(16)
+    owns_lane = parent is None or parent.lane is None
+    lane = _tracer.acquire_lane() if owns_lane else parent.lane
+    context = SpanContext(trace_id, secrets.token_hex(8), lane)
+    token = _current_span.set(context)
+    start = time.time_ns()
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        end = time.time_ns()
+        _current_span.reset(token)
+        if owns_lane:
+            _tracer.release_lane(lane)
+        _tracer.record({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start // 1000,
+            "dur": max((end - start) // 1000, 1),
+            "tid": lane,
+            "args": {
+                **args,
+                "trace_id": trace_id,
+                "span_id": context.span_id,
+                "parent_id": parent.span_id if parent else None,
+            },
+        })
+
+
+def traced(name: str, category: str = "sim"):
+    """Decorator form of span() for coroutine functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name, category):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_headers() -> Dict[str, str]:
+    """Headers carrying the current span to another process; empty when not tracing."""
+    context = _current_span.get()
+    if not _tracer.enabled or context is None:
+        return {}
+    return {TRACEPARENT_HEADER: f"00-{context.trace_id}-{context.span_id}-01"}
+
+
+@contextmanager
+def remote_span(name: str, headers, category: str = "service", **args):
+    """A span whose parent is the span named by an incoming traceparent header, if any."""
+    match = _TRACEPARENT.match(headers.get(TRACEPARENT_HEADER, "")) if _tracer.enabled else None
+    token = _current_span.set(SpanContext(match.group(1), match.group(2), None)) if match else None
+    try:
+        with span(name, category, **args):
+            yield
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+
+
+def merge_traces(spans_dir: str, output_path: str) -> int:
+    """Combine every process's span file into one Chrome trace-event JSON file."""
+    events = []
+    for span_file in sorted(glob.glob(os.path.join(spans_dir, "spans.*.jsonl"))):
+        with open(span_file, "r", encoding="utf-8") as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+    events.sort(key=lambda e: (e.get("ph") != "M", e.get("ts", 0)))
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return sum(1 for e in events if e.get("ph") == "X")
+
+
+def load_spans(path: str) -> List[dict]:
+    """Spans from a merged trace.json or a directory of span files, with start/end in microseconds."""
+    if os.path.isdir(path):
+        events = []
+        for span_file in sorted(glob.glob(os.path.join(path, "spans.*.jsonl"))):
+            with open(span_file, "r", encoding="utf-8") as f:
+                events.extend(json.loads(line) for line in f if line.strip())
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            events = json.load(f)["traceEvents"]
+    return [
+        {
+            "name": e["name"],
+            "id": e["args"]["span_id"],
+            "parent_id": e["args"].get("parent_id"),
+            "start": e["ts"],
+            "end": e["ts"] + e["dur"],
+        }
+        for e in events if e.get("ph") == "X"
+    ]
+
+
+def _critical_path(span_record: dict, children: Dict[str, List[dict]], totals: Dict[str, float]):
+    """
+    Attribute a span's wall time along its critical path: walking back from its
+    end, the latest-ending child that finished before the cursor is on the path,
+    and gaps between path children are the span's own time.
+    """
+    cursor = span_record["end"]
+    for child in sorted(children.get(span_record["id"], []), key=lambda c: c["end"], reverse=True):
+        if min(child["end"], span_record["end"]) > cursor:
+            continue  # overlaps a later child already on the path
+        totals[span_record["name"]] += cursor - min(child["end"], cursor)
+        _critical_path(child, children, totals)
+        cursor = max(child["start"], span_record["start"])
+    totals[span_record["name"]] += max(cursor - span_record["start"], 0)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarize_trace(path: str) -> Dict:
+    """Per-span-name durations and each name's share of the critical path of all traces."""
+    spans = load_spans(path)
+    ids = {s["id"] for s in spans}
+    children = defaultdict(list)
+    roots = []
+    for s in spans:
+        if s["parent_id"] in ids:
+            children[s["parent_id"]].append(s)
+        else:
+            roots.append(s)
+
+    critical = defaultdict(float)
+    for root in roots:
+        _critical_path(root, children, critical)
+    critical_total = sum(critical.values())
+
+    durations = defaultdict(list)
+    for s in spans:
+        durations[s["name"]].append(s["end"] - s["start"])
+    names = sorted(durations, key=lambda n: critical.get(n, 0.0), reverse=True)
+    return {
+        "traces": len(roots),
+        "spans": len(spans),
+        "critical_path_seconds": critical_total / 1e6,
+        "names": {
+            name: {
+                "count": len(durations[name]),
+                "total_seconds": sum(durations[name]) / 1e6,
+                "mean_seconds": sum(durations[name]) / len(durations[name]) / 1e6,
+                "p95_seconds": _percentile(durations[name], 0.95) / 1e6,
+                "critical_seconds": critical.get(name, 0.0) / 1e6,
+                "critical_share": critical.get(name, 0.0) / critical_total if critical_total else 0.0,
+            }
+            for name in names
+        },
+    }
+
+
+def print_trace_summary(summary: Dict):
+    print(f"{summary['traces']} traces, {summary['spans']} spans, "
+          f"{summary['critical_path_seconds']:.1f}s on the critical path")
+    print(f"\n{'span':<40}{'count':>8}{'mean':>9}{'p95':>9}{'critical':>11}{'share':>8}")
+    print("-" * 85)
+    for name, stats in summary["names"].items():
+        print(f"{name:<40}{stats['count']:>8}{stats['mean_seconds']:>8.3f}s{stats['p95_seconds']:>8.3f}s"
+              f"{stats['critical_seconds']:>10.1f}s{stats['critical_share']:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Span trace utilities')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    summary_parser = subparsers.add_parser('summary', help='Print a critical-path breakdown of a trace')
+    summary_parser.add_argument('trace_path', help='Merged trace.json or a directory of span files')
+
+    merge_parser = subparsers.add_parser('merge', help='Merge per-process span files into one trace.json')
+    merge_parser.add_argument('spans_dir', help='Directory of spans.*.jsonl files')
+    merge_parser.add_argument('output_path', help='Output trace-event JSON file')
+
+    args = parser.parse_args()
+    if args.command == 'summary':
+        print_trace_summary(summarize_trace(args.trace_path))
+    elif args.command == 'merge':
+        count = merge_traces(args.spans_dir, args.output_path)
+        print(f"Merged {count} spans into {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
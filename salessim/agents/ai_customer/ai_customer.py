@@ -1,14 +1,16 @@
 
 import json
-from typing import List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Tuple
 import random
-import asyncio
 
 from langchain import PromptTemplate
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from salessim.agents.ai_customer.utils import BigFivePersonalityDim, get_big5_prompt
+from common.tracing import traced
 
 base_template = """You are shopping online for a laptop at a store, and are speaking to a salesperson to learn more about the store's offerings to make an informed decision.
 
@@ -52,16 +54,135 @@ generate_prompt = PromptTemplate(
     template=generate_template,
 )
 
+PERSONA_KEYS = ["persona_background", "name", "age", "background", "speaking_style", "knowledge_level"]
+# Stands in for the emotion, which is drawn per rollout, in prompts compiled per scenario
+EMOTION_PLACEHOLDER = "\x00emotion\x00"
+
+def personas_file_for_product(product):
+    return f"salessim/agents/ai_customer/{product}_personas.jsonl"
+
 def load_personas(product):
-    preferences_file = f"salessim/agents/ai_customer/laptop_personas.jsonl"
+    preferences_file = personas_file_for_product(product)
     data = []
     with open(preferences_file, 'r') as f:
         for i, line in enumerate(f):
             data.append(json.loads(line))
     return data
+
+def split_persona_and_preferences(preferences_dict):
+    """Split a persona record into its persona description fields and its preference list."""
+    current_persona = {
+        "name": preferences_dict.get("name", "Unknown"),
+        "age": preferences_dict.get("age", "Unknown"),
+        "background": preferences_dict.get("background", ""),
+        "knowledge_level": preferences_dict.get("knowledge_level", ""),
+    }
+    if preferences_dict.get("speaking_style"):
+        current_persona["speaking_style"] = preferences_dict.get("speaking_style")
+    # Build preference list excluding persona metadata
+    preference_list = []
+    for q, a in preferences_dict.items():
+        if q not in PERSONA_KEYS:
+            preference_list.append(f"{q}: {a}")
+    return current_persona, '\n'.join(preference_list)
+
+def render_persona_description(persona):
+    persona_description = f"""
+        Name: {persona['name']} (Age: {persona['age']})
+        Background: {persona['background']}
+        """.strip()
+    if persona.get('speaking_style'):
+        persona_description += f"\nSpeaking Style: '{persona['speaking_style']}'"
+    return persona_description
+
+def render_big5_prompt(big_5_traits):
+    """Generate Big5 personality prompt if traits are available."""
+    if not big_5_traits:
+        return ""
+
+    # Create BigFivePersonalityDim from big_5_traits dict
+    personality = BigFivePersonalityDim(
+        extroversion=big_5_traits.get('extroversion', 'Medium'),
+        neuroticism=big_5_traits.get('neuroticism', 'Medium'),
+        conscientiousness=big_5_traits.get('conscientiousness', 'Medium'),
+        agreeableness=big_5_traits.get('agreeableness', 'Medium'),
+        openness=big_5_traits.get('openness', 'Medium')
+    )
+    return get_big5_prompt(personality)
+
+@dataclass(frozen=True)
+class ScenarioPrompts:
+    """Prompt text fixed for a scenario, rendered once and shared by every turn and rollout.
+
+    The emotion is left as EMOTION_PLACEHOLDER; use with_emotion once per rollout.
+    """
+    preferences: str
+    big5_prompt: str
+    persona_description: str
+    generate_prefix: str
+    mistral_system: str
+
+    def with_emotion(self, emotion: str) -> Tuple[str, str]:
+        """Return the (generate_prefix, mistral_system) prompts for one rollout's emotion."""
+        return (
+            self.generate_prefix.replace(EMOTION_PLACEHOLDER, emotion),
+            self.mistral_system.replace(EMOTION_PLACEHOLDER, emotion),
+        )
+
+def compile_scenario_prompts(preferences_dict, big_5_traits=None):
+    current_persona, preferences = split_persona_and_preferences(preferences_dict)
+    fields = dict(
+        preferences=preferences,
+        emotion=EMOTION_PLACEHOLDER,
+        persona=render_persona_description(current_persona),
+        big5_prompt=render_big5_prompt(big_5_traits or {}),
+    )
+    return ScenarioPrompts(
+        preferences=preferences,
+        big5_prompt=fields["big5_prompt"],
+        persona_description=fields["persona"],
+        generate_prefix=base_template.format(**fields),
+        mistral_system=mistral_system_template.format(**fields),
+    )
+
+class PersonaRegistry:
+    """Personas for one product indexed by persona key, loaded lazily from JSONL."""
+
+    def __init__(self, product="laptop"):
+        self.product = product
+        self._personas = None
+        self._prompts: Dict[tuple, ScenarioPrompts] = {}
+
+    @property
+    def personas(self) -> Dict[str, dict]:
+        if self._personas is None:
+            self._personas = {}
+            for persona in load_personas(self.product):
+                # Keep the first record for a key, matching the previous list lookup
+                self._personas.setdefault(persona["persona_background"], persona)
+        return self._personas
+
+    def get(self, persona_key):
+        try:
+            return self.personas[persona_key]
+        except KeyError:
+            raise KeyError(f"Unknown persona '{persona_key}' for product '{self.product}'")
+
+    def scenario_prompts(self, persona_key, big_5_traits=None) -> ScenarioPrompts:
+        """Compiled prompts for a persona and trait combination, built once and reused."""
+        key = (persona_key, tuple(sorted((big_5_traits or {}).items())))
+        if key not in self._prompts:
+            self._prompts[key] = compile_scenario_prompts(self.get(persona_key), big_5_traits)
+        return self._prompts[key]
+
+@lru_cache(maxsize=None)
+def get_persona_registry(product="laptop") -> PersonaRegistry:
+    return PersonaRegistry(product)
     
+SALESPERSON = "\nSalesperson:"
+END_TOKENS = ["[ACCEPT]", "[DONE]"]
+
 def postprocess_result(generated_response: str) -> str:
-    SALESPERSON = "\nSalesperson:"
     if SALESPERSON in generated_response:
         start = generated_response.find(SALESPERSON)
         return generated_response[:start]
@@ -69,72 +190,50 @@ def postprocess_result(generated_response: str) -> str:
 
 class CustomerSimulator(object):
 
-    def __init__(self, preferences_dict, ai_client, model_params, big_5_traits=None):
+    def __init__(self, preferences_dict, ai_client, model_params, big_5_traits=None, scenario_prompts=None):
         self.model_params = model_params
         self.ai_client = ai_client
         self.big_5_traits = big_5_traits or {}
 
-        self.current_persona = {
-            "name": preferences_dict.get("name", "Unknown"),
-            "age": preferences_dict.get("age", "Unknown"),
-            "background": preferences_dict.get("background", ""),
-            "knowledge_level": preferences_dict.get("knowledge_level", ""),
-        }
-        if preferences_dict.get("speaking_style"):
-            self.current_persona["speaking_style"] = preferences_dict.get("speaking_style")
-        # Build preference list excluding persona metadata
-        preference_list = []
-        persona_keys = ["persona_background", "name", "age", "background", "speaking_style", "knowledge_level"]
-        for q, a in preferences_dict.items():
-            if q not in persona_keys:
-                preference_list.append(f"{q}: {a}")
-        self.all_preferences = '\n'.join(preference_list)
+        self.current_persona, self.all_preferences = split_persona_and_preferences(preferences_dict)
+        self.scenario_prompts = scenario_prompts or compile_scenario_prompts(preferences_dict, self.big_5_traits)
 
         self.emotions = [
             "excited", "curious", "anxious", "impatient",
             "overwhelmed", "confident", "uncertain",
             "frustrated", "relaxed", "cautious", "neutral"
         ]
-        self.emotion = random.choice(self.emotions)
+        self.set_emotion(random.choice(self.emotions))
 
-    def get_big5_personality_prompt(self,):
-        """Generate Big5 personality prompt if traits are available."""
-        if not self.big_5_traits:
-            return ""
-
-        # Create BigFivePersonalityDim from big_5_traits dict
-        personality = BigFivePersonalityDim(
-            extroversion=self.big_5_traits.get('extroversion', 'Medium'),
-            neuroticism=self.big_5_traits.get('neuroticism', 'Medium'),
-            conscientiousness=self.big_5_traits.get('conscientiousness', 'Medium'),
-            agreeableness=self.big_5_traits.get('agreeableness', 'Medium'),
-            openness=self.big_5_traits.get('openness', 'Medium')
-        )
+        # Stop at the salesperson's tag; when streaming also stop once the shopper ends the conversation
+        self.stop_sequences = [SALESPERSON] if self.model_params.get('stop_sequences', True) else None
+        self.stream = self.model_params.get('stream', False)
 
-        return get_big5_prompt(personality)
+    def set_emotion(self, emotion: str):
+        """Set the starting emotion, e.g. to continue a forked conversation in the same mood."""
+        self.emotion = emotion
+        self.generate_prefix, self.mistral_system_content = self.scenario_prompts.with_emotion(emotion)
 
+    def get_big5_personality_prompt(self,):
+        """Generate Big5 personality prompt if traits are available."""
+        return self.scenario_prompts.big5_prompt
 
     def get_persona_description(self):
-        persona = self.current_persona
-        persona_description = f"""
-        Name: {persona['name']} (Age: {persona['age']})
-        Background: {persona['background']}
-        """.strip()
-        if persona.get('speaking_style'):
-            persona_description += f"\nSpeaking Style: '{persona['speaking_style']}'"
-        return persona_description
-
+        return self.scenario_prompts.persona_description
 
     async def async_generate_response(self, input_txt: str, curr_preferences: str, chat_history: List[str], model_name: str = "gpt-4-turbo") -> str:
-        big5_prompt = self.get_big5_personality_prompt()
+        precompiled = curr_preferences == self.scenario_prompts.preferences
 
         if "mistral" in model_name.lower():
-            system_content = mistral_system_template.format(
-                preferences=curr_preferences,
-                emotion=self.emotion,
-                persona=self.get_persona_description(),
-                big5_prompt=big5_prompt
-            )
+            if precompiled:
+                system_content = self.mistral_system_content
+            else:
+                system_content = mistral_system_template.format(
+                    preferences=curr_preferences,
+                    emotion=self.emotion,
+                    persona=self.get_persona_description(),
+                    big5_prompt=self.get_big5_personality_prompt()
+                )
 
             messages = [{"role": "system", "content": system_content}]
 
@@ -152,13 +251,17 @@ class CustomerSimulator(object):
         else:
             context = '\n'.join(chat_history)
             full_chat_history=f"{context}\nSalesperson: {input_txt}" if len(chat_history) > 0 else f"Salesperson: {input_txt}"
-            prompt = generate_template.format(
-                preferences=curr_preferences,
-                chat_history=full_chat_history,
-                emotion=self.emotion,
-                persona=self.get_persona_description(),
-                big5_prompt=big5_prompt
-            )
+            if precompiled:
+                # Same text as generate_template, without re-rendering the fixed prefix every turn
+                prompt = f"{self.generate_prefix}\nConversation history:\n{full_chat_history}\nShopper:"
+            else:
+                prompt = generate_template.format(
+                    preferences=curr_preferences,
+                    chat_history=full_chat_history,
+                    emotion=self.emotion,
+                    persona=self.get_persona_description(),
+                    big5_prompt=self.get_big5_personality_prompt()
+                )
             messages = [{"role": "user", "content": prompt}]
 
         return await self.ai_client.async_chat_completion(
@@ -166,10 +269,21 @@ class CustomerSimulator(object):
             model=model_name,
             max_tokens=self.model_params['max_tokens'],
             temperature=self.model_params['temperature'],
+            stop=self.stop_sequences,
+            stream=self.stream,
+            end_tokens=END_TOKENS,
         )
 
-    async def async_generate(self, input_txt='', chat_history=[], retry=1):
+    @traced("customer.generate")
+    async def async_generate(self, input_txt='', chat_history=[]):
+        persona = {
+            "name": self.current_persona['name'],
+            "age": self.current_persona['age'],
+            "background": self.current_persona['background'],
+            "speaking_style": self.current_persona.get('speaking_style', ''),
+        }
         try:
+            # Transient provider errors are retried with backoff inside the AI client
             ai_response = await self.async_generate_response(input_txt, self.all_preferences, chat_history, self.model_params['model_name'])
             generated_result = ai_response['choices'][0].message.content
             reasoning = ai_response['reasoning']
@@ -179,35 +293,13 @@ class CustomerSimulator(object):
                 "speaker": "Shopper",
                 "text": text,
                 "reasoning": reasoning,
+                "generation_stats": ai_response.get('generation_stats', {}),
                 "preferences": self.all_preferences,
                 "emotion": self.emotion,
-                "persona": {
-                    "name": self.current_persona['name'],
-                    "age": self.current_persona['age'],
-                    "background": self.current_persona['background'],
-                    "speaking_style": self.current_persona.get('speaking_style', ''),
-                }
+                "persona": persona,
             }
         except Exception as e:
+            # Re-raise once the client's retries are exhausted, so the conversation
+            # ends as an error instead of looking like the shopper left
             print(f"ERROR! on input Error: {e}")
-            if retry <= 0:
-                text = "[DONE]"
-                return {
-                    "speaker": "Shopper",
-                    "text": text,
-                    "reasoning": '',
-                    "preferences": self.all_preferences,
-                    "emotion": self.emotion,
-                    "persona": {
-                        "name": self.current_persona['name'],
-                        "age": self.current_persona['age'],
-                        "background": self.current_persona['background'],
-                        "speaking_style": self.current_persona.get('speaking_style', ''),
-                    }
-                }
-            else:
-                # wait for 1 min before retrying
-                await asyncio.sleep(60)
-                return await self.async_generate(input_txt=input_txt, chat_history=chat_history, retry=retry-1, model_name=model_name)
-
-
+            raise
@@ -0,0 +1,173 @@
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from litellm import create_pretrained_tokenizer, token_counter
+
+# Separator between retrieved chunks in a tool output
+CHUNK_SEPARATOR = "\n---\n"
+# Approximate per-message overhead of chat templates (role and delimiter tokens)
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_HEADER = "\n\nSummary of the earlier conversation (older turns were omitted to fit the context window):\n"
+
+
+def make_token_counter(model: str, tokenizer: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Count tokens with the target model's tokenizer: the Hugging Face tokenizer
+    named by tokenizer (e.g. "Qwen/Qwen3-8B" for a vLLM deployment), otherwise
+    whatever LiteLLM maps the model name to.
+    """
+    custom_tokenizer = create_pretrained_tokenizer(tokenizer) if tokenizer else None
+    counts: Dict[str, int] = {}
+
+    def count(text: str) -> int:
+        if not text:
+            return 0
+        if text not in counts:
+            counts[text] = token_counter(model=model, text=text, custom_tokenizer=custom_tokenizer)
+        return counts[text]
+
+    return count
+
+
+def message_text(message) -> str:
+    """Text of a chat message (dict or LiteLLM Message) that the model reads, including tool call arguments."""
+    if isinstance(message, dict):
+        content, tool_calls = message.get("content"), message.get("tool_calls")
+    else:
+        content, tool_calls = getattr(message, "content", None), getattr(message, "tool_calls", None)
+    text = content or ""
+    for tool_call in tool_calls or []:
+        function = tool_call["function"] if isinstance(tool_call, dict) else tool_call.function
+        name = function["name"] if isinstance(function, dict) else function.name
+        arguments = function["arguments"] if isinstance(function, dict) else function.arguments
+        text += f"\n{name}({arguments})"
+    return text
+
+
+def _role(message) -> str:
+    return message.get("role") if isinstance(message, dict) else getattr(message, "role", "")
+
+
+def _truncate(text: str, ratio: float) -> str:
+    return text[:max(int(len(text) * ratio), 0)].rstrip() + " ..."
+
+
+class ContextBudget:
+    """
+    Fits the salesbot prompt into a fixed context window.
+
+    The window is shared by the prompt, the tool schemas and max_tokens of
+    completion. When the prompt does not fit, the oldest history is folded
+    into a short summary appended to the system message (keeping the
+    keep_recent most recent messages), then the lowest-ranked chunks of the
+    oldest tool outputs are dropped, then the remaining history is folded,
+    and as a last resort the tool outputs are cut to length.
+    """
+
+    def __init__(self, context_tokens: int, count_tokens: Callable[[str], int], keep_recent: int = 4,
+                 summary_tokens: int = 256):
+        self.context_tokens = context_tokens
+        self.count_tokens = count_tokens
+        self.keep_recent = keep_recent
+        self.summary_tokens = summary_tokens
+
+    def message_tokens(self, message) -> int:
+        return self.count_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+    def prompt_tokens(self, messages: List) -> int:
+        return sum(self.message_tokens(m) for m in messages)
+
+    def budget(self, tools: Optional[List[dict]], max_tokens: int) -> int:
+        """Tokens available to the messages."""
+        tool_tokens = self.count_tokens(json.dumps(tools)) if tools else 0
+        return self.context_tokens - max_tokens - tool_tokens
+
+    def _summarize(self, dropped: List) -> str:
+        """Extractive summary of dropped history, favouring what the shopper asked for."""
+        lines = []
+        for message in dropped:
+            text = " ".join(message_text(message).split())
+            if _role(message) == "user":
+                lines.append(f"- Shopper: {text[:300]}")
+            elif text:
+                lines.append(f"- Salesperson: {text.split('. ')[0][:150]}")
+        summary = "\n".join(lines)
+        tokens = self.count_tokens(summary)
+        if tokens > self.summary_tokens:
+            summary = _truncate(summary, self.summary_tokens / tokens)
+        return summary
+
+    def fit(self, messages: List, history_length: int, tools: Optional[List[dict]], max_tokens: int) -> Tuple[List, Dict]:
+        """
+        Return messages trimmed to the budget and the trimming stats. messages is
+        [system, *history, *current turn]; history_length counts the history
+        messages, which are the only ones that may be folded into the summary.
+        """
+        budget = self.budget(tools, max_tokens)
+        before = self.prompt_tokens(messages)
+        stats = {"budget": budget, "prompt_tokens_before": before, "prompt_tokens": before,
+                 "folded_messages": 0, "dropped_chunks": 0, "truncated_messages": 0, "tokens_dropped": 0}
+        if before <= budget:
+            return messages, stats
+
+        system, history, current = messages[0], list(messages[1:1 + history_length]), list(messages[1 + history_length:])
+        folded: List = []
+
+        def assemble():
+            if not folded:
+                return [system, *history, *current]
+            content = system["content"] + SUMMARY_HEADER + self._summarize(folded)
+            return [{**system, "content": content}, *history, *current]
+
+        def fold(keep: int):
+            # Whole shopper/salesperson pairs, so the roles keep alternating
+            while len(history) > keep and self.prompt_tokens(assemble()) > budget:
+                folded.extend(history[:2])
+                del history[:2]
+
+        fold(self.keep_recent)
+
+        # Drop the last (lowest-ranked) chunks of the oldest tool outputs, keeping one chunk each
+        for i, message in enumerate(current):
+            if _role(message) != "tool":
+                continue
+            chunks = message["content"].split(CHUNK_SEPARATOR)
+            while len(chunks) > 1 and self.prompt_tokens(assemble()) > budget:
+                chunks.pop()
+                stats["dropped_chunks"] += 1
+                current[i] = message = {**message, "content": CHUNK_SEPARATOR.join(chunks)}
+
+        fold(0)
+
+        overflow = self.prompt_tokens(assemble()) - budget
+        if overflow > 0:
+            # Cut every tool output by the same proportion
+            tool_indices = [i for i, m in enumerate(current) if _role(m) == "tool"]
+            tool_tokens = sum(self.message_tokens(current[i]) for i in tool_indices)
+            if tool_tokens:
+                ratio = max(1.0 - overflow / tool_tokens - 0.05, 0.0)
+                for i in tool_indices:
+                    current[i] = {**current[i], "content": _truncate(current[i]["content"], ratio)}
+                    stats["truncated_messages"] += 1
+
+        fitted = assemble()
+        stats["folded_messages"] = len(folded)
+        stats["prompt_tokens"] = self.prompt_tokens(fitted)
+        stats["tokens_dropped"] = before - stats["prompt_tokens"]
+        return fitted, stats
+
+
+def merge_budget_stats(stats_list: List[Dict]) -> Dict:
+    """Combine the stats of every LLM call in a turn; tokens_dropped totals the tokens not sent."""
+    if not stats_list:
+        return {}
+    merged = {
+        "budget": min(s["budget"] for s in stats_list),
+        "prompt_tokens": max(s["prompt_tokens"] for s in stats_list),
+        "prompt_tokens_before": max(s["prompt_tokens_before"] for s in stats_list),
+        "folded_messages": max(s["folded_messages"] for s in stats_list),
+    }
+    for key in ("dropped_chunks", "truncated_messages", "tokens_dropped"):
+        merged[key] = sum(s[key] for s in stats_list)
+    merged["trimmed"] = merged["tokens_dropped"] > 0
+    return merged
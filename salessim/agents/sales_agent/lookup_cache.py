@@ -0,0 +1,132 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.text_matching import normalize_text
+
+# Words that carry no search intent, ignored when comparing queries
+_STOPWORDS = {
+    "a", "an", "and", "any", "are", "be", "can", "do", "does", "for", "have", "i", "i'm", "im", "in", "is", "it",
+    "me", "my", "of", "on", "or", "so", "that", "the", "this", "to", "want", "what", "with", "you", "would",
+    "like", "looking", "need", "something", "some", "there", "also", "just", "really", "about",
+}
+
+
+def query_terms(query: str) -> frozenset:
+    return frozenset(t for t in normalize_text(query).split() if t not in _STOPWORDS)
+
+
+@dataclass
+class CachedLookup:
+    tool: str
+    query: str
+    terms: frozenset
+    task: Optional[asyncio.Task]
+    prefetched: bool
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+    used: bool = False
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self.finished - self.started if self.finished is not None else None
+
+
+class LookupCache:
+    """
+    Per-conversation cache of lookup results, keyed by tool and query.
+
+    Tool calls store their lookups so a repeated query is served from the cache.
+    Speculative prefetches, started from the shopper's utterance while the
+    salesbot LLM is still generating, are served to a later tool call of the
+    same tool when the query terms overlap by at least match_threshold (Jaccard).
+    """
+
+    def __init__(self, match_threshold: float = 0.6, min_prefetch_terms: int = 2):
+        self.match_threshold = match_threshold
+        self.min_prefetch_terms = min_prefetch_terms
+        self.entries: List[CachedLookup] = []
+        self.stats = {"prefetched": 0, "hits": 0, "prefetch_hits": 0, "misses": 0, "latency_saved": 0.0}
+
+    def _start(self, tool: str, query: str, lookup: Callable[[], Awaitable], prefetched: bool) -> CachedLookup:
+        entry = CachedLookup(tool, query, query_terms(query), None, prefetched)
+
+        async def run():
+            try:
+                return await lookup()
+            finally:
+                entry.finished = time.perf_counter()
+
+        entry.task = asyncio.ensure_future(run())
+        self.entries.append(entry)
+        return entry
+
+    def prefetch(self, tool: str, query: str, lookup: Callable[[], Awaitable]):
+        """Start a speculative lookup unless the query is too short to be a search."""
+        if len(query_terms(query)) < self.min_prefetch_terms:
+            return
+        self._start(tool, query, lookup, prefetched=True)
+        self.stats["prefetched"] += 1
+
+    def find(self, tool: str, query: str) -> Optional[CachedLookup]:
+        key = normalize_text(query)
+        terms = query_terms(query)
+        best, best_score = None, 0.0
+        for entry in self.entries:
+            if entry.tool != tool or entry.task.cancelled():
+                continue
+            if normalize_text(entry.query) == key:
+                return entry
+            if entry.prefetched and terms and entry.terms:
+                score = len(terms & entry.terms) / len(terms | entry.terms)
+                if score >= self.match_threshold and score > best_score:
+                    best, best_score = entry, score
+        return best
+
+    async def lookup(self, tool: str, query: str, lookup: Callable[[], Awaitable]):
+        """Serve a tool call from the cache, or run and cache the lookup."""
+        entry = self.find(tool, query)
+        if entry is None:
+            self.stats["misses"] += 1
+            return await self._start(tool, query, lookup, prefetched=False).task
+
+        waited_from = time.perf_counter()
+        result = await entry.task
+        waited = time.perf_counter() - waited_from
+        if not result and entry.prefetched:
+            # An empty speculative result (e.g. a failed request) is not worth serving
+            self.stats["misses"] += 1
+            return await self._start(tool, query, lookup, prefetched=False).task
+        self.stats["hits"] += 1
+        if entry.prefetched and not entry.used:
+            self.stats["prefetch_hits"] += 1
+        entry.used = True
+        # The lookup would have taken its full duration; only the wait was paid
+        self.stats["latency_saved"] += max((entry.duration or 0.0) - waited, 0.0)
+        return result
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats)
+
+    def completed(self) -> List[Tuple[str, str, object]]:
+        """(tool, query, result) of every finished, non-empty lookup, to seed a forked conversation."""
+        return [
+            (entry.tool, entry.query, entry.task.result()) for entry in self.entries
+            if entry.task.done() and not entry.task.cancelled() and entry.task.exception() is None and entry.task.result()
+        ]
+
+    def seed(self, tool: str, query: str, result):
+        """Cache a lookup finished elsewhere; later tool calls with the same query are served from it."""
+        async def finished():
+            return result
+        self._start(tool, query, finished, prefetched=False)
+
+    def cancel_pending(self):
+        for entry in self.entries:
+            if not entry.task.done():
+                entry.task.cancel()
+
+
+def stats_delta(after: Dict, before: Dict) -> Dict:
+    return {key: after[key] - before.get(key, 0) for key in after}
@@ -6,16 +6,20 @@ from typing import List
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from common.ai_client import AIClient
+from common.ai_client import AIClient, merge_generation_stats
+from common.tracing import span, traced
 
 from agents.sales_agent.prompts import (
     system_instruction,
 )
 from services.http_clients import ProductLookupClient, BuyingGuideClient
+from agents.sales_agent.lookup_cache import LookupCache, stats_delta
+from agents.sales_agent.context_budget import ContextBudget, make_token_counter, merge_budget_stats
 from common.bcolors import bcolors
 
+NEXT_SPEAKER = "\nShopper:"
+
 def postprocess_result(generated_response: str) -> str:
-    NEXT_SPEAKER = "\nShopper:"
     if NEXT_SPEAKER in generated_response:
         start = generated_response.find(NEXT_SPEAKER)
         return generated_response[:start]
@@ -31,6 +35,25 @@ class SalesAgent(object):
         self.buying_guide_client = BuyingGuideClient()
         self.product_catalog_client = ProductLookupClient()
         self.sim_threshold = 0.70
+        # Stop at the next speaker tag instead of generating (and paying for) a hallucinated turn
+        self.stop_sequences = [NEXT_SPEAKER] if self.model_params.get('stop_sequences', True) else None
+        self.stream = self.model_params.get('stream', False)
+        # Speculative lookups from the shopper's utterance, cached for the rest of the conversation
+        self.lookup_cache = LookupCache(
+            match_threshold=self.model_params.get('prefetch_match_threshold', 0.6)
+        ) if self.model_params.get('prefetch', False) else None
+        # Budgeted retrieval settings sent with every lookup (None leaves the plain top-k search)
+        self.retrieval_options = {
+            "token_budget": self.model_params.get('retrieval_token_budget'),
+            "mmr_lambda": self.model_params.get('retrieval_mmr_lambda'),
+            "dedup_threshold": self.model_params.get('retrieval_dedup_threshold'),
+        }
+        # Trim history and tool outputs to fit small context windows (e.g. vLLM --max-model-len 8192)
+        self.context_budget = ContextBudget(
+            self.model_params['context_budget'],
+            make_token_counter(self.model_params['model_name'], self.model_params.get('tokenizer')),
+            keep_recent=self.model_params.get('context_keep_recent', 4),
+        ) if self.model_params.get('context_budget') else None
         # Define tool schemas for OpenAI function calling
         self.tools = [
             {
@@ -71,6 +94,8 @@ class SalesAgent(object):
 
     async def cleanup(self):
         """Clean up HTTP client sessions"""
+        if self.lookup_cache is not None:
+            self.lookup_cache.cancel_pending()
         await self.buying_guide_client.close()
         await self.product_catalog_client.close()
 
@@ -92,6 +117,25 @@ class SalesAgent(object):
         messages.append({"role": "user", "content": input_txt})
         return messages
 
+    def _lookup_client(self, function_name: str):
+        return self.buying_guide_client if function_name == "lookup_buying_guide" else self.product_catalog_client
+
+    async def _lookup(self, function_name: str, query: str):
+        """Top documents for a lookup tool, served from the conversation's lookup cache when enabled."""
+        client = self._lookup_client(function_name)
+        if self.lookup_cache is None:
+            return await client.top_docs(query, k=4, **self.retrieval_options)
+        return await self.lookup_cache.lookup(function_name, query,
+                                              lambda: client.top_docs(query, k=4, **self.retrieval_options))
+
+    def _prefetch_lookups(self, shopper_utterance: str):
+        """Start both lookups for the shopper's utterance so they run while the LLM generates."""
+        for function_name in ("lookup_product_items", "lookup_buying_guide"):
+            client = self._lookup_client(function_name)
+            self.lookup_cache.prefetch(function_name, shopper_utterance,
+                                       lambda client=client: client.top_docs(shopper_utterance, k=4, **self.retrieval_options))
+
+    @traced("sales_agent.tool_call")
     async def _execute_tool_call_async(self, function_name: str, function_args: dict, knowledge_used: list, all_product_candidates: list) -> str:
         """Execute tool calls asynchronously using HTTP clients"""
         print(f"{bcolors.OKGREEN}Action: {function_name}{bcolors.ENDC}")
@@ -99,7 +143,7 @@ class SalesAgent(object):
 
         if function_name == "lookup_buying_guide":
             query = function_args["query"]
-            knowledge_candidates = await self.buying_guide_client.top_docs(query, k=4)
+            knowledge_candidates = await self._lookup(function_name, query)
             knowledge = "\n---\n".join([item.page_content for item in knowledge_candidates])
             knowledge_used.append({"action": function_name, "query": query, "knowledge": knowledge})
 
@@ -108,7 +152,7 @@ class SalesAgent(object):
 
         elif function_name == "lookup_product_items":
             query = function_args["query"]
-            product_candidates = await self.product_catalog_client.top_docs(query, k=4)
+            product_candidates = await self._lookup(function_name, query)
             all_product_candidates.extend(product_candidates)
             knowledge = "\n---\n".join([item.page_content for item in product_candidates])
             knowledge_used.append({"action": function_name, "query": query, "knowledge": knowledge})
@@ -118,7 +162,7 @@ class SalesAgent(object):
 
         return ""
 
-    async def _format_final_response(self, result: str, reasoning: str, knowledge_used: list, all_product_candidates: list) -> dict:
+    async def _format_final_response(self, result: str, reasoning: str, knowledge_used: list, all_product_candidates: list, generation_stats: list) -> dict:
         """Format the final response in a standardized way"""
         recommended_items = await self.product_catalog_client.find_recommended_items_in_response(
             all_product_candidates, result, self.sim_threshold
@@ -133,13 +177,22 @@ class SalesAgent(object):
             "reasoning": reasoning,
             "knowledge": all_knowledge,
             "recommended_items": recommended_items,
-            "knowledge_used": knowledge_used
+            "knowledge_used": knowledge_used,
+            "generation_stats": merge_generation_stats(generation_stats)
         }
 
+    @traced("sales_agent.generate")
     async def async_generate(self, input_txt: str, chat_history: List[str]):
         messages = self._build_messages(input_txt, chat_history)
+        history_length = len(messages) - 2
         knowledge_used = []
         all_product_candidates = []
+        generation_stats = []
+        budget_stats = []
+        cache_stats_before = None
+        if self.lookup_cache is not None:
+            cache_stats_before = self.lookup_cache.snapshot()
+            self._prefetch_lookups(input_txt)
 
         # Loop until we get a communicate action
         max_iterations = 3
@@ -148,14 +201,22 @@ class SalesAgent(object):
             if iterations > max_iterations:
                 raise Exception("Max iterations reached, model doesn't want to communicate, just call tools.")
             iterations += 1
-            response = await self.ai_client.async_chat_completion(
-                messages=messages,
-                model=self.model_params['model_name'],
-                max_tokens=self.model_params['max_tokens'],
-                temperature=self.model_params['temperature'],
-                tools=self.tools,
-                tool_choice="auto"
-            )
+            prompt = messages
+            if self.context_budget is not None:
+                prompt, stats = self.context_budget.fit(messages, history_length, self.tools, self.model_params['max_tokens'])
+                budget_stats.append(stats)
+            with span("sales_agent.llm", model=self.model_params['model_name']):
+                response = await self.ai_client.async_chat_completion(
+                    messages=prompt,
+                    model=self.model_params['model_name'],
+                    max_tokens=self.model_params['max_tokens'],
+                    temperature=self.model_params['temperature'],
+                    tools=self.tools,
+                    tool_choice="auto",
+                    stop=self.stop_sequences,
+                    stream=self.stream
+                )
+            generation_stats.append(response.get('generation_stats', {}))
 
             choice = response['choices'][0]
             reasoning = response.get('reasoning', '')
@@ -181,4 +242,9 @@ class SalesAgent(object):
                         })
             else:
                 # No tool calls, treat as direct communication
-                return await self._format_final_response(choice.message.content, reasoning, knowledge_used, all_product_candidates)
+                final_response = await self._format_final_response(choice.message.content, reasoning, knowledge_used, all_product_candidates, generation_stats)
+                if cache_stats_before is not None:
+                    final_response["lookup_cache"] = stats_delta(self.lookup_cache.snapshot(), cache_stats_before)
+                if budget_stats:
+                    final_response["context_budget"] = merge_budget_stats(budget_stats)
+                return final_response
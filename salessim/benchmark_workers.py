@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the multi-process simulation driver.
+
+Runs the scenario grid from 1 to --max-workers processes against a synthetic
+LLM client with a fixed latency, so the measurement isolates the driver's
+CPU-side cost (prompt formatting, result handling, progress reporting) from
+any real backend.
+
+Usage: python3 salessim/benchmark_workers.py --max-workers 4 [--latency 0.05] [--max-turns 5]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from parallel_driver import run_multiprocess_simulations
+from simulation_utils import load_scenarios_from_yaml
+from common.ai_client import AIClient
+
+
+class SyntheticLatencyClient(AIClient):
+    """AIClient that answers every request with canned text after a fixed delay."""
+
+    def __init__(self, latency: float = 0.05, **kwargs):
+        super().__init__()
+        self.latency = latency
+
+    async def async_chat_completion(self, messages, model, max_tokens, temperature, tools=None, tool_choice=None,
+                                    stop=None, stream=False, end_tokens=None, n=1, response_format=None) -> dict:
+        await asyncio.sleep(self.latency)
+        # Touch the prompt like a real client serializing the request would
+        prompt_chars = len(json.dumps(messages, default=str))
+        message = SimpleNamespace(content=f"Thanks, could you tell me more? ({prompt_chars} prompt chars)", tool_calls=None)
+        return {
+            'choices': [SimpleNamespace(message=message, finish_reason='stop') for _ in range(n)],
+            'reasoning': '',
+            'generation_stats': {},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark simulation throughput from 1 to K worker processes')
+    parser.add_argument('--max-workers', type=int, default=4, help='Largest number of worker processes to try')
+    parser.add_argument('--scenarios', default='salessim/scenarios.yaml', help='Scenarios file to expand')
+    parser.add_argument('--latency', type=float, default=0.05, help='Synthetic LLM latency in seconds')
+    parser.add_argument('--max-turns', type=int, default=5, help='Turns per simulated conversation')
+    parser.add_argument('--batch-size', type=int, default=5, help='Scenarios per queued batch')
+    parser.add_argument('--concurrency-per-worker', type=int, default=4, help='Batches in flight per worker')
+    args = parser.parse_args()
+
+    scenarios_config = load_scenarios_from_yaml(args.scenarios)
+    client_config = {"latency": args.latency}
+    model_config = {"model_name": "synthetic", "temperature": 0.0, "max_tokens": 256}
+
+    rows = []
+    for num_workers in range(1, args.max_workers + 1):
+        start = time.perf_counter()
+        results = run_multiprocess_simulations(
+            max_turns=args.max_turns,
+            scenarios_config=scenarios_config,
+            customer_model_config=model_config,
+            salesbot_model_config=model_config,
+            customer_client_config=client_config,
+            salesbot_client_config=client_config,
+            num_workers=num_workers,
+            batch_size=args.batch_size,
+            concurrency_per_worker=args.concurrency_per_worker,
+            client_factory=SyntheticLatencyClient,
+            verbose=False,
+        )
+        elapsed = time.perf_counter() - start
+        rows.append((num_workers, len(results), elapsed, len(results) / elapsed))
+
+    baseline = rows[0][3]
+    print(f"\n{'workers':>8}{'conversations':>15}{'seconds':>10}{'conv/sec':>10}{'speedup':>9}")
+    print("-" * 52)
+    for num_workers, count, elapsed, throughput in rows:
+        print(f"{num_workers:>8}{count:>15}{elapsed:>10.1f}{throughput:>10.2f}{throughput / baseline:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
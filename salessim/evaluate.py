@@ -1,10 +1,12 @@
+import argparse
 import json
 import logging
 import os
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 from common.ai_client import LiteLLMClient
+from common.results_store import iter_results, resolve_results_path
+from salessim.services.text_matching import CatalogMatcher, normalize_text
 import asyncio
-import sys
 client = LiteLLMClient(
     api_key=os.environ.get("OPENAI_API_KEY")
 )
@@ -26,21 +28,78 @@ Otherwise, mark as **FAIL**.
 ## Output Format
 Provide your evaluation in a json with evaluation string and output PASS/FAIL, as well as a reason for the evaluation.
 """
-async def evaluate_ideal_match(conversation: Dict) -> str:
-    eval_responses = []
-    for _ in range(3):
-        chat_completion = await client.async_chat_completion(
-            messages=[
-                {"role": "system", "content": ideal_match_prompt},
-                {"role": "user", "content": f"Conversation transcript: {conversation['conversation']}\nideal_recommendations: {conversation['ideal_recommendations']}"}
-            ],
-            model="gpt-4o",
-            max_tokens=1000,
-            temperature=0.0,
+NUM_VOTES = 3
+DEFAULT_MAX_CONCURRENCY = 16
+
+
+def _item_title(item) -> Optional[str]:
+    # Recommended items are serialized Documents; tolerate plain title strings too
+    if isinstance(item, dict):
+        return item.get("metadata", {}).get("title")
+    if isinstance(item, str):
+        return item
+    return None
+
+
+def recommended_titles(conversation: Dict) -> List[str]:
+    """Normalized titles of every item the salesperson recommended, in order of first mention."""
+    titles = []
+    for turn in conversation["conversation"]:
+        for item in turn.get("recommended_items", []):
+            title = _item_title(item)
+            if title and normalize_text(title) not in titles:
+                titles.append(normalize_text(title))
+    return titles
+
+
+def classify_ideal_match_by_rules(conversation: Dict) -> Optional[Tuple[str, str]]:
+    """
+    Settle clear-cut ideal-match cases from the structured turn data, without an LLM.
+    Returns (label, reason), or None when the transcript needs a judge:
+    - PASS: a recorded recommended item is one of the ideal recommendations.
+    - FAIL: there are ideal recommendations, the salesperson recommended other items,
+      and never mentioned an ideal laptop, by title, alias or fuzzy match (so a missed
+      extraction cannot explain the miss).
+    Conversations with an empty ideal list hinge on whether the disqualification was
+    graceful, which only the judge can tell.
+    """
+    if isinstance(conversation["conversation"], str):
+        return None
+    ideal_titles = {normalize_text(title) for title in conversation["ideal_recommendations"]}
+    recommended = recommended_titles(conversation)
+
+    matched = [title for title in recommended if title in ideal_titles]
+    if matched:
+        return "PASS", f"Rule: recommended ideal item(s) {matched}"
+
+    if ideal_titles and recommended:
+        # The same lexical matching the lookup service uses to detect recommended items
+        ideal = conversation["ideal_recommendations"]
+        matcher = CatalogMatcher(ideal)
+        mentioned = any(
+            matcher.match(turn.get("text", ""), ideal) for turn in conversation["conversation"]
+            if turn.get("speaker", "").lower() == "salesperson"
         )
-        eval_responses.append(chat_completion["choices"][0].message.content)
+        if not mentioned:
+            return "FAIL", f"Rule: recommended {len(recommended)} item(s), none in ideal_recommendations"
+    return None
+
+
+async def evaluate_ideal_match(conversation: Dict) -> str:
+    # All votes are sampled from one request, so the prompt is prefilled once
+    chat_completion = await client.async_chat_completion(
+        messages=[
+            {"role": "system", "content": ideal_match_prompt},
+            {"role": "user", "content": f"Conversation transcript: {conversation['conversation']}\nideal_recommendations: {conversation['ideal_recommendations']}"}
+        ],
+        model="gpt-4o",
+        max_tokens=1000,
+        temperature=0.0,
+        n=NUM_VOTES,
+    )
+    eval_responses = [choice.message.content for choice in chat_completion["choices"]]
     num_pass = sum(1 for response in eval_responses if "PASS" in response)
-    if num_pass >= 2:
+    if num_pass > NUM_VOTES // 2:
         majority_label = "PASS"
     else:
         majority_label = "FAIL"
@@ -50,7 +109,27 @@ async def evaluate_ideal_match(conversation: Dict) -> str:
             break
     return majority_label, conversation["conversation_id"], majority_reason
 
-async def compute_metrics(json_file_path: str) -> Dict[str, float]:
+async def evaluate_with_worker_pool(conversations: List[Dict], max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+    """Judge conversations with at most max_concurrency conversations in flight."""
+    work = asyncio.Queue()
+    for conversation in conversations:
+        work.put_nowait(conversation)
+    results = []
+
+    async def worker():
+        while True:
+            try:
+                conversation = work.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(await evaluate_ideal_match(conversation))
+
+    await asyncio.gather(*[worker() for _ in range(min(max_concurrency, len(conversations)))])
+    return results
+
+
+async def compute_metrics(json_file_path: str, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                          use_rules: bool = True) -> Dict[str, float]:
     """
     Compute two key metrics from sales simulation results:
     1. Ideal Match Rate - % of conversations where the sales agent recommends
@@ -58,44 +137,54 @@ async def compute_metrics(json_file_path: str) -> Dict[str, float]:
        the conversation (disqualifies the lead if no laptop satisfies dealbreakers)
     2. Sell Rate - % of conversations where the customer accepts (outcome = "accepted")
 
+    Clear-cut ideal matches are decided by classify_ideal_match_by_rules; the rest
+    are judged by majority vote with at most max_concurrency conversations in flight.
+
     Args:
-        json_file_path: Path to the JSON file containing simulation results
+        json_file_path: Path to the simulation results (results store, output directory or legacy JSON file)
+        max_concurrency: Maximum number of conversations judged at once
+        use_rules: Whether to decide clear-cut cases without an LLM call
 
     Returns:
         Dictionary containing the computed metrics
     """
     try:
-        with open(json_file_path, 'r') as file:
-            data = json.load(file)
+        # Stream records, keeping only what the metrics need beyond the LLM evaluations
+        total_conversations = 0
+        outcome_by_id = {}
+        rule_results = []
+        to_judge = []
+        for conversation in iter_results(json_file_path):
+            total_conversations += 1
+            outcome_by_id[conversation["conversation_id"]] = conversation.get("outcome")
+            if "ideal_recommendations" in conversation and "conversation" in conversation:
+                decision = classify_ideal_match_by_rules(conversation) if use_rules else None
+                if decision is not None:
+                    label, reason = decision
+                    rule_results.append((label, conversation["conversation_id"], reason))
+                else:
+                    to_judge.append(conversation)
 
-        total_conversations = len(data)
         if total_conversations == 0:
             logging.warning(f"No conversations found in {json_file_path}")
             return {"ideal_match_rate": 0.0, "sell_rate": 0.0}
 
-        ideal_matches, accepted_outcomes = 0, 0
-
-        eval_tasks = [
-            evaluate_ideal_match(conversation)
-            for conversation in data
-            if "ideal_recommendations" in conversation and "conversation" in conversation
-        ]
-        eval_results = await asyncio.gather(*eval_tasks)
+        eval_results = rule_results + await evaluate_with_worker_pool(to_judge, max_concurrency)
+        num_evaluated = len(eval_results)
+        rule_decided_fraction = len(rule_results) / num_evaluated if num_evaluated else 0.0
 
         eval_by_id = {cid: (eval_str, reason) for eval_str, cid, reason in eval_results}
         ideal_matches = []
         failed_ideal_matches = []
         accepted_outcomes = []
-        conversation_by_id = {c["conversation_id"]: c for c in data}
         for conversation_id, (evaluation, _) in eval_by_id.items():
-            conversation = conversation_by_id.get(conversation_id)
             # Metric 1: Ideal Match Rate
             if evaluation == "PASS":
                 ideal_matches.append(conversation_id)
             else:
                 failed_ideal_matches.append(conversation_id)
             # Metric 2: Sell Rate
-            if conversation.get("outcome") == "accepted":
+            if outcome_by_id.get(conversation_id) == "accepted":
                 accepted_outcomes.append(conversation_id)
 
         ideal_match_rate = (len(ideal_matches) / total_conversations) * 100
@@ -104,6 +193,7 @@ async def compute_metrics(json_file_path: str) -> Dict[str, float]:
         logging.info(f"Processed {total_conversations} conversations from {json_file_path}")
         logging.info(f"Ideal Match Rate: {ideal_match_rate:.2f}%")
         logging.info(f"Sell Rate: {sell_rate:.2f}%")
+        logging.info(f"Decided by rules: {len(rule_results)}/{num_evaluated} ({rule_decided_fraction:.1%}), judged by LLM: {len(to_judge)}")
 
         return {
             "ideal_match_rate": ideal_match_rate,
@@ -112,6 +202,9 @@ async def compute_metrics(json_file_path: str) -> Dict[str, float]:
             "ideal_matches": ideal_matches,
             "failed_ideal_matches": failed_ideal_matches,
             "accepted_outcomes": accepted_outcomes, 
+            "rule_decided": len(rule_results),
+            "llm_judged": len(to_judge),
+            "rule_decided_fraction": rule_decided_fraction,
             "eval_breakdown": eval_by_id
         }
 
@@ -129,17 +222,23 @@ async def compute_metrics(json_file_path: str) -> Dict[str, float]:
 async def main():
     logging.basicConfig(level=logging.INFO)
 
-    if len(sys.argv) != 2:
-        print("Usage: python compute_metrics.py <json_file_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Compute ideal match and sell rates for simulation results')
+    parser.add_argument('simulations_dir', help='Simulation output directory, results store or results JSON file')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f'Conversations judged by the LLM at once (default: {DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--no-rules', action='store_true',
+                        help='Send every conversation to the LLM judge instead of deciding clear cases by rules')
+    args = parser.parse_args()
 
-    file_path = f"{sys.argv[1]}/results.json"
-    metrics = await compute_metrics(file_path)
+    file_path = resolve_results_path(args.simulations_dir)
+    metrics = await compute_metrics(file_path, max_concurrency=args.max_concurrency, use_rules=not args.no_rules)
     print(f"\nMetrics for {file_path}:")
     print(f"Ideal Match Rate: {metrics['ideal_match_rate']:.2f}%")
     print(f"Sell Rate: {metrics['sell_rate']:.2f}%")
     print(f"Total Conversations: {metrics['total_conversations']}") 
-    output_filename = os.path.basename(file_path) + ".metrics.json"
+    if "rule_decided_fraction" in metrics:
+        print(f"Decided by rules: {metrics['rule_decided']} ({metrics['rule_decided_fraction']:.1%}), judged by LLM: {metrics['llm_judged']}")
+    output_filename = os.path.basename(os.path.normpath(file_path)) + ".metrics.json"
     with open(output_filename, "w") as f:
         json.dump(metrics, f, indent=2)
     print(f"Metrics saved to {output_filename}")
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Deterministic ideal recommendations for each persona.
+
+Persona preferences and dealbreakers from {product}_personas.jsonl are parsed
+into structured constraints and evaluated against an attribute index of the
+product catalogs in data/products/:
+
+- hard constraints (budget, OS, screen size and every dealbreaker) must hold.
+  A stated budget allows up to 10% over, as the simulated shopper does, unless a
+  dealbreaker caps the price.
+- soft constraints (weight, preferred brand or color, gaming, ...) narrow the
+  set only when at least one product satisfies them.
+- objectives ("as much RAM as possible", "the bigger the better") then keep
+  the products with the best value, one objective after another.
+
+The result is cached in data/ideal_recommendations/{product}.json together
+with a fingerprint of the personas and catalogs, and is rebuilt only when one
+of them changes.
+
+Usage: python3 salessim/ideal_recommendations.py [--product laptop] [--rebuild]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from salessim.agents.ai_customer.ai_customer import PERSONA_KEYS, load_personas, personas_file_for_product
+
+ENGINE_VERSION = 1
+CATALOG_DIR = "data/products/"
+CACHE_DIR = "data/ideal_recommendations/"
+BUDGET_TOLERANCE = 1.10
+# Products at or under this weight count as lightweight
+LIGHTWEIGHT_LBS = 3.0
+
+_MONEY = r"\$\s?([\d,]+(?:\.\d+)?)"
+_SIZE = r"(\d+(?:\.\d+)?)\s*(gb|tb)"
+
+
+@dataclass
+class Constraint:
+    attribute: str
+    op: str  # one of <=, >=, <, >, ==
+    value: object
+    hard: bool
+    source: str
+
+    def holds(self, product: dict) -> bool:
+        actual = product.get(self.attribute)
+        if actual is None:
+            # Unknown attributes (e.g. a missing weight) cannot satisfy a constraint
+            return False
+        if self.op == "<=":
+            return actual <= self.value
+        if self.op == ">=":
+            return actual >= self.value
+        if self.op == "<":
+            return actual < self.value
+        if self.op == ">":
+            return actual > self.value
+        return actual == self.value
+
+
+@dataclass
+class Objective:
+    attribute: str
+    direction: str  # "max" or "min"
+    source: str
+
+
+def _money(text: str) -> Optional[float]:
+    match = re.search(_MONEY, text)
+    return float(match.group(1).replace(",", "")) if match else None
+
+
+def _gigabytes(amount: str, unit: str) -> float:
+    return float(amount) * (1024 if unit.lower() == "tb" else 1)
+
+
+def _cpu_tier(text: str) -> int:
+    text = text.lower()
+    if "ryzen 9" in text or "core i9" in text:
+        return 4
+    if "ryzen 7" in text or "core i7" in text or "m1" in text:
+        return 3
+    if "ryzen 5" in text or "core i5" in text:
+        return 2
+    return 1
+
+
+def index_product(product: dict) -> dict:
+    """Structured attributes of one catalog product, parsed from its name and feature list."""
+    name = product["name"].strip()
+    features = " | ".join(product.get("features", [])).lower()
+    text = f"{name.lower()} | {features}"
+
+    ram = re.search(r"(\d+)\s*gb memory", text)
+    storage = re.search(_SIZE + r"\s*(solid state drive|ssd|hard drive|emmc)", text)
+    screen = re.search(r"(\d+(?:\.\d+)?)\s*(?:inch|\")", text)
+    battery = re.findall(r"(\d+)\s*hour battery", features)
+    weight = re.search(r"(\d+(?:\.\d+)?)\s*lbs", product.get("weight") or "")
+    brand = name.split(" - ")[0].strip().lower()
+    finish = re.search(r"\|\s*([^|]*?)\s*finish", features) or re.search(r"\|\s*([^|]*?) with [^|]*", features)
+
+    return {
+        "title": name,
+        "brand": brand,
+        "price": float(product["price"].replace("$", "").replace(",", "")),
+        "weight": float(weight.group(1)) if weight else None,
+        "ram_gb": float(ram.group(1)) if ram else None,
+        "storage_gb": _gigabytes(storage.group(1), storage.group(2)) if storage else None,
+        "storage_type": storage.group(3) if storage else None,
+        "screen_in": float(screen.group(1)) if screen else None,
+        "touch": "touch" in text,
+        "os": "macos" if brand == "apple" else "windows",
+        "cpu_tier": _cpu_tier(text),
+        "dedicated_gpu": "graphics card" in features or "geforce" in text or "radeon" in text,
+        "battery_hours": float(max(int(b) for b in battery)) if battery else None,
+        "color": finish.group(1).strip() if finish else None,
+    }
+
+
+def load_catalog_index(product: str, catalog_dir: str = CATALOG_DIR) -> List[dict]:
+    index = []
+    for filename in sorted(os.listdir(catalog_dir)):
+        with open(os.path.join(catalog_dir, filename), "r") as f:
+            data = json.load(f)
+        for item in data.get(product, []):
+            index.append(index_product(item))
+    return index
+
+
+def _is_dealbreaker(question: str) -> bool:
+    return "dealbreaker" in question.lower()
+
+
+def parse_persona_constraints(persona: dict):
+    """Return (constraints, objectives, unparsed answers) for one persona record."""
+    constraints: List[Constraint] = []
+    objectives: List[Objective] = []
+    unparsed: List[str] = []
+    budget = None
+    price_cap = None
+
+    for question, answer in persona.items():
+        if question in PERSONA_KEYS or not isinstance(answer, str):
+            continue
+        q = question.lower()
+        a = answer.lower()
+        source = f"{question} {answer}"
+        hard = _is_dealbreaker(question)
+        found = len(constraints) + len(objectives)
+
+        # Budget: the stated amount with tolerance, or a dealbreaker cap without it
+        if "budget" in q:
+            budget = _money(a)
+        over = re.search(r"(?:go over|over|above|more than|exceed)\s*" + _MONEY, a)
+        if over and ("budget" in a or hard or "cannot" in a or "can't" in a):
+            price_cap = float(over.group(1).replace(",", ""))
+
+        # Operating system; "undecided" leaves it open
+        if "undecided" not in a:
+            if re.search(r"mac\s?os", a):
+                constraints.append(Constraint("os", "==", "macos", True, source))
+            elif "windows" in a:
+                constraints.append(Constraint("os", "==", "windows", True, source))
+        brand = re.search(r"likes (\w+)", a)
+        if brand and brand.group(1) not in ("the",):
+            constraints.append(Constraint("brand", "==", brand.group(1), False, source))
+
+        # Screen size
+        if "screen" in q:
+            between = re.search(r"(\d+(?:\.\d+)?)\s*-\s*(\d+(?:\.\d+)?)\s*inch", a)
+            at_least = re.search(r"(?:at least|not smaller th[ae]n)\s*(\d+(?:\.\d+)?)", a) or re.search(r"(\d+(?:\.\d+)?)\s*inch(?:es)? or larger", a)
+            larger = re.search(r"(?:larger|bigger) than\s*(\d+(?:\.\d+)?)", a)
+            if between:
+                constraints.append(Constraint("screen_in", ">=", float(between.group(1)), True, source))
+                constraints.append(Constraint("screen_in", "<=", float(between.group(2)), True, source))
+            elif at_least:
+                constraints.append(Constraint("screen_in", ">=", float(at_least.group(1)), True, source))
+            elif larger:
+                constraints.append(Constraint("screen_in", ">", float(larger.group(1)), True, source))
+            elif "bigger the better" in a:
+                objectives.append(Objective("screen_in", "max", source))
+
+        # Memory and storage minimums, and "as much as possible"
+        ram = re.search(r"(?:memory|ram)[^.]*?(?:equal to or more than|at least|minimum of)\s*" + _SIZE, a)
+        if ram:
+            constraints.append(Constraint("ram_gb", ">=", _gigabytes(ram.group(1), ram.group(2)), True, source))
+        storage = re.search(r"at least\s*" + _SIZE + r"\s*(?:of )?storage", a)
+        if storage:
+            constraints.append(Constraint("storage_gb", ">=", _gigabytes(storage.group(1), storage.group(2)), True, source))
+        as_much = re.search(r"as much ([\w\s]+?) as possible", a)
+        if as_much:
+            wanted = as_much.group(1)
+            if "ram" in wanted or ("memory" in wanted and "storage" not in wanted and "ram" not in wanted):
+                objectives.append(Objective("ram_gb", "max", source))
+            # "RAM and memory" asks for storage as well
+            if "storage" in wanted or ("memory" in wanted and "ram" in wanted):
+                objectives.append(Objective("storage_gb", "max", source))
+        if "fast processor" in a:
+            objectives.append(Objective("cpu_tier", "max", source))
+
+        # Soft preferences
+        if ("weight" in q and a.startswith("yes")) or "lightweight" in a or "portability" in a:
+            constraints.append(Constraint("weight", "<=", LIGHTWEIGHT_LBS, hard, source))
+        if ("battery" in q and a.startswith("yes")) or "battery life" in a:
+            objectives.append(Objective("battery_hours", "max", source))
+        if "primary uses" in q and "gaming" in a:
+            constraints.append(Constraint("dedicated_gpu", "==", True, False, source))
+        if "color" in q:
+            color = re.search(r"\b(black|silver|gray|grey|gold|blue|green|white)\b", a)
+            if color:
+                constraints.append(Constraint("color", "==", color.group(1), hard, source))
+
+        # Record answers that produced nothing, unless they deliberately leave the choice open
+        open_choice = "undecided" in a or a.startswith(("no", "not"))
+        if len(constraints) + len(objectives) == found and not open_choice and "budget" not in q and not over:
+            unparsed.append(source)
+
+    if price_cap is not None:
+        constraints.insert(0, Constraint("price", "<=", price_cap, True, "dealbreaker price cap"))
+    elif budget is not None:
+        constraints.insert(0, Constraint("price", "<=", round(budget * BUDGET_TOLERANCE, 2), True,
+                                         f"budget ${budget:,.0f} with 10% tolerance"))
+    return constraints, objectives, unparsed
+
+
+def _soft_holds(constraint: Constraint, product: dict) -> bool:
+    # Soft brand and color preferences match loosely (e.g. "black" matches "nightfall black")
+    if constraint.attribute in ("brand", "color") and product.get(constraint.attribute):
+        return constraint.value in product[constraint.attribute]
+    return constraint.holds(product)
+
+
+def ideal_products(constraints: List[Constraint], objectives: List[Objective], catalog: List[dict]) -> List[str]:
+    """Titles of the products meeting every hard constraint, narrowed by soft constraints and objectives, cheapest first."""
+    candidates = [p for p in catalog if all(c.holds(p) for c in constraints if c.hard)]
+    for constraint in (c for c in constraints if not c.hard):
+        narrowed = [p for p in candidates if _soft_holds(constraint, p)]
+        if narrowed:
+            candidates = narrowed
+    for objective in objectives:
+        values = [p.get(objective.attribute) for p in candidates if p.get(objective.attribute) is not None]
+        if values:
+            best = max(values) if objective.direction == "max" else min(values)
+            candidates = [p for p in candidates if p.get(objective.attribute) == best]
+    return [p["title"] for p in sorted(candidates, key=lambda p: (p["price"], p["title"]))]
+
+
+def inputs_fingerprint(product: str, catalog_dir: str = CATALOG_DIR) -> str:
+    """Hash of the engine version, personas file and catalog files the ideal sets depend on."""
+    digest = hashlib.sha256(f"engine:{ENGINE_VERSION}".encode())
+    paths = [personas_file_for_product(product)] + [os.path.join(catalog_dir, f) for f in sorted(os.listdir(catalog_dir))]
+    for path in paths:
+        digest.update(path.encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build_ideal_recommendations(product: str = "laptop", catalog_dir: str = CATALOG_DIR) -> dict:
+    catalog = load_catalog_index(product, catalog_dir)
+    personas = {}
+    for persona in load_personas(product):
+        constraints, objectives, unparsed = parse_persona_constraints(persona)
+        personas[persona["name"]] = {
+            "persona_background": persona.get("persona_background"),
+            "constraints": [asdict(c) for c in constraints],
+            "objectives": [asdict(o) for o in objectives],
+            "unparsed": unparsed,
+            "ideal_recommendations": ideal_products(constraints, objectives, catalog),
+        }
+    return {
+        "engine_version": ENGINE_VERSION,
+        "product": product,
+        "fingerprint": inputs_fingerprint(product, catalog_dir),
+        "personas": personas,
+    }
+
+
+def cache_path_for_product(product: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{product}.json")
+
+
+def load_ideal_recommendations(product: str = "laptop", cache_dir: str = CACHE_DIR, rebuild: bool = False) -> Dict[str, List[str]]:
+    """Ideal recommendation titles per persona name, rebuilding the cache if its inputs changed."""
+    cache_path = cache_path_for_product(product, cache_dir)
+    fingerprint = inputs_fingerprint(product)
+    ideal_sets = None
+    if not rebuild and os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        if cached.get("fingerprint") == fingerprint:
+            ideal_sets = cached
+    if ideal_sets is None:
+        ideal_sets = build_ideal_recommendations(product)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, "w") as f:
+            json.dump(ideal_sets, f, indent=2)
+    return {name: entry["ideal_recommendations"] for name, entry in ideal_sets["personas"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the cached ideal recommendations for each persona")
+    parser.add_argument("--product", default="laptop", help="Product category (default: laptop)")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if the cache is up to date")
+    args = parser.parse_args()
+
+    ideal = load_ideal_recommendations(args.product, rebuild=args.rebuild)
+    for name, titles in ideal.items():
+        print(f"{name}: {len(titles)} ideal")
+        for title in titles:
+            print(f"    {title}")
+    print(f"Saved to {cache_path_for_product(args.product)}")
+
+
+if __name__ == "__main__":
+    main()
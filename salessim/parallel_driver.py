@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Multi-process simulation driver.
+
+A single asyncio loop spends a full core on prompt formatting, JSON and HTTP
+parsing long before the LLM backend is saturated. This driver spawns worker
+processes, each with its own event loop and client pools. The parent hands
+out scenario batches through a queue and aggregates the results.
+"""
+
+import asyncio
+import multiprocessing
+import queue
+import traceback
+
+import tqdm
+from simulation_utils import (
+    create_scenario_agents,
+    plan_scenarios,
+    print_simulation_summary,
+    run_planned_scenario,
+)
+from salessim.agents.ai_customer.ai_customer import get_persona_registry
+from common.ai_client import create_client_from_model_name
+from common.bcolors import bcolors
+from common.run_metrics import run_metrics
+from common.tracing import flush_spans
+
+# Seconds between forwarding a worker's metric events to the parent
+METRICS_FORWARD_INTERVAL = 2.0
+
+
+async def _worker_loop(worker_id, task_queue, result_queue, run_config, concurrency, client_factory):
+    shopperbot_client = client_factory(**run_config["customer_client_config"])
+    salesbot_client = client_factory(**run_config["salesbot_client_config"])
+    persona_registry = get_persona_registry(run_config["product"])
+    loop = asyncio.get_running_loop()
+
+    async def forward_metrics():
+        while True:
+            await asyncio.sleep(METRICS_FORWARD_INTERVAL)
+            events = run_metrics.drain_events()
+            if events:
+                result_queue.put(("metrics", worker_id, 0, events))
+
+    async def consume():
+        while True:
+            batch = await loop.run_in_executor(None, task_queue.get)
+            if batch is None:
+                return
+            tasks = []
+            for scenario in batch:
+                make_agents = lambda scenario=scenario: create_scenario_agents(
+                    scenario, persona_registry, shopperbot_client, salesbot_client,
+                    run_config["customer_model_config"], run_config["salesbot_model_config"]
+                )
+                tasks.append(run_planned_scenario(run_config["max_turns"], scenario, make_agents, verbose=run_config["verbose"]))
+            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
+            results = [r for scenario_results in batch_results if not isinstance(scenario_results, Exception)
+                       for r in scenario_results]
+            result_queue.put(("results", worker_id, len(batch), results))
+
+    forwarder = asyncio.create_task(forward_metrics())
+    await asyncio.gather(*[consume() for _ in range(concurrency)])
+    forwarder.cancel()
+
+
+def _worker_main(worker_id, task_queue, result_queue, run_config, concurrency, client_factory):
+    """Entry point of a worker process: run its own event loop until the queue is drained."""
+    # Conversation and LLM events are forwarded to the parent's run metrics
+    run_metrics.forward = True
+    try:
+        asyncio.run(_worker_loop(worker_id, task_queue, result_queue, run_config, concurrency, client_factory))
+    except Exception:
+        result_queue.put(("error", worker_id, 0, traceback.format_exc()))
+    finally:
+        # Worker processes exit without running atexit handlers
+        flush_spans()
+        result_queue.put(("metrics", worker_id, 0, run_metrics.drain_events()))
+        result_queue.put(("done", worker_id, 0, None))
+
+
+def run_multiprocess_simulations(max_turns, scenarios_config, customer_model_config, salesbot_model_config,
+                                 customer_client_config, salesbot_client_config, shard=None,
+                                 num_workers=2, batch_size=5, concurrency_per_worker=1,
+                                 client_factory=create_client_from_model_name, verbose=True):
+    """
+    Run simulations across num_workers processes.
+    Each worker runs concurrency_per_worker batches of batch_size scenarios at a time.
+    Note that each process has its own API semaphore, so the total number of in-flight
+    LLM calls scales with num_workers.
+    """
+    scenarios = list(plan_scenarios(scenarios_config, shard))
+    run_config = {
+        "max_turns": max_turns,
+        "product": scenarios_config.get('product', 'laptop'),
+        "customer_model_config": customer_model_config,
+        "salesbot_model_config": salesbot_model_config,
+        "customer_client_config": customer_client_config,
+        "salesbot_client_config": salesbot_client_config,
+        "verbose": verbose,
+    }
+
+    # spawn avoids inheriting the parent's event loop and open sockets
+    context = multiprocessing.get_context("spawn")
+    task_queue = context.Queue()
+    result_queue = context.Queue()
+
+    for i in range(0, len(scenarios), batch_size):
+        task_queue.put(scenarios[i:i+batch_size])
+    for _ in range(num_workers * concurrency_per_worker):
+        task_queue.put(None)
+
+    print(f"{bcolors.HEADER}Starting {len(scenarios)} simulations on {num_workers} worker processes...{bcolors.ENDC}")
+    workers = [
+        context.Process(target=_worker_main, args=(i, task_queue, result_queue, run_config, concurrency_per_worker, client_factory))
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    all_results = []
+    finished = 0
+    with tqdm.tqdm(total=len(scenarios)) as progress:
+        while finished < num_workers:
+            try:
+                kind, worker_id, count, payload = result_queue.get(timeout=5)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    print(f"{bcolors.FAIL}All workers exited before reporting completion{bcolors.ENDC}")
+                    break
+                continue
+            if kind == "results":
+                all_results.extend(payload)
+                progress.update(count)
+            elif kind == "metrics":
+                run_metrics.apply_events(payload)
+            elif kind == "error":
+                print(f"{bcolors.FAIL}Worker {worker_id} failed:\n{payload}{bcolors.ENDC}")
+            elif kind == "done":
+                finished += 1
+
+    for worker in workers:
+        worker.join()
+
+    print_simulation_summary(all_results)
+    return all_results
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Experimental designs over Big-5 trait levels.
+
+Each design takes the list of levels per trait and lazily yields level
+combinations (one tuple per unique scenario). Designs are deterministic for a
+given seed so that every shard of a sweep plans the same scenarios.
+
+- full_factorial: every combination (the original behavior)
+- fractional_factorial: a resolution-V (or higher) two-level fraction; main
+  effects and two-trait interactions stay unaliased with half the runs
+- latin_hypercube: a fixed budget of runs where every level of every trait
+  appears an equal number of times
+- random: a uniform random subsample of the full factorial with a fixed budget
+"""
+
+import random
+from itertools import product
+from math import prod
+from typing import Iterator, List, Sequence, Tuple
+
+DESIGNS = ["full_factorial", "fractional_factorial", "latin_hypercube", "random"]
+
+
+def full_factorial(levels: Sequence[Sequence[str]]) -> Iterator[Tuple[str, ...]]:
+    return product(*levels)
+
+
+def fractional_factorial(levels: Sequence[Sequence[str]]) -> Iterator[Tuple[str, ...]]:
+    """Two-level half fraction with defining relation I = ABC...K over all varied traits.
+
+    The fraction's resolution equals the number of varied traits, so with five or more
+    two-level traits it is at least resolution V. With fewer, no fraction reaches
+    resolution V and the full factorial is returned.
+    """
+    varied = [i for i, values in enumerate(levels) if len(values) > 1]
+    for i in varied:
+        if len(levels[i]) != 2:
+            raise ValueError(f"fractional_factorial requires two-level traits, got levels {list(levels[i])}")
+    if len(varied) < 5:
+        yield from full_factorial(levels)
+        return
+
+    for combo in product(*levels):
+        # Code each varied trait as +1 for its first level and -1 for its second,
+        # and keep the runs whose product over all varied traits is +1.
+        sign = 1
+        for i in varied:
+            sign *= 1 if combo[i] == levels[i][0] else -1
+        if sign == 1:
+            yield combo
+
+
+def latin_hypercube(levels: Sequence[Sequence[str]], budget: int, seed: int = 0) -> Iterator[Tuple[str, ...]]:
+    """Categorical Latin hypercube: each trait's column is a shuffled, balanced repetition of its levels."""
+    rng = random.Random(seed)
+    columns: List[List[str]] = []
+    for values in levels:
+        column = [values[i % len(values)] for i in range(budget)]
+        rng.shuffle(column)
+        columns.append(column)
+    return zip(*columns)
+
+
+def random_subsample(levels: Sequence[Sequence[str]], budget: int, seed: int = 0) -> Iterator[Tuple[str, ...]]:
+    """Sample distinct combinations by index without materializing the full factorial."""
+    rng = random.Random(seed)
+    total = prod(len(values) for values in levels)
+    for index in sorted(rng.sample(range(total), min(budget, total))):
+        combo = []
+        for values in reversed(levels):
+            index, position = divmod(index, len(values))
+            combo.append(values[position])
+        yield tuple(reversed(combo))
+
+
+def design_combinations(levels: Sequence[Sequence[str]], design: str = "full_factorial",
+                        budget: int = None, seed: int = 0) -> Iterator[Tuple[str, ...]]:
+    """Lazily yield level combinations for the requested design."""
+    if design == "full_factorial":
+        return full_factorial(levels)
+    elif design == "fractional_factorial":
+        return fractional_factorial(levels)
+    elif design in ("latin_hypercube", "random"):
+        if not budget:
+            raise ValueError(f"The {design} design requires a design_budget")
+        if design == "latin_hypercube":
+            return latin_hypercube(levels, budget, seed)
+        return random_subsample(levels, budget, seed)
+    raise ValueError(f"Unknown design: {design}. Expected one of {DESIGNS}")
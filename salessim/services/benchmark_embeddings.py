@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark embedding backends for the lookup service.
+
+Reports encode throughput (queries/sec) and recall@k of each backend's
+nearest neighbours against the fp32 PyTorch baseline, on the laptop catalog
+and the buying guides.
+
+Usage: python3 -m salessim.services.benchmark_embeddings [--backends torch onnx onnx-int8] [--k 4]
+"""
+
+import argparse
+import json
+import time
+
+from salessim.services.embedders import create_embedder, cos_sim, DEFAULT_MODEL_NAME, EMBEDDING_BACKENDS
+from salessim.services.sales_service import load_product_documents, load_guide_documents
+
+
+def load_benchmark_queries(personas_file="salessim/agents/ai_customer/laptop_personas.jsonl"):
+    """Use persona preference answers as realistic shopper queries."""
+    persona_keys = ["persona_background", "name", "age", "background", "speaking_style", "knowledge_level"]
+    queries = []
+    with open(personas_file, 'r') as f:
+        for line in f:
+            persona = json.loads(line)
+            for q, a in persona.items():
+                if q not in persona_keys:
+                    queries.append(f"{q} {a}")
+    return queries
+
+
+def top_k_ids(embedder, queries, docs, k):
+    doc_embeddings = embedder.encode([doc.page_content for doc in docs])
+    start = time.perf_counter()
+    query_embeddings = embedder.encode(queries)
+    elapsed = time.perf_counter() - start
+    scores = cos_sim(query_embeddings, doc_embeddings)
+    top_ids = [set(row.argsort()[::-1][:k]) for row in scores]
+    return top_ids, len(queries) / elapsed
+
+
+def recall_at_k(baseline_ids, candidate_ids, k):
+    hits = sum(len(b & c) for b, c in zip(baseline_ids, candidate_ids))
+    return hits / (k * len(baseline_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark lookup service embedding backends')
+    parser.add_argument('--backends', nargs='+', choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKENDS,
+                        help='Backends to benchmark (torch is always used as the baseline)')
+    parser.add_argument('--model', default=DEFAULT_MODEL_NAME, help='sentence-transformers model name')
+    parser.add_argument('--k', type=int, default=4, help='Neighbours per query for recall@k (default: 4)')
+    parser.add_argument('--output', help='Optional path to write the results as JSON')
+    args = parser.parse_args()
+
+    corpora = {
+        "laptops": load_product_documents(),
+        "guides": load_guide_documents(),
+    }
+    queries = load_benchmark_queries()
+    print(f"Benchmarking {len(queries)} queries with k={args.k}")
+
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    baseline = {}
+    results = []
+    for backend in backends:
+        embedder = create_embedder(backend, args.model)
+        for corpus_name, docs in corpora.items():
+            ids, qps = top_k_ids(embedder, queries, docs, args.k)
+            if backend == "torch":
+                baseline[corpus_name] = ids
+            recall = recall_at_k(baseline[corpus_name], ids, args.k)
+            results.append({"backend": backend, "corpus": corpus_name, "queries_per_sec": qps, f"recall@{args.k}": recall})
+
+    print(f"\n{'backend':<12}{'corpus':<10}{'queries/sec':>14}{f'recall@{args.k}':>12}")
+    print("-" * 48)
+    for r in results:
+        print(f"{r['backend']:<12}{r['corpus']:<10}{r['queries_per_sec']:>14.1f}{r[f'recall@{args.k}']:>12.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark budgeted retrieval against the plain top-k lookups.
+
+For each guide chunking and retrieval setting, reports the prompt tokens that
+a product lookup and a buying guide lookup add to a salesbot turn, the tokens
+saved per turn against top-k over the default chunking, and the mean query
+similarity of the returned documents as a relevance check.
+
+Usage: python3 -m salessim.services.benchmark_retrieval [--chunk-sizes 4000 1000 500] [--token-budget 600]
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from salessim.services.benchmark_embeddings import load_benchmark_queries
+from salessim.services.embedders import create_embedder, DEFAULT_MODEL_NAME, EMBEDDING_BACKENDS
+from salessim.services.retrieval import (
+    count_tokens, select_context, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_DEDUP_THRESHOLD, DEFAULT_FETCH_K, DEFAULT_MMR_LAMBDA,
+)
+from salessim.services.sales_service import load_product_documents, load_guide_documents
+
+
+def run_lookups(query_embeddings, docs, doc_embeddings, k, fetch_k, **options):
+    """Mean prompt tokens and mean query similarity of the documents each query retrieves."""
+    tokens, similarity = [], []
+    positions = {id(doc): i for i, doc in enumerate(docs)}
+    for query_vector in query_embeddings:
+        scores = doc_embeddings @ query_vector
+        nearest = np.argsort(-scores)[:max(fetch_k, k)]
+        if options:
+            picked = select_context(query_vector, [docs[i] for i in nearest], doc_embeddings[nearest], k, **options)
+        else:
+            picked = [docs[i] for i in nearest[:k]]
+        tokens.append(sum(count_tokens(doc.page_content) for doc in picked))
+        similarity.append(float(np.mean([scores[positions[id(doc)]] for doc in picked])))
+    return float(np.mean(tokens)), float(np.mean(similarity))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark token-budgeted retrieval')
+    parser.add_argument('--backend', choices=EMBEDDING_BACKENDS, default="torch", help='Embedding backend')
+    parser.add_argument('--model', default=DEFAULT_MODEL_NAME, help='sentence-transformers model name')
+    parser.add_argument('--k', type=int, default=4, help='Documents per lookup (default: 4)')
+    parser.add_argument('--fetch-k', type=int, default=DEFAULT_FETCH_K, help='MMR candidate pool size')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[DEFAULT_CHUNK_SIZE, 1000, 500],
+                        help='Guide chunk sizes to compare, in characters')
+    parser.add_argument('--chunk-overlap', type=int, default=DEFAULT_CHUNK_OVERLAP,
+                        help='Guide chunk overlap for non-default chunk sizes (capped at a fifth of the size)')
+    parser.add_argument('--token-budget', type=int, default=600, help='Token budget per lookup')
+    parser.add_argument('--mmr-lambda', type=float, default=DEFAULT_MMR_LAMBDA, help='MMR relevance weight')
+    parser.add_argument('--dedup-threshold', type=float, default=DEFAULT_DEDUP_THRESHOLD,
+                        help='Cosine similarity above which a document is a near-duplicate')
+    parser.add_argument('--output', help='Optional path to write the results as JSON')
+    args = parser.parse_args()
+
+    embedder = create_embedder(args.backend, args.model)
+    queries = load_benchmark_queries()
+    query_embeddings = embedder.encode(queries)
+    print(f"Benchmarking {len(queries)} queries, k={args.k}, token budget {args.token_budget}")
+
+    products = load_product_documents()
+    product_embeddings = embedder.encode([doc.page_content for doc in products])
+    options = {"token_budget": args.token_budget, "mmr_lambda": args.mmr_lambda, "dedup_threshold": args.dedup_threshold}
+
+    results = []
+    baseline_tokens = None
+    for chunk_size in args.chunk_sizes:
+        overlap = DEFAULT_CHUNK_OVERLAP if chunk_size == DEFAULT_CHUNK_SIZE else min(args.chunk_overlap, chunk_size // 5)
+        guides = load_guide_documents(chunk_size=chunk_size, chunk_overlap=overlap)
+        guide_embeddings = embedder.encode([doc.page_content for doc in guides])
+        for mode, mode_options in (("top-k", {}), ("budgeted", options)):
+            product_tokens, product_similarity = run_lookups(query_embeddings, products, product_embeddings,
+                                                             args.k, args.fetch_k, **mode_options)
+            guide_tokens, guide_similarity = run_lookups(query_embeddings, guides, guide_embeddings,
+                                                         args.k, args.fetch_k, **mode_options)
+            turn_tokens = product_tokens + guide_tokens
+            if baseline_tokens is None:
+                baseline_tokens = turn_tokens
+            results.append({
+                "chunk_size": chunk_size, "chunk_overlap": overlap, "chunks": len(guides), "mode": mode,
+                "product_tokens": product_tokens, "guide_tokens": guide_tokens,
+                "tokens_per_turn": turn_tokens, "tokens_saved_per_turn": baseline_tokens - turn_tokens,
+                "product_similarity": product_similarity, "guide_similarity": guide_similarity,
+            })
+
+    print(f"\n{'chunking':<12}{'chunks':>7}  {'mode':<10}{'products':>9}{'guides':>8}{'per turn':>10}{'saved':>8}"
+          f"{'prod sim':>10}{'guide sim':>11}")
+    print("-" * 85)
+    for r in results:
+        print(f"{r['chunk_size']:>5}/{r['chunk_overlap']:<6}{r['chunks']:>7}  {r['mode']:<10}{r['product_tokens']:>9.0f}"
+              f"{r['guide_tokens']:>8.0f}{r['tokens_per_turn']:>10.0f}{r['tokens_saved_per_turn']:>8.0f}"
+              f"{r['product_similarity']:>10.3f}{r['guide_similarity']:>11.3f}")
+    print("\nTokens are per turn with one product and one guide lookup, saved against top-k over the default chunking.")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
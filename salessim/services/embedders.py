@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Pluggable sentence embedders for the lookup service.
+
+All backends expose the same small surface:
+- ``encode(texts)`` returning L2-normalized numpy embeddings (used for
+  recommended-item similarity), and
+- ``embed_documents``/``embed_query`` from langchain's ``Embeddings``, so
+  they can be handed to the FAISS vectorstore in place of
+  ``HuggingFaceEmbeddings`` (FAISS calls any other embedding object directly).
+
+Backends:
+- ``torch``: sentence-transformers on PyTorch (fp32, the original behavior)
+- ``onnx``: ONNX Runtime, fp32 export of the same model
+- ``onnx-int8``: ONNX Runtime with dynamically quantized int8 weights
+"""
+
+import os
+import logging
+from typing import List, Union
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+EMBEDDING_BACKENDS = ["torch", "onnx", "onnx-int8"]
+ONNX_CACHE_DIR = "onnx_models"
+
+
+class TorchEmbedder(Embeddings):
+    """sentence-transformers embedder running on PyTorch."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, batch_size: int = 32):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode(text).tolist()
+
+
+class OnnxEmbedder(Embeddings):
+    """ONNX Runtime embedder, optionally with dynamically quantized int8 weights.
+
+    The model is exported once to ``ONNX_CACHE_DIR`` and reused afterwards.
+    Pooling mirrors all-mpnet-base-v2: attention-masked mean pooling followed
+    by L2 normalization.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, quantize: bool = False,
+                 batch_size: int = 32, max_length: int = 384, cache_dir: str = ONNX_CACHE_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        model_path = self._prepare_model(model_name, quantize, cache_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _prepare_model(model_name: str, quantize: bool, cache_dir: str) -> str:
+        model_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        fp32_path = os.path.join(model_dir, "model.onnx")
+        int8_path = os.path.join(model_dir, "model_int8.onnx")
+
+        if not os.path.exists(fp32_path):
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+            logger.info(f"Exporting {model_name} to ONNX in {model_dir}")
+            ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(model_dir)
+
+        if not quantize:
+            return fp32_path
+
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            logger.info(f"Quantizing {fp32_path} to int8")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return int8_path
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        features = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        inputs = {name: value.astype(np.int64) for name, value in features.items() if name in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        mask = features["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        batches = [self._encode_batch(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        embeddings = np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode(text).tolist()
+
+
+def create_embedder(backend: str = "torch", model_name: str = DEFAULT_MODEL_NAME, **kwargs):
+    """Create an embedder for the given backend name."""
+    if backend == "torch":
+        return TorchEmbedder(model_name, **kwargs)
+    elif backend == "onnx":
+        return OnnxEmbedder(model_name, quantize=False, **kwargs)
+    elif backend == "onnx-int8":
+        return OnnxEmbedder(model_name, quantize=True, **kwargs)
+    raise ValueError(f"Unknown embedding backend: {backend}. Expected one of {EMBEDDING_BACKENDS}")
+
+
+def cos_sim(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarity between two sets of L2-normalized embeddings."""
+    return np.atleast_2d(a) @ np.atleast_2d(b).T
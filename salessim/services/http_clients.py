@@ -2,15 +2,52 @@
 
 import aiohttp
 import logging
-from typing import List
+from typing import Dict, List, Optional
 from salessim.services.constants import Document
+from salessim.services import wire
+from common.tracing import span, trace_headers
 logger = logging.getLogger(__name__)
 
+def search_payload(query: str, k: int, options: dict) -> dict:
+    return {"query": query, "k": k, **{key: value for key, value in options.items() if value is not None}}
+
+class CatalogCache:
+    """Product documents by catalog id, shared by the clients of one lookup service"""
+
+    def __init__(self):
+        self.version = None
+        self.docs: Dict[str, Document] = {}
+
+    def observe(self, version: str):
+        # A new catalog version means the ids may refer to different products
+        if version != self.version:
+            self.docs.clear()
+            self.version = version
+
+    def missing(self, ids: List[str]) -> List[str]:
+        return [i for i in dict.fromkeys(ids) if i not in self.docs]
+
+    def add(self, items: List[dict]):
+        for item in items:
+            self.docs[item["id"]] = Document(item["page_content"], item["metadata"])
+
+    def resolve(self, ids: List[str]) -> List[Document]:
+        return [self.docs[i] for i in ids]
+
+
+# Per service URL, so every conversation in the process shares the catalog and the negotiated protocol
+_catalog_caches: Dict[str, CatalogCache] = {}
+_negotiated_protocols: Dict[str, int] = {}
+
+
 class LookupServiceClient:
     """HTTP client for the consolidated Lookup Service"""
 
-    def __init__(self, base_url: str = "http://127.0.0.1:8001"):
+    def __init__(self, base_url: str = "http://127.0.0.1:8001", protocol: Optional[int] = None):
         self.base_url = base_url
+        # Protocol version to speak; None negotiates the highest one both sides support
+        self.protocol = protocol
+        self.catalog = _catalog_caches.setdefault(base_url, CatalogCache())
         self.session = None
         self._connector = aiohttp.TCPConnector(
             limit=100,
@@ -34,50 +71,113 @@ class LookupServiceClient:
         if self._connector and not self._connector.closed:
             await self._connector.close()
 
-    async def search_products(self, query: str, k: int = 4):
-        """Search for products via HTTP API"""
+    async def _protocol(self) -> int:
+        if self.protocol is None:
+            if self.base_url not in _negotiated_protocols:
+                session = await self._get_session()
+                try:
+                    async with session.get(f"{self.base_url}/health") as response:
+                        versions = (await response.json()).get("protocol_versions", [1]) if response.status == 200 else [1]
+                except Exception as e:
+                    logger.error(f"Failed to negotiate lookup protocol: {e}")
+                    return 1
+                _negotiated_protocols[self.base_url] = max(v for v in versions if v <= wire.PROTOCOL_VERSION)
+            self.protocol = _negotiated_protocols[self.base_url]
+        return self.protocol
+
+    async def _post_wire(self, path: str, payload: dict, timeout: Optional[aiohttp.ClientTimeout] = None) -> dict:
+        """POST a protocol v2 request, raising on a non-200 response"""
+        session = await self._get_session()
+        content_type = wire.preferred_content_type()
+        headers = {"Content-Type": content_type, "Accept": content_type, **trace_headers()}
+        async with session.post(f"{self.base_url}{path}", data=wire.encode(payload, content_type),
+                                headers=headers, timeout=timeout) as response:
+            body = await response.read()
+            if response.status != 200:
+                raise RuntimeError(f"{path} returned {response.status}: {body[:500]!r}")
+            return wire.decode(body, response.headers.get("Content-Type", wire.JSON))
+
+    async def _resolve_products(self, ids: List[str], catalog: str) -> List[Document]:
+        """Documents for product ids, fetching the ones missing from the catalog cache"""
+        self.catalog.observe(catalog)
+        missing = self.catalog.missing(ids)
+        if missing:
+            data = await self._post_wire("/v2/products/fetch", {"ids": missing})
+            self.catalog.observe(data["catalog"])
+            self.catalog.add(data["items"])
+        return self.catalog.resolve(ids)
+
+    async def search_products(self, query: str, k: int = 4, **options):
+        """Search for products via HTTP API; options are the budgeted retrieval settings of SearchRequest"""
+        if await self._protocol() >= 2:
+            try:
+                with span("lookup_client.search_products", "http"):
+                    data = await self._post_wire("/v2/products/search", search_payload(query, k, options))
+                    return await self._resolve_products(data["ids"], data["catalog"])
+            except Exception as e:
+                logger.error(f"Failed to search products: {e}")
+                return []
+
         session = await self._get_session()
 
         try:
-            async with session.post(
-                f"{self.base_url}/products/search",
-                json={"query": query, "k": k}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return [Document(item["page_content"], item["metadata"]) for item in data]
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Product search error {response.status}: {error_text}")
-                    return []
+            with span("lookup_client.search_products", "http"):
+                async with session.post(
+                    f"{self.base_url}/products/search",
+                    json=search_payload(query, k, options),
+                    headers=trace_headers()
+                ) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return [Document(item["page_content"], item["metadata"]) for item in data]
+                    else:
+                        error_text = await response.text()
+                        logger.error(f"Product search error {response.status}: {error_text}")
+                        return []
         except Exception as e:
             logger.error(f"Failed to search products: {e}")
             return []
 
-    async def search_buying_guides(self, query: str, k: int = 4):
-        """Search for buying guides via HTTP API"""
+    async def search_buying_guides(self, query: str, k: int = 4, **options):
+        """Search for buying guides via HTTP API; options are the budgeted retrieval settings of SearchRequest"""
         session = await self._get_session()
 
         try:
-            async with session.post(
-                f"{self.base_url}/guides/search",
-                json={"query": query, "k": k},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # Convert back to Document-like objects for compatibility
-                    return [Document(item["page_content"], item["metadata"]) for item in data]
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Buying guide search error {response.status}: {error_text}")
-                    return []
+            with span("lookup_client.search_buying_guides", "http"):
+                async with session.post(
+                    f"{self.base_url}/guides/search",
+                    json=search_payload(query, k, options),
+                    headers=trace_headers(),
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        # Convert back to Document-like objects for compatibility
+                        return [Document(item["page_content"], item["metadata"]) for item in data]
+                    else:
+                        error_text = await response.text()
+                        logger.error(f"Buying guide search error {response.status}: {error_text}")
+                        return []
         except Exception as e:
             logger.error(f"Failed to search buying guides: {e}")
             return []
 
     async def find_recommended_items_in_response(self, candidates: List, response: str, sim_threshold: float = 0.70):
         """Find recommended items in response via HTTP API"""
+        candidates_by_id = {c.metadata["id"]: c for c in candidates if "id" in c.metadata}
+        if await self._protocol() >= 2 and all("id" in c.metadata for c in candidates):
+            try:
+                with span("lookup_client.find_recommended_items", "http", candidates=len(candidates_by_id)):
+                    data = await self._post_wire(
+                        "/v2/sales/find_recommended_items",
+                        {"candidate_ids": list(candidates_by_id), "response": response, "sim_threshold": sim_threshold},
+                        timeout=aiohttp.ClientTimeout(total=10),
+                    )
+                return [candidates_by_id[item["id"]] for item in data["items"] if item["id"] in candidates_by_id]
+            except Exception as e:
+                logger.error(f"Failed to find recommended items: {e}")
+                return []
+
         session = await self._get_session()
 
         # Convert candidates to serializable format
@@ -89,36 +189,53 @@ class LookupServiceClient:
             })
 
         try:
-            async with session.post(
-                f"{self.base_url}/sales/find_recommended_items",
-                json={
-                    "candidates": candidates_data,
-                    "response": response,
-                    "sim_threshold": sim_threshold
-                },
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response_obj:
-                if response_obj.status == 200:
-                    data = await response_obj.json()
-                    # Convert back to Document-like objects for compatibility
-                    return [Document(item["page_content"], item["metadata"]) for item in data]
-                else:
-                    error_text = await response_obj.text()
-                    logger.error(f"Find recommended items error {response_obj.status}: {error_text}")
-                    return []
+            with span("lookup_client.find_recommended_items", "http", candidates=len(candidates_data)):
+                async with session.post(
+                    f"{self.base_url}/sales/find_recommended_items",
+                    json={
+                        "candidates": candidates_data,
+                        "response": response,
+                        "sim_threshold": sim_threshold
+                    },
+                    headers=trace_headers(),
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as response_obj:
+                    if response_obj.status == 200:
+                        data = await response_obj.json()
+                        # Convert back to Document-like objects for compatibility
+                        return [Document(item["page_content"], item["metadata"]) for item in data]
+                    else:
+                        error_text = await response_obj.text()
+                        logger.error(f"Find recommended items error {response_obj.status}: {error_text}")
+                        return []
         except Exception as e:
             breakpoint()
             logger.error(f"Failed to find recommended items: {e}")
             return []
 
+    async def get_match_stats(self):
+        """Fetch how often recommended items were resolved by the lexical fast path"""
+        session = await self._get_session()
+
+        try:
+            async with session.get(f"{self.base_url}/sales/match_stats") as response:
+                if response.status == 200:
+                    return await response.json()
+                error_text = await response.text()
+                logger.error(f"Match stats error {response.status}: {error_text}")
+                return {}
+        except Exception as e:
+            logger.error(f"Failed to fetch match stats: {e}")
+            return {}
+
 # Legacy classes for backward compatibility
 class ProductLookupClient:
     """Legacy wrapper for product lookups"""
     def __init__(self, base_url: str = "http://127.0.0.1:8001"):
         self.client = LookupServiceClient(base_url)
 
-    async def top_docs(self, query: str, k: int = 4):
-        return await self.client.search_products(query, k)
+    async def top_docs(self, query: str, k: int = 4, **options):
+        return await self.client.search_products(query, k, **options)
 
     async def find_recommended_items_in_response(self, candidates: List, response: str, sim_threshold: float = 0.70):
         return await self.client.find_recommended_items_in_response(candidates, response, sim_threshold)
@@ -131,8 +248,8 @@ class BuyingGuideClient:
     def __init__(self, base_url: str = "http://127.0.0.1:8001"):
         self.client = LookupServiceClient(base_url)
 
-    async def top_docs(self, query: str, k: int = 4):
-        return await self.client.search_buying_guides(query, k)
+    async def top_docs(self, query: str, k: int = 4, **options):
+        return await self.client.search_buying_guides(query, k, **options)
 
     async def close(self):
         await self.client.close()
\ No newline at end of file
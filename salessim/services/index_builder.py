@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Incremental, content-addressed FAISS index builds for the lookup service.
+
+Every document (product or guide chunk) is hashed by its text and metadata.
+An index lives in {cache_dir}/indexes/{key}, where key hashes the embedding
+backend, the model and every document hash. Changed data gets a new key
+instead of loading a stale index. Embeddings are cached per backend and
+model in {cache_dir}/embeddings/, keyed by the hash of the embedded text,
+so a rebuild only embeds new or changed documents. Those are encoded in
+batches, one after another, since the embedders' tokenizers are not
+thread-safe. Each index directory has a manifest.json recording the
+model, the source data hashes, the document count and the build time.
+
+Usage:
+    python3 -m salessim.services.index_builder build [--embedding-backend torch]
+    python3 -m salessim.services.index_builder list
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get("SALESSIM_INDEX_CACHE", "index_cache")
+MANIFEST_FILE = "manifest.json"
+EMBEDDING_BATCH_SIZE = 64
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_hash(doc) -> str:
+    return content_hash(doc.page_content + "\0" + json.dumps(doc.metadata, sort_keys=True, ensure_ascii=False))
+
+
+def _model_key(backend: str, model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", f"{backend}-{model_name}")
+
+
+class EmbeddingCache:
+    """Embeddings of one backend and model, keyed by the content hash of the embedded text."""
+
+    def __init__(self, cache_dir: str, backend: str, model_name: str):
+        self.path = os.path.join(cache_dir, "embeddings", _model_key(backend, model_name) + ".npz")
+        self.vectors: Dict[str, np.ndarray] = {}
+        if os.path.exists(self.path):
+            data = np.load(self.path)
+            self.vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+
+    def embed(self, texts: List[str], embedder, batch_size: int = EMBEDDING_BATCH_SIZE) -> Tuple[np.ndarray, int]:
+        """Embeddings of texts, encoding only those not cached; returns them and the number encoded."""
+        keys = [content_hash(t) for t in texts]
+        missing = list({k: t for k, t in zip(keys, texts) if k not in self.vectors}.items())
+        if missing:
+            logger.info(f"Embedding {len(missing)} new texts in batches of {batch_size}")
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                vectors = embedder.encode([t for _, t in batch])
+                for (key, _), vector in zip(batch, np.atleast_2d(vectors)):
+                    self.vectors[key] = np.asarray(vector, dtype=np.float32)
+            self.save()
+        return np.stack([self.vectors[k] for k in keys]), len(missing)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, keys=np.array(list(self.vectors)), vectors=np.stack(list(self.vectors.values())))
+        os.replace(tmp_path, self.path)
+
+
+def index_key(name: str, backend: str, model_name: str, docs: List) -> str:
+    digest = hashlib.sha256(f"{name}\0{backend}\0{model_name}".encode("utf-8"))
+    for doc in docs:
+        digest.update(document_hash(doc).encode("ascii"))
+    return f"{name}-{digest.hexdigest()[:16]}"
+
+
+def load_or_build_index(name: str, docs: List, embedder, backend: str, model_name: str,
+                        data_files: List[str], cache_dir: str = DEFAULT_CACHE_DIR,
+                        settings: Optional[Dict] = None):
+    """
+    The FAISS index of docs from the cache, built (embedding only uncached texts)
+    when no index with the same content exists. settings (e.g. chunking) are
+    recorded in the manifest.
+    """
+    key = index_key(name, backend, model_name, docs)
+    index_dir = os.path.join(cache_dir, "indexes", key)
+    if os.path.isfile(os.path.join(index_dir, MANIFEST_FILE)):
+        logger.info(f"Loading cached index {key}")
+        return FAISS.load_local(index_dir, embedder)
+
+    start = time.perf_counter()
+    texts = [doc.page_content for doc in docs]
+    vectors, embedded = EmbeddingCache(cache_dir, backend, model_name).embed(texts, embedder)
+    db = FAISS.from_embeddings(list(zip(texts, vectors.tolist())), embedder, metadatas=[doc.metadata for doc in docs])
+
+    # Write to a temporary directory first, so an interrupted build never looks complete
+    tmp_dir = index_dir + f".tmp{os.getpid()}"
+    db.save_local(tmp_dir)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "name": name,
+            "key": key,
+            "embedding_backend": backend,
+            "embedding_model": model_name,
+            "documents": len(docs),
+            "embedded": embedded,
+            "reused_embeddings": len(set(texts)) - embedded,
+            "data_files": {path: file_hash(path) for path in data_files},
+            "settings": settings or {},
+            "build_seconds": round(time.perf_counter() - start, 3),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }, f, indent=2)
+    if os.path.isdir(index_dir):
+        shutil.rmtree(tmp_dir)  # another process finished the same build first
+    else:
+        os.replace(tmp_dir, index_dir)
+    logger.info(f"Built index {key}: {len(docs)} documents, {embedded} embedded in {time.perf_counter() - start:.1f}s")
+    return db
+
+
+def list_indexes(cache_dir: str = DEFAULT_CACHE_DIR) -> List[Dict]:
+    manifests = []
+    indexes_dir = os.path.join(cache_dir, "indexes")
+    for name in sorted(os.listdir(indexes_dir)) if os.path.isdir(indexes_dir) else []:
+        manifest_path = os.path.join(indexes_dir, name, MANIFEST_FILE)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def main():
+    from salessim.services.embedders import create_embedder, DEFAULT_MODEL_NAME, EMBEDDING_BACKENDS
+    from salessim.services.retrieval import DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+
+    parser = argparse.ArgumentParser(description='Build or inspect cached lookup service indexes')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Build the product and guide indexes ahead of a run')
+    build_parser.add_argument('--embedding-backend', choices=EMBEDDING_BACKENDS, default="torch")
+    build_parser.add_argument('--embedding-model', default=DEFAULT_MODEL_NAME)
+    build_parser.add_argument('--guide-chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    build_parser.add_argument('--guide-chunk-overlap', type=int, default=DEFAULT_CHUNK_OVERLAP)
+    for sub in (build_parser, subparsers.add_parser('list', help='Print the manifests of cached indexes')):
+        sub.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Index cache directory (default: {DEFAULT_CACHE_DIR})')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for manifest in list_indexes(args.cache_dir):
+            print(f"{manifest['key']}: {manifest['documents']} documents, {manifest['embedding_backend']} "
+                  f"{manifest['embedding_model']}, built {manifest['built_at']}")
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    from salessim.services import sales_service
+    sales_service.service_config.update({
+        "embedding_backend": args.embedding_backend,
+        "embedding_model": args.embedding_model,
+        "guide_chunk_size": args.guide_chunk_size,
+        "guide_chunk_overlap": args.guide_chunk_overlap,
+        "index_cache_dir": args.cache_dir,
+    })
+    embedder = create_embedder(args.embedding_backend, args.embedding_model)
+    sales_service.ProductLookupModule(embedder=embedder)
+    sales_service.SearchBuyingGuide(embedder=embedder)
+
+
+if __name__ == "__main__":
+    main()
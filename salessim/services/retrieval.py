@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Chunking and budgeted retrieval for the lookup service.
+
+Buying guides are split into chunks of a configurable size and overlap.
+Searches return the plain top-k neighbours unless retrieval options are
+given, in which case select_context picks documents from a wider candidate
+pool by maximal marginal relevance (MMR), skips near-duplicates of documents
+already picked, and stops when the next document would exceed the token
+budget. Token counts use tiktoken's cl100k_base encoding when available
+(approximating the salesbot's tokenizer), else about four characters per token.
+"""
+
+import functools
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain.text_splitter import CharacterTextSplitter
+
+from salessim.services.constants import Document
+
+# langchain's splitter defaults, which built the existing guide indexes
+DEFAULT_CHUNK_SIZE = 4000
+DEFAULT_CHUNK_OVERLAP = 200
+# Candidates fetched from the index before MMR selection
+DEFAULT_FETCH_K = 20
+DEFAULT_MMR_LAMBDA = 0.7
+DEFAULT_DEDUP_THRESHOLD = 0.92
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except ImportError:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def chunk_guides(guides: Dict[str, str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[Document]:
+    """Split each guide on newlines into chunks of up to chunk_size characters."""
+    text_splitter = CharacterTextSplitter(separator="\n", chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    docs = []
+    for name, guide in guides.items():
+        docs.extend([Document(page_content=t, metadata={'title': name}) for t in text_splitter.split_text(guide)])
+    return docs
+
+
+def select_context(query_vector: np.ndarray, docs: List, vectors: np.ndarray, k: int,
+                   token_budget: Optional[int] = None, mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+                   dedup_threshold: float = DEFAULT_DEDUP_THRESHOLD,
+                   count: Callable[[str], int] = count_tokens) -> List:
+    """
+    Greedily pick up to k of docs by MMR, skipping near-duplicates (cosine
+    similarity to a picked document of at least dedup_threshold) and documents
+    that no longer fit the token budget. vectors are the L2-normalized
+    embeddings of docs. The most relevant document is always returned, even if
+    it alone exceeds the budget.
+    """
+    if not docs:
+        return []
+    relevance = vectors @ query_vector
+    remaining = list(range(len(docs)))
+    selected: List[int] = []
+    tokens_left = token_budget
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = (vectors[remaining] @ vectors[selected].T).max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = int(np.argmax(scores))
+        index = remaining.pop(best)
+        if redundancy[best] >= dedup_threshold:
+            continue
+        tokens = count(docs[index].page_content)
+        if tokens_left is not None and tokens > tokens_left and selected:
+            continue
+        selected.append(index)
+        if tokens_left is not None:
+            tokens_left -= tokens
+    return [docs[i] for i in selected]
+
+
+def retrieve(db, embedder, query: str, k: int = 4, token_budget: Optional[int] = None,
+             mmr_lambda: Optional[float] = None, dedup_threshold: Optional[float] = None,
+             fetch_k: int = DEFAULT_FETCH_K) -> List:
+    """select_context over the fetch_k nearest neighbours of query in a FAISS vectorstore."""
+    query_vector = np.asarray(embedder.embed_query(query), dtype=np.float32)
+    _, indices = db.index.search(query_vector[None, :], max(fetch_k, k))
+    indices = [int(i) for i in indices[0] if i != -1]
+    docs = [db.docstore.search(db.index_to_docstore_id[i]) for i in indices]
+    vectors = np.stack([db.index.reconstruct(i) for i in indices]) if indices else np.zeros((0, len(query_vector)))
+    return select_context(
+        query_vector, docs, vectors, k, token_budget,
+        DEFAULT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda,
+        DEFAULT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold,
+    )
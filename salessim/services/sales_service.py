@@ -3,19 +3,22 @@
 import os
 import json
 import logging
-from typing import List, Dict, Any
+import argparse
+from typing import List, Dict, Any, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
 import uvicorn
 from nltk.tokenize import sent_tokenize
-from sentence_transformers import SentenceTransformer, util
 
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import FAISS
 from salessim.services.constants import Document
+from salessim.services.embedders import create_embedder, cos_sim, DEFAULT_MODEL_NAME, EMBEDDING_BACKENDS
+from salessim.services.text_matching import CatalogMatcher
+from salessim.services.retrieval import chunk_guides, retrieve, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+from salessim.services.index_builder import index_key, load_or_build_index, DEFAULT_CACHE_DIR
+from salessim.services import wire
+from common.tracing import configure_from_env, flush_spans, remote_span
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +28,13 @@ logger = logging.getLogger(__name__)
 class SearchRequest(BaseModel):
     query: str
     k: int = 4
+    # Budgeted retrieval (MMR and near-duplicate suppression) when any of these is set
+    token_budget: Optional[int] = None
+    mmr_lambda: Optional[float] = None
+    dedup_threshold: Optional[float] = None
+
+    def budgeted(self) -> bool:
+        return any(v is not None for v in (self.token_budget, self.mmr_lambda, self.dedup_threshold))
 
 class DocumentResponse(BaseModel):
     page_content: str
@@ -35,117 +45,172 @@ class RecommendedItemsRequest(BaseModel):
     response: str  # Sales agent response text
     sim_threshold: float = 0.70
 
+def product_data_files(datapath="data/products/"):
+    return [datapath+d for d in sorted(os.listdir(datapath))]
+
+def load_product_documents(datapath="data/products/"):
+    """Build one document per catalog product from the JSON files in datapath."""
+    names = product_data_files(datapath)
+    products = []
+    for fpath in names:
+        logger.info(f"Processing {fpath}")
+        with open(fpath, 'r') as f:
+            data = json.load(f)
+            for k,values in data.items():
+                for v in values:
+                    v['category'] = k
+                    v['price_float'] = float(v['price'].replace('$','').replace(',',''))
+                    products.append(v)
+
+    docs = []
+    for i, product in enumerate(products):
+        title = product['name'].strip()
+        price = product['price'].strip()
+        weight = product.get('weight', 'N/A').strip()
+        description = product['description']
+        feature = ', '.join(product['features'])
+        product_doc = f"{title}\nPrice: {price}\nWeight: {weight}\n{description}\n{feature}"
+        contents = f"Name: {title}\nPrice: {price}\nWeight: {weight}\nDescription: {description}\nFeatures: {feature}"
+        docs.append(Document(
+            page_content=product_doc,
+            metadata={'title': title, 'id': str(i), 'contents': contents}))
+    logger.info(f"Processed {len(docs)} docs")
+    return docs
+
+GUIDES_FILE = 'data/guides.json'
+
+def load_guide_documents(file_path=GUIDES_FILE, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+    """Split the buying guides into newline-separated chunks."""
+    with open(file_path, 'r') as f:
+        guides = json.load(f)
+    logger.info(f"Loaded {len(guides)} buying guides")
+
+    docs = chunk_guides(guides, chunk_size, chunk_overlap)
+    logger.info(f"Processed {len(docs)} docs (chunk size {chunk_size}, overlap {chunk_overlap})")
+    return docs
+
 class ProductLookupModule:
-    def __init__(self, verbose=False):
-        index_name = "products_faiss_index"
-        model_name = "sentence-transformers/all-mpnet-base-v2"
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
-
-        # Initialize embedder for similarity calculations
-        self.embedder = SentenceTransformer(model_name)
-
-        if os.path.isdir(index_name):
-            logger.info(f"Loading local {index_name}")
-            self.db = FAISS.load_local(index_name, embeddings)
-        else:
-            datapath = "data/products/"
-            names = [datapath+d for d in os.listdir(datapath)]
-            products = []
-            for fpath in names:
-                logger.info(f"Processing {fpath}")
-                with open(fpath, 'r') as f:
-                    data = json.load(f)
-                    for k,values in data.items():
-                        for v in values:
-                            v['category'] = k
-                            v['price_float'] = float(v['price'].replace('$','').replace(',',''))
-                            products.append(v)
-
-            docs = []
-            for i, product in enumerate(products):
-                title = product['name'].strip()
-                price = product['price'].strip()
-                weight = product.get('weight', 'N/A').strip()
-                description = product['description']
-                feature = ', '.join(product['features'])
-                product_doc = f"{title}\nPrice: {price}\nWeight: {weight}\n{description}\n{feature}"
-                contents = f"Name: {title}\nPrice: {price}\nWeight: {weight}\nDescription: {description}\nFeatures: {feature}"
-                docs.append(DocumentResponse(
-                    page_content=product_doc,
-                    metadata={'title': title, 'id': str(i), 'contents': contents}))
-            logger.info(f"Processed {len(docs)} docs")
-
-            self.db = FAISS.from_documents(docs, embeddings) 
-            self.db.save_local(index_name)
-        logger.info("Loaded product db")
+    def __init__(self, verbose=False, embedder=None):
+        backend = service_config["embedding_backend"]
+
+        # Shared embedder for the vectorstore and similarity calculations
+        self.embedder = embedder or create_embedder(backend, service_config["embedding_model"])
+
+        docs = load_product_documents()
+        self.db = load_or_build_index(
+            "products", docs, self.embedder, backend, service_config["embedding_model"],
+            data_files=product_data_files(), cache_dir=service_config["index_cache_dir"],
+        )
+        logger.info(f"Loaded product db ({backend} embeddings)")
+
+        # Catalog ids for the v2 protocol; the version changes whenever the catalog does
+        self.docs_by_id = {doc.metadata['id']: doc for doc in docs}
+        self.catalog_version = index_key("products", backend, service_config["embedding_model"], docs)
+
+        # Lexical matcher over catalog titles and aliases, compiled once
+        self.lexical_fast_path = service_config["lexical_fast_path"]
+        self.matcher = CatalogMatcher([doc.metadata['title'] for doc in docs])
+        self.match_stats = {"sentences": 0, "lexical": 0, "embedding": 0}
 
     def _filter_similarity_candidates_to_sentences(self, candidates, sentence, sim_threshold):
-        query_embedding = self.embedder.encode(sentence.lower(), convert_to_tensor=True)
+        query_embedding = self.embedder.encode(sentence.lower())
         final_rec_items = []
         for item in candidates:
             candidate = item.metadata["title"].lower()
             if candidate in sentence:
-                final_rec_items.append((1.0, item))
+                final_rec_items.append((item, 1.0))
                 continue
-            candidate_embedding = self.embedder.encode(candidate, convert_to_tensor=True)
-            cos_scores = util.cos_sim(query_embedding, candidate_embedding)[0]
+            candidate_embedding = self.embedder.encode(candidate)
+            cos_scores = cos_sim(query_embedding, candidate_embedding)[0]
             sim_score = cos_scores.max().item()
             logging.info(f"{sim_score}: {candidate}")
             if sim_score > sim_threshold:
                 logging.info(f"{candidate} was recommended.")
-                final_rec_items.append((sim_score, item))
-        recommended_items = [item for sim_score, item in sorted(final_rec_items)]
-        return recommended_items
+                final_rec_items.append((item, sim_score))
+        return sorted(final_rec_items, key=lambda pair: pair[1])
 
     def find_recommended_items_in_response(self, candidates, response, sim_threshold=0.70):
+        return [item for item, _ in self.find_scored_recommended_items(candidates, response, sim_threshold)]
+
+    def find_scored_recommended_items(self, candidates, response, sim_threshold=0.70):
+        """Recommended items with their match score (1.0 for a lexical or verbatim title match)."""
         sentences = sent_tokenize(response.lower())
+        candidates_by_title = {}
+        for item in candidates:
+            candidates_by_title.setdefault(item.metadata["title"], item)
+
         recommended_items = []
         recommended_titles = set()
         for sentence in sentences:
-            mentioned_items = self._filter_similarity_candidates_to_sentences(candidates, sentence, sim_threshold)
-            for item in mentioned_items:
+            self.match_stats["sentences"] += 1
+            matched_titles = self.matcher.match(sentence, candidates_by_title) if self.lexical_fast_path else set()
+            if matched_titles:
+                # Fast path: the sentence names catalog products, no embeddings needed
+                self.match_stats["lexical"] += 1
+                mentioned_items = [(candidates_by_title[title], 1.0) for title in sorted(matched_titles)]
+            else:
+                self.match_stats["embedding"] += 1
+                mentioned_items = self._filter_similarity_candidates_to_sentences(candidates, sentence, sim_threshold)
+            for item, score in mentioned_items:
                 if item.metadata["title"] in recommended_titles:
                     continue
                 else:
-                    recommended_items.append(item)
+                    recommended_items.append((item, score))
                     recommended_titles.add(item.metadata["title"])
         return recommended_items
-    
+
+    def get_match_stats(self):
+        """Share of sentences resolved by the lexical fast path."""
+        total = self.match_stats["sentences"]
+        return {
+            **self.match_stats,
+            "lexical_fraction": self.match_stats["lexical"] / total if total else 0.0,
+        }
+
     def top_docs(self, query: str, k: int = 4):
         top_documents = self.db.similarity_search(query, k=k)
         return top_documents
 
+    def search(self, request: SearchRequest):
+        if request.budgeted():
+            return retrieve(self.db, self.embedder, request.query, request.k, request.token_budget,
+                            request.mmr_lambda, request.dedup_threshold)
+        return self.top_docs(request.query, request.k)
+
 class SearchBuyingGuide:
-    def __init__(self, verbose=False):
-        index_name = "guides_faiss_index"
-        model_name = "sentence-transformers/all-mpnet-base-v2"
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
-
-        if os.path.isdir(index_name):
-            logger.info("Loading local faiss index")
-            self.db = FAISS.load_local(index_name, embeddings)
-        else:
-            file_path = 'data/guides.json'
-            guides = {}
-            with open(file_path, 'r') as f:
-                guides = json.load(f)
-            logger.info(f"Loaded {len(guides)} buying guides")
-
-            text_splitter = CharacterTextSplitter(separator="\n")
-            docs = []
-            for name, guide in guides.items():
-                text = text_splitter.split_text(guide)
-                docs.extend([Document(page_content=t, metadata={'title': name}) for t in text])
-            logger.info(f"Processed {len(docs)} docs")
-
-            self.db = FAISS.from_documents(docs, embeddings)
-            self.db.save_local(index_name)
-        logger.info("Loaded knowledge db")
+    def __init__(self, verbose=False, embedder=None):
+        backend = service_config["embedding_backend"]
+        chunk_size, chunk_overlap = service_config["guide_chunk_size"], service_config["guide_chunk_overlap"]
+        self.embedder = embedder or create_embedder(backend, service_config["embedding_model"])
+
+        docs = load_guide_documents(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.db = load_or_build_index(
+            "guides", docs, self.embedder, backend, service_config["embedding_model"],
+            data_files=[GUIDES_FILE], cache_dir=service_config["index_cache_dir"],
+            settings={"chunk_size": chunk_size, "chunk_overlap": chunk_overlap},
+        )
+        logger.info(f"Loaded knowledge db ({backend} embeddings)")
 
     def top_docs(self, query: str, k: int = 4):
         top_documents = self.db.similarity_search(query, k=k)
         return top_documents
 
+    def search(self, request: SearchRequest):
+        if request.budgeted():
+            return retrieve(self.db, self.embedder, request.query, request.k, request.token_budget,
+                            request.mmr_lambda, request.dedup_threshold)
+        return self.top_docs(request.query, request.k)
+
+# Service configuration, overridable from the command line
+service_config = {
+    "embedding_backend": os.environ.get("SALESSIM_EMBEDDING_BACKEND", "torch"),
+    "embedding_model": DEFAULT_MODEL_NAME,
+    "lexical_fast_path": True,
+    "guide_chunk_size": DEFAULT_CHUNK_SIZE,
+    "guide_chunk_overlap": DEFAULT_CHUNK_OVERLAP,
+    "index_cache_dir": DEFAULT_CACHE_DIR,
+}
+
 # Service state
 service_state = {
     "product_lookup_module": None,
@@ -156,20 +221,33 @@ service_state = {
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Lookup Service...")
-    service_state["product_lookup_module"] = ProductLookupModule()
-    service_state["buying_guide_module"] = SearchBuyingGuide()
+    configure_from_env("lookup_service")
+    embedder = create_embedder(service_config["embedding_backend"], service_config["embedding_model"])
+    service_state["product_lookup_module"] = ProductLookupModule(embedder=embedder)
+    service_state["buying_guide_module"] = SearchBuyingGuide(embedder=embedder)
     logger.info("Lookup Service started successfully")
     yield
     # Shutdown
     logger.info("Shutting down Lookup Service...")
+    if service_state["product_lookup_module"] is not None:
+        logger.info(f"Recommended item matching: {service_state['product_lookup_module'].get_match_stats()}")
     service_state["product_lookup_module"] = None
     service_state["buying_guide_module"] = None
+    flush_spans()
 
 app = FastAPI(title="Lookup Service", lifespan=lifespan)
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Route spans join the caller's trace through the traceparent header
+    if request.url.path == "/health":
+        return await call_next(request)
+    with remote_span(f"lookup {request.url.path}", request.headers, "lookup"):
+        return await call_next(request)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "lookup_service"}
+    return {"status": "healthy", "service": "lookup_service", "protocol_versions": [1, wire.PROTOCOL_VERSION]}
 
 @app.post("/products/search", response_model=List[DocumentResponse])
 async def search_products(request: SearchRequest):
@@ -177,7 +255,7 @@ async def search_products(request: SearchRequest):
         raise HTTPException(status_code=503, detail="Product lookup service not initialized")
 
     try:
-        docs = service_state["product_lookup_module"].top_docs(request.query, request.k)
+        docs = service_state["product_lookup_module"].search(request)
         return [
             DocumentResponse(
                 page_content=doc.page_content,
@@ -194,7 +272,7 @@ async def search_buying_guides(request: SearchRequest):
         raise HTTPException(status_code=503, detail="Buying guide service not initialized")
 
     try:
-        docs = service_state["buying_guide_module"].top_docs(request.query, request.k)
+        docs = service_state["buying_guide_module"].search(request)
         return [
             DocumentResponse(
                 page_content=doc.page_content,
@@ -205,6 +283,12 @@ async def search_buying_guides(request: SearchRequest):
         logger.error(f"Buying guide search error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/sales/match_stats")
+async def match_stats():
+    if service_state["product_lookup_module"] is None:
+        raise HTTPException(status_code=503, detail="Product lookup service not initialized")
+    return service_state["product_lookup_module"].get_match_stats()
+
 @app.post("/sales/find_recommended_items", response_model=List[DocumentResponse])
 async def find_recommended_items_endpoint(request: RecommendedItemsRequest):
     if service_state["product_lookup_module"] is None:
@@ -237,5 +321,82 @@ async def find_recommended_items_endpoint(request: RecommendedItemsRequest):
         logger.error(f"Find recommended items error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Protocol v2: catalog ids instead of full documents, msgpack or JSON bodies
+
+async def read_wire(request: Request) -> dict:
+    try:
+        return wire.decode(await request.body(), request.headers.get("content-type", wire.JSON))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Malformed request body: {e}")
+
+def wire_response(request: Request, payload: dict) -> Response:
+    content_type = wire.response_content_type(request.headers.get("accept", ""))
+    payload = {"version": wire.PROTOCOL_VERSION, **payload}
+    return Response(content=wire.encode(payload, content_type), media_type=content_type)
+
+def product_module_v2():
+    if service_state["product_lookup_module"] is None:
+        raise HTTPException(status_code=503, detail="Product lookup service not initialized")
+    return service_state["product_lookup_module"]
+
+@app.post("/v2/products/search")
+async def search_products_v2(request: Request):
+    module = product_module_v2()
+    search = SearchRequest(**await read_wire(request))
+    docs = module.search(search)
+    return wire_response(request, {
+        "catalog": module.catalog_version,
+        "ids": [doc.metadata["id"] for doc in docs],
+    })
+
+@app.post("/v2/products/fetch")
+async def fetch_products_v2(request: Request):
+    module = product_module_v2()
+    ids = (await read_wire(request)).get("ids", [])
+    unknown = [i for i in ids if i not in module.docs_by_id]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown product ids: {unknown[:10]}")
+    return wire_response(request, {
+        "catalog": module.catalog_version,
+        "items": [{"id": i, "page_content": module.docs_by_id[i].page_content,
+                   "metadata": module.docs_by_id[i].metadata} for i in ids],
+    })
+
+@app.post("/v2/sales/find_recommended_items")
+async def find_recommended_items_v2(request: Request):
+    module = product_module_v2()
+    body = await read_wire(request)
+    candidates = [module.docs_by_id[i] for i in body.get("candidate_ids", []) if i in module.docs_by_id]
+    try:
+        scored = module.find_scored_recommended_items(candidates, body.get("response", ""), body.get("sim_threshold", 0.70))
+    except Exception as e:
+        logger.error(f"Find recommended items error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return wire_response(request, {
+        "catalog": module.catalog_version,
+        "items": [{"id": item.metadata["id"], "score": float(score)} for item, score in scored],
+    })
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8001, log_level="info")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Lookup service for products and buying guides')
+    parser.add_argument('--port', type=int, default=8001, help='Port to serve on (default: 8001)')
+    parser.add_argument('--embedding-backend', choices=EMBEDDING_BACKENDS, default=service_config["embedding_backend"],
+                        help='Embedding backend for queries and indexes (default: torch)')
+    parser.add_argument('--embedding-model', default=service_config["embedding_model"],
+                        help='sentence-transformers model name')
+    parser.add_argument('--no-lexical-fast-path', action='store_true',
+                        help='Always use embeddings to detect recommended items')
+    parser.add_argument('--guide-chunk-size', type=int, default=service_config["guide_chunk_size"],
+                        help=f'Maximum characters per buying guide chunk (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--guide-chunk-overlap', type=int, default=service_config["guide_chunk_overlap"],
+                        help=f'Characters shared by consecutive guide chunks (default: {DEFAULT_CHUNK_OVERLAP})')
+    parser.add_argument('--index-cache-dir', default=service_config["index_cache_dir"],
+                        help=f'Content-addressed index cache directory (default: {DEFAULT_CACHE_DIR})')
+    args = parser.parse_args()
+    service_config["index_cache_dir"] = args.index_cache_dir
+    service_config["guide_chunk_size"] = args.guide_chunk_size
+    service_config["guide_chunk_overlap"] = args.guide_chunk_overlap
+    service_config["lexical_fast_path"] = not args.no_lexical_fast_path
+    service_config["embedding_backend"] = args.embedding_backend
+    service_config["embedding_model"] = args.embedding_model
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="info")
\ No newline at end of file
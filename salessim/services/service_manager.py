@@ -12,8 +12,10 @@ logger = logging.getLogger(__name__)
 class ServiceManager:
     """Manages the lifecycle of microservices"""
 
-    def __init__(self):
+    def __init__(self, service_args: Optional[Dict[str, List[str]]] = None):
         self.services: Dict[str, subprocess.Popen] = {}
+        # Extra command-line arguments passed to each service script
+        self.service_args = service_args or {}
         self.service_configs = {
             "lookup_service": {
                 "script": "salessim/services/sales_service.py",
@@ -38,7 +40,8 @@ class ServiceManager:
             stdout_file = open(f"{service_name}_stdout.log", "a")
             stderr_file = open(f"{service_name}_stderr.log", "a")
             process = subprocess.Popen([
-                "python3", "-m", config["script"].replace("/", ".").replace(".py", "")
+                "python3", "-m", config["script"].replace("/", ".").replace(".py", ""),
+                *self.service_args.get(service_name, [])
             ], stdout=stdout_file, stderr=stderr_file)
 
             self.services[service_name] = process
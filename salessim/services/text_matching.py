@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Lexical matching of catalog product mentions in salesperson responses.
+
+``CatalogMatcher`` compiles every normalized product title and its derived
+aliases into a single Aho-Corasick automaton, so one pass over a sentence
+finds every exact mention. Sentences without an exact mention fall back to
+token-set fuzzy matching before callers resort to embeddings.
+"""
+
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+_NON_ALNUM = re.compile(r"[^a-z0-9.]+")
+# Title segments that describe a finish rather than identify a product
+_FINISH_WORDS = {"finish", "silver", "black", "gray", "grey", "gold", "blue", "green", "white", "platinum"}
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation (keeping decimals like 17.3) and collapse whitespace."""
+    tokens = _NON_ALNUM.sub(" ", text.lower()).split()
+    return " ".join(t.strip(".") for t in tokens if t.strip("."))
+
+
+def title_aliases(title: str) -> List[str]:
+    """Derive shorter ways a salesperson might refer to a catalog title.
+
+    Titles look like ``HP - 17.3" Laptop - AMD Ryzen 5 - 8GB Memory - 512GB SSD - Natural Silver``.
+    Aliases are the title without its finish segment and the brand plus model segment.
+    """
+    segments = [s.strip() for s in title.split(" - ") if s.strip()]
+    aliases = []
+    if len(segments) > 2 and set(normalize_text(segments[-1]).split()) & _FINISH_WORDS:
+        aliases.append(" ".join(segments[:-1]))
+    if len(segments) >= 2:
+        aliases.append(" ".join(segments[:2]))
+    return [normalize_text(a) for a in aliases]
+
+
+class AhoCorasick:
+    """Minimal Aho-Corasick automaton over normalized, space-delimited patterns."""
+
+    def __init__(self, patterns: Dict[str, Set[str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Set[str]] = [set()]
+        for pattern, keys in patterns.items():
+            self._add(f" {pattern} ", keys)
+        self._build()
+
+    def _add(self, pattern: str, keys: Iterable[str]):
+        state = 0
+        for ch in pattern:
+            if ch not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+                self.goto[state][ch] = len(self.goto) - 1
+            state = self.goto[state][ch]
+        self.output[state].update(keys)
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                # Depth-one states fail back to the root
+                self.fail[child] = target if target != child else 0
+                self.output[child] |= self.output[self.fail[child]]
+
+    def search(self, text: str) -> Set[str]:
+        """Return the keys of every pattern occurring in normalized text."""
+        found = set()
+        state = 0
+        for ch in f" {text} ":
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            found |= self.output[state]
+        return found
+
+
+class CatalogMatcher:
+    """Finds catalog titles mentioned in a sentence, keyed by the original title."""
+
+    def __init__(self, titles: Iterable[str], fuzzy_threshold: float = 0.85):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.title_tokens: Dict[str, Set[str]] = {}
+        patterns: Dict[str, Set[str]] = {}
+        alias_owners: Dict[str, Set[str]] = {}
+
+        for title in titles:
+            normalized = normalize_text(title)
+            self.title_tokens[title] = set(normalized.split())
+            patterns.setdefault(normalized, set()).add(title)
+            for alias in title_aliases(title):
+                alias_owners.setdefault(alias, set()).add(title)
+
+        # Only keep aliases that identify a single product
+        for alias, owners in alias_owners.items():
+            if len(owners) == 1:
+                patterns.setdefault(alias, set()).update(owners)
+
+        self.automaton = AhoCorasick(patterns)
+
+    def exact_matches(self, sentence: str) -> Set[str]:
+        return self.automaton.search(normalize_text(sentence))
+
+    def fuzzy_matches(self, sentence: str, titles: Iterable[str]) -> Set[str]:
+        """Token-set match: most of a title's tokens appear in the sentence."""
+        sentence_tokens = set(normalize_text(sentence).split())
+        matches = set()
+        for title in titles:
+            tokens = self.title_tokens.get(title) or set(normalize_text(title).split())
+            if tokens and len(tokens & sentence_tokens) / len(tokens) >= self.fuzzy_threshold:
+                matches.add(title)
+        return matches
+
+    def match(self, sentence: str, titles: Iterable[str]) -> Set[str]:
+        """Titles (restricted to ``titles``) lexically mentioned in the sentence."""
+        titles = set(titles)
+        exact = self.exact_matches(sentence) & titles
+        if exact:
+            return exact
+        return self.fuzzy_matches(sentence, titles)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Compact wire encoding for the lookup service's v2 protocol.
+
+Version 2 routes (under /v2) exchange catalog product ids instead of full
+documents: product searches return ids, and recommended-item detection takes
+candidate ids and returns ids with match scores. Clients resolve ids against
+a catalog cache that is filled from /v2/products/fetch and invalidated when
+the service reports a different catalog version.
+
+Bodies are msgpack when the msgpack package is installed on both sides (the
+client asks for it with Content-Type and Accept headers), and JSON otherwise.
+JSON is encoded with orjson when available.
+"""
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PROTOCOL_VERSION = 2
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+
+
+def preferred_content_type() -> str:
+    return MSGPACK if msgpack is not None else JSON
+
+
+def response_content_type(accept: str) -> str:
+    """The content type to answer with, given a request's Accept header."""
+    return MSGPACK if msgpack is not None and MSGPACK in (accept or "") else JSON
+
+
+def encode(payload, content_type: str) -> bytes:
+    if content_type == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def decode(body: bytes, content_type: str):
+    if (content_type or "").startswith(MSGPACK):
+        return msgpack.unpackb(body, raw=False)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
@@ -5,14 +5,24 @@ import asyncio
 import yaml
 import logging
 import os
+import sys
 import json
 from simulation_utils import (
     enrich_results_with_ideal_recommendations,
     load_scenarios_from_yaml,
+    merge_shard_results,
+    parse_shard,
+    plan_scenarios,
     save_results,
+    save_shard_manifest,
     run_batch_simulations
 )
+from parallel_driver import run_multiprocess_simulations
 from services.service_manager import ServiceManager
+from services.http_clients import LookupServiceClient
+from common.results_store import RESULTS_STORE_DIR, LEGACY_RESULTS_FILE
+from common.run_metrics import ConsolePanel, MetricsServer, run_metrics
+from common.tracing import TRACE_FILE, TRACE_SPANS_DIR, enable_tracing, flush_spans, merge_traces
 
 async def cancel_all_tasks():
     # Get all tasks running in the current event loop
@@ -83,27 +93,62 @@ def extract_client_config(model_config):
     model_params = {}
 
     for key, value in model_config.items():
-        if key in ['api_key', 'organization', 'base_url', 'custom_api_key', 'custom_api_key_env', 'extra_headers']:
+        if key in ['api_key', 'organization', 'base_url', 'custom_api_key', 'custom_api_key_env', 'extra_headers',
+                   'max_attempts', 'hedge']:
             if value is not None:
                 client_config[key] = value
-        elif key in ['model_name', 'temperature', 'max_tokens']:
+        elif key in ['model_name', 'temperature', 'max_tokens', 'stop_sequences', 'stream', 'prefetch',
+                     'prefetch_match_threshold', 'context_budget', 'tokenizer', 'context_keep_recent',
+                     'retrieval_token_budget', 'retrieval_mmr_lambda', 'retrieval_dedup_threshold']:
             model_params[key] = value
 
     return client_config, model_params
 
+def extract_lookup_service_args(config):
+    """Build lookup service command-line arguments from the optional lookup_service config section."""
+    lookup_config = config.get('lookup_service') or {}
+    service_args = []
+    if lookup_config.get('embedding_backend'):
+        service_args.extend(['--embedding-backend', lookup_config['embedding_backend']])
+    if lookup_config.get('embedding_model'):
+        service_args.extend(['--embedding-model', lookup_config['embedding_model']])
+    if lookup_config.get('guide_chunk_size'):
+        service_args.extend(['--guide-chunk-size', str(lookup_config['guide_chunk_size'])])
+    if lookup_config.get('guide_chunk_overlap') is not None:
+        service_args.extend(['--guide-chunk-overlap', str(lookup_config['guide_chunk_overlap'])])
+    return service_args
+
 
 async def main():
-    service_manager = ServiceManager()
     parser = argparse.ArgumentParser(description='Run salesbot-shopperbot simulations')
     parser.add_argument('--config', type=str, required=True,
                        help='Path to YAML configuration file')
     parser.add_argument('--save', type=str, required=True,
                        help='Save results to specified JSON file')
 
+    parser.add_argument('--shard', type=str, default=None,
+                       help='Run only shard i of N of the expanded scenarios, given as i/N (e.g. 0/4)')
+
+    parser.add_argument('--results-format', choices=['store', 'json'], default='store',
+                       help='Save results as a compressed JSONL store (default) or a legacy results.json')
+
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of simulation worker processes, each with its own event loop (default: 1)')
+
+    parser.add_argument('--trace', action='store_true',
+                       help='Record per-turn spans from the simulation and lookup service into {save}/trace.json')
+
+    parser.add_argument('--metrics-port', type=int, default=None,
+                       help='Serve live run metrics in Prometheus text format on http://127.0.0.1:PORT/metrics')
+
+    parser.add_argument('--progress-interval', type=float, default=30,
+                       help='Seconds between console progress panels; 0 disables them (default: 30)')
+
     parser.add_argument('--list-model-examples', action='store_true',
                        help='Show examples of supported model formats and exit')
 
     arguments = parser.parse_args()
+    shard = parse_shard(arguments.shard) if arguments.shard else None
     if arguments.list_model_examples:
         print("Supported model formats:")
         print("  OpenAI: gpt-4-turbo, gpt-4, gpt-3.5-turbo")
@@ -117,6 +162,7 @@ async def main():
 
     config = load_config_from_yaml(arguments.config)
     validate_config(config)
+    service_manager = ServiceManager(service_args={"lookup_service": extract_lookup_service_args(config)})
     ai_customer_model_config = config.get('ai_customer_model', {})
     sales_agent_model_config = config.get('sales_agent_model', {})
 
@@ -130,6 +176,11 @@ async def main():
     if scenarios_path:
         scenarios_config = load_scenarios_from_yaml(scenarios_path)
 
+    if arguments.trace:
+        # Set before the services and workers start so they record spans too, into a
+        # directory cleared of an earlier run's span files
+        enable_tracing(os.path.join(arguments.save, TRACE_SPANS_DIR), process_name="simulate", clear=True)
+
     # Start services before running simulations
     print("Starting services...")
     if not await service_manager.start_all_services():
@@ -137,27 +188,62 @@ async def main():
         return
     print("All services started successfully.")
 
+    run_metrics.reset()
+    metrics_server = MetricsServer(run_metrics, arguments.metrics_port).start() if arguments.metrics_port else None
+    if metrics_server:
+        print(f"Serving run metrics at {metrics_server.url}")
+    panel = None
+    if arguments.progress_interval > 0:
+        # A fork group plays one conversation per branch
+        num_scenarios = sum(len(s.get("branches", [s])) for s in plan_scenarios(scenarios_config, shard))
+        panel = ConsolePanel(run_metrics, arguments.progress_interval, total=num_scenarios).start()
+
     try:
-        results = await run_batch_simulations(
+        simulation_kwargs = dict(
             max_turns=max_turns,
             scenarios_config=scenarios_config,
             customer_model_config=customer_model_params,
             salesbot_model_config=salesbot_model_config,
             customer_client_config=customer_client_config,
             salesbot_client_config=salesbot_client_config,
+            shard=shard,
         )
+        if arguments.workers > 1:
+            results = await asyncio.to_thread(run_multiprocess_simulations, num_workers=arguments.workers, **simulation_kwargs)
+        else:
+            results = await run_batch_simulations(**simulation_kwargs)
     except Exception as e:
         print(f"Error during simulation: {e}")
         raise e
     finally:
+        if panel:
+            panel.stop()
+        if metrics_server:
+            metrics_server.stop()
+        lookup_client = LookupServiceClient()
+        match_stats = await lookup_client.get_match_stats()
+        await lookup_client.close()
+        if match_stats:
+            print(f"Recommended item detection: {match_stats['lexical']}/{match_stats['sentences']} sentences "
+                  f"resolved lexically ({match_stats['lexical_fraction']*100:.1f}%)")
+
         # Always stop services, even if simulation fails
         print("Stopping services...")
         await service_manager.stop_all_services()
         print("Services stopped.")
+        if arguments.trace:
+            flush_spans()
+            trace_path = os.path.join(arguments.save, TRACE_FILE)
+            num_spans = merge_traces(os.path.join(arguments.save, TRACE_SPANS_DIR), trace_path)
+            print(f"Wrote {num_spans} spans to {trace_path} (summary: python3 -m common.tracing summary {trace_path})")
         if arguments.save and results:
             os.makedirs(arguments.save, exist_ok=True)
-            results = enrich_results_with_ideal_recommendations(results)
-            save_results(results, os.path.join(arguments.save, "results.json"))
+            product = (scenarios_config or {}).get('product', 'laptop')
+            results = enrich_results_with_ideal_recommendations(results, product)
+            results_name = RESULTS_STORE_DIR if arguments.results_format == 'store' else LEGACY_RESULTS_FILE
+            save_results(results, os.path.join(arguments.save, results_name))
+            if shard is not None:
+                save_shard_manifest(arguments.save, shard, plan_scenarios(scenarios_config, shard))
             config_save_path = os.path.join(arguments.save, "config.json")
             with open(config_save_path, "w") as f:
                 json.dump(config, f, indent=2)
@@ -188,5 +274,23 @@ async def main():
 
         await cancel_all_tasks() # LiteLLM has issues with closing async loggerworker. 
 
+def merge_main():
+    parser = argparse.ArgumentParser(prog='simulate.py merge', description='Merge sharded simulation outputs into one set of results')
+    parser.add_argument('shard_dirs', nargs='+', help='Output directories of the shard runs')
+    parser.add_argument('--output', type=str, required=True, help='Directory to write the merged results')
+    parser.add_argument('--results-format', choices=['store', 'json'], default='store',
+                       help='Save merged results as a compressed JSONL store (default) or a legacy results.json')
+    arguments = parser.parse_args(sys.argv[2:])
+
+    results_name = RESULTS_STORE_DIR if arguments.results_format == 'store' else LEGACY_RESULTS_FILE
+    report = merge_shard_results(arguments.shard_dirs, arguments.output, results_name)
+    with open(os.path.join(arguments.output, "merge_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    if report["missing_shards"]:
+        sys.exit(1)
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        merge_main()
+    else:
+        asyncio.run(main())
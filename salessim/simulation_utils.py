@@ -5,13 +5,23 @@ import yaml
 import asyncio
 import traceback
 import uuid
-from itertools import product
+import hashlib
+import os
+import copy
+from dataclasses import dataclass, field
+from itertools import islice
 from datetime import datetime
+from typing import List, Optional
 import tqdm
 from salessim.agents.sales_agent.sales_agent import SalesAgent
-from salessim.agents.ai_customer.ai_customer import load_personas, CustomerSimulator
+from salessim.agents.ai_customer.ai_customer import get_persona_registry, CustomerSimulator
 from common.ai_client import create_client_from_model_name
 from common.bcolors import bcolors
+from common.results_store import iter_results, write_results_store
+from common.run_metrics import run_metrics
+from common.tracing import span, traced
+from salessim.ideal_recommendations import load_ideal_recommendations
+from salessim.scenario_designs import design_combinations
 
 
 
@@ -22,12 +32,17 @@ def load_scenarios_from_yaml(yaml_file):
 
 
 def generate_scenario_combinations(scenario_config):
-    """Generate all unique combinations for a scenario based on Big 5 filters."""
+    """
+    Lazily yield the unique combinations for a scenario based on Big 5 filters.
+    The optional design, design_budget and design_seed keys select which
+    combinations are generated (see scenario_designs); the default is the full factorial.
+    """
     big_5_specifications = scenario_config.get('big_5_specification', {})
 
     if not big_5_specifications:
         print(f"{bcolors.WARNING}WARNING: Big 5 specifications are empty. Check your scenarios config.")
-        return [scenario_config]
+        yield scenario_config
+        return
 
     # Get all trait combinations
     trait_keys = list(big_5_specifications.keys())
@@ -40,135 +55,351 @@ def generate_scenario_combinations(scenario_config):
         else:
             trait_values.append(values)
 
-    # Generate all combinations
-    combinations = list(product(*trait_values))
+    combinations = design_combinations(
+        trait_values,
+        design=scenario_config.get('design', 'full_factorial'),
+        budget=scenario_config.get('design_budget'),
+        seed=scenario_config.get('design_seed', 0),
+    )
 
-    scenarios = []
     for combo in combinations:
         scenario = scenario_config.copy()
         scenario['big_5_specification'] = dict(zip(trait_keys, combo))
-        scenarios.append(scenario)
+        yield scenario
 
-    return scenarios
 
+def get_scenario_id(unique_scenario, rollout_index, occurrence=0):
+    """Stable id for one rollout of a unique scenario, identical on every host."""
+    key = {
+        "persona": unique_scenario.get("persona"),
+        "big_5_specification": unique_scenario.get("big_5_specification", {}),
+        "rollout": rollout_index,
+        "occurrence": occurrence,
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
 
-async def run_simulation(max_turns, shopperbot, salesbot, verbose=True):
-    """
-    Run a simulation with optional shared AI client.
-    """
+
+def expand_scenarios(scenarios_config):
+    """Lazily expand the scenarios config into one entry per rollout, each with a stable scenario_id."""
+    seen = {}
+    for scenario_config in scenarios_config['scenarios']:
+        num_rollouts = scenario_config.get('num_rollouts_per_unique_scenario', 1)
+
+        fork_turn = scenario_config.get('fork_at_turn')
+
+        for unique_scenario in generate_scenario_combinations(scenario_config):
+            rollouts = []
+            for rollout_index in range(num_rollouts):
+                scenario_id = get_scenario_id(unique_scenario, rollout_index)
+                # Identical scenarios listed twice in the config still get distinct ids
+                occurrence = seen.get(scenario_id, 0)
+                seen[scenario_id] = occurrence + 1
+                if occurrence:
+                    scenario_id = get_scenario_id(unique_scenario, rollout_index, occurrence)
+                rollouts.append({
+                    "scenario_id": scenario_id,
+                    "persona": unique_scenario["persona"],
+                    "big_5_specification": unique_scenario.get('big_5_specification', {}),
+                    "rollout": rollout_index,
+                })
+            if fork_turn and len(rollouts) > 1:
+                # The rollouts share their first fork_turn turns and branch from there
+                yield {**rollouts[0], "fork_at_turn": fork_turn, "branches": rollouts}
+            else:
+                yield from rollouts
+
+
+def parse_shard(shard):
+    """Parse an "i/N" shard spec into (i, N) with 0 <= i < N."""
     try:
-        # Initialize conversation
-        chat_history = []
-        conversation_log = []
-        turn_count = 0
-        outcome = "incomplete"
+        index, count = (int(part) for part in shard.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected the form i/N (e.g. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{shard}', index must satisfy 0 <= i < N")
+    return index, count
+
+
+def shard_scenarios(scenarios, shard_index, num_shards):
+    """Deterministically select this shard's slice of the expanded scenarios by scenario hash."""
+    return (s for s in scenarios if int(s["scenario_id"], 16) % num_shards == shard_index)
+
+
+def plan_scenarios(scenarios_config, shard=None):
+    """Lazily yield the expanded scenarios to run, optionally restricted to one (index, count) shard."""
+    scenarios = expand_scenarios(scenarios_config)
+    if shard is not None:
+        scenarios = shard_scenarios(scenarios, *shard)
+    return scenarios
 
-        # Start with salesbot greeting
-        salesperson_text = "Hello! I'm here to help you find the perfect product. What are you looking for today?"
 
-        conversation_log.append({
+GREETING = "Hello! I'm here to help you find the perfect product. What are you looking for today?"
+
+
+@dataclass
+class ConversationState:
+    """Where a conversation stands between turns."""
+    chat_history: List[str] = field(default_factory=list)
+    conversation_log: List[dict] = field(default_factory=list)
+    turn_count: int = 0
+    outcome: str = "incomplete"
+    error_message: Optional[str] = None
+    salesperson_text: str = GREETING
+
+    @classmethod
+    def start(cls):
+        # Start with salesbot greeting
+        state = cls()
+        state.conversation_log.append({
             "speaker": "Salesperson",
-            "text": salesperson_text,
-            "turn": turn_count
+            "text": state.salesperson_text,
+            "turn": 0
         })
+        return state
+
+
+@dataclass
+class ConversationSnapshot:
+    """A conversation paused at a turn, with the agent state needed to continue it in a fresh pair of agents."""
+    state: ConversationState
+    emotion: str
+    lookups: List[tuple]
+
+    @classmethod
+    def take(cls, state, shopperbot, salesbot):
+        lookups = salesbot.lookup_cache.completed() if salesbot.lookup_cache is not None else []
+        return cls(copy.deepcopy(state), shopperbot.emotion, lookups)
+
+    def restore(self, shopperbot, salesbot) -> ConversationState:
+        """Put the agents in the snapshot's state and return a copy of the conversation to continue."""
+        shopperbot.set_emotion(self.emotion)
+        if salesbot.lookup_cache is not None:
+            for tool, query, result in self.lookups:
+                salesbot.lookup_cache.seed(tool, query, result)
+        return copy.deepcopy(self.state)
+
 
-        # Run conversation simulation
-        while turn_count < max_turns:
-            try:
-                turn_count += 1
+async def advance_conversation(state, max_turns, shopperbot, salesbot, verbose=True, until_turn=None):
+    """
+    Play turns from state until the conversation ends or reaches max_turns, or
+    pause once until_turn turns have been played.
+    """
+    while state.turn_count < max_turns and (until_turn is None or state.turn_count < until_turn):
+        try:
+            state.turn_count += 1
 
+            with span("turn", "simulation", turn=state.turn_count):
                 # Shopperbot responds
                 shopper_response = await shopperbot.async_generate(
-                    input_txt=salesperson_text,
-                    chat_history=chat_history,
+                    input_txt=state.salesperson_text,
+                    chat_history=state.chat_history,
                 )
 
                 shopper_text = shopper_response["text"]
-                chat_history.append(f"Salesperson: {salesperson_text}")
+                state.chat_history.append(f"Salesperson: {state.salesperson_text}")
 
                 if verbose:
                     print(f"{bcolors.OKCYAN}Shopper: {shopper_text}{bcolors.ENDC}")
-                conversation_log.append({
+                state.conversation_log.append({
                     "speaker": "Shopper",
                     "text": shopper_text,
                     "reasoning": shopper_response.get("reasoning", ""),
-                    "turn": turn_count,
-                    "preferences_used": shopper_response.get("preferences", "")
+                    "turn": state.turn_count,
+                    "preferences_used": shopper_response.get("preferences", ""),
+                    "generation_stats": shopper_response.get("generation_stats", {})
                 })
 
 
                 # Check if shopper accepted a recommendation
                 if "[ACCEPT]" in shopper_text:
-                    outcome = "accepted"
+                    state.outcome = "accepted"
                     if verbose:
                         print(f"{bcolors.OKGREEN}Recommendation accepted! Simulation complete.{bcolors.ENDC}")
                     break
 
                 if "[DONE]" in shopper_text:
-                    outcome = "ended_by_shopper"
+                    state.outcome = "ended_by_shopper"
                     if verbose:
                         print(f"{bcolors.WARNING}Shopper ended the conversation.{bcolors.ENDC}")
                     break
 
                 # Salesagent responds
-                sales_response = await salesbot.async_generate(shopper_text, chat_history)
-                chat_history.append(f"Shopper: {shopper_text}")
-                salesperson_text = sales_response["text"]
+                sales_response = await salesbot.async_generate(shopper_text, state.chat_history)
+                state.chat_history.append(f"Shopper: {shopper_text}")
+                state.salesperson_text = sales_response["text"]
 
-                conversation_log.append({
+                state.conversation_log.append({
                     "speaker": "Salesperson",
-                    "text": salesperson_text,
-                    "turn": turn_count,
+                    "text": state.salesperson_text,
+                    "turn": state.turn_count,
                     "reasoning": sales_response.get("reasoning", ""),
                     "knowledge_used": sales_response.get("knowledge", ""),
                     "recommended_items": sales_response.get("recommended_items", []),
-                    "recommended_items_count": len(sales_response.get("recommended_items", []))
+                    "recommended_items_count": len(sales_response.get("recommended_items", [])),
+                    "generation_stats": sales_response.get("generation_stats", {})
                 })
+                if "lookup_cache" in sales_response:
+                    state.conversation_log[-1]["lookup_cache"] = sales_response["lookup_cache"]
+                if "context_budget" in sales_response:
+                    state.conversation_log[-1]["context_budget"] = sales_response["context_budget"]
 
-
-
-            except Exception as e:
-                if verbose:
-                    print(f"{bcolors.FAIL}Error during simulation: {e}{bcolors.ENDC}")
-                    print(traceback.format_exc())
-                outcome = "error"
-                error_message = f"Error during simulation: {traceback.format_exc()}"
-                break
-
-        if turn_count >= max_turns and outcome == "incomplete":
-            outcome = "max_turns_reached"
+        except Exception as e:
             if verbose:
-                print(f"{bcolors.WARNING}Simulation ended after {max_turns} turns{bcolors.ENDC}")
-
-
+                print(f"{bcolors.FAIL}Error during simulation: {e}{bcolors.ENDC}")
+                print(traceback.format_exc())
+            state.outcome = "error"
+            state.error_message = f"Error during simulation: {traceback.format_exc()}"
+            break
+
+    if state.turn_count >= max_turns and state.outcome == "incomplete":
+        state.outcome = "max_turns_reached"
         if verbose:
-            print(f"\n{bcolors.OKGREEN}Final outcome: {outcome}{bcolors.ENDC}")
-        # Generate a unique conversation ID
-        conversation_id = str(uuid.uuid4())
-
-        return {
-            "conversation_id": conversation_id,
-            "shopper_preferences": shopperbot.all_preferences,
-            "shopper_big5_traits": shopperbot.big_5_traits,
-            "shopper_persona": shopperbot.current_persona,
-            "shopper_emotion": shopperbot.emotion,
-            "conversation": conversation_log,
-            "outcome": outcome,
-            "error_message": error_message if outcome == "error" else None,
-            "total_turns": turn_count,
-            "timestamp": datetime.now().isoformat()
-        }
+            print(f"{bcolors.WARNING}Simulation ended after {max_turns} turns{bcolors.ENDC}")
+    return state
+
+
+def conversation_result(state, shopperbot, verbose=True):
+    if verbose:
+        print(f"\n{bcolors.OKGREEN}Final outcome: {state.outcome}{bcolors.ENDC}")
+    # Generate a unique conversation ID
+    conversation_id = str(uuid.uuid4())
+
+    return {
+        "conversation_id": conversation_id,
+        "shopper_preferences": shopperbot.all_preferences,
+        "shopper_big5_traits": shopperbot.big_5_traits,
+        "shopper_persona": shopperbot.current_persona,
+        "shopper_emotion": shopperbot.emotion,
+        "conversation": state.conversation_log,
+        "outcome": state.outcome,
+        "error_message": state.error_message if state.outcome == "error" else None,
+        "total_turns": state.turn_count,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@traced("conversation", "simulation")
+async def run_simulation(max_turns, shopperbot, salesbot, verbose=True, state=None):
+    """
+    Run a simulation with optional shared AI client. Pass state to continue a
+    conversation restored from a ConversationSnapshot.
+    """
+    try:
+        state = state or ConversationState.start()
+        await advance_conversation(state, max_turns, shopperbot, salesbot, verbose=verbose)
+        return conversation_result(state, shopperbot, verbose=verbose)
 
     except Exception as e:
         print(f"ERROR: initializing bots: {e}")
         return None
 
 
+def create_scenario_agents(scenario, persona_registry, shopperbot_client, salesbot_client, customer_model_config, salesbot_model_config):
+    """Create the shopper and sales agents for one expanded scenario."""
+    # Enrich scenario with persona and its precompiled prompts
+    selected_preferences = persona_registry.get(scenario["persona"])
+    big_5_specifications = scenario["big_5_specification"]
+    scenario_prompts = persona_registry.scenario_prompts(scenario["persona"], big_5_specifications)
+    shopperbot = CustomerSimulator(selected_preferences, shopperbot_client, customer_model_config,
+                                   big_5_traits=big_5_specifications, scenario_prompts=scenario_prompts)
+    salesbot = SalesAgent(
+        ai_client=salesbot_client,
+        salesbot_model_params=salesbot_model_config
+    )
+    return shopperbot, salesbot
+
+
+async def run_scenario_simulation(max_turns, shopperbot, salesbot, scenario, verbose=True):
+    """Run one scenario's simulation, close the salesbot's clients and tag the result with the scenario."""
+    run_metrics.conversation_started()
+    result = None
+    try:
+        result = await run_simulation(max_turns, shopperbot, salesbot, verbose=verbose)
+    finally:
+        run_metrics.conversation_finished(result["outcome"] if result is not None else "error")
+    await salesbot.cleanup()
+    if result is not None:
+        result["scenario_id"] = scenario["scenario_id"]
+        result["rollout"] = scenario["rollout"]
+    return result
+
+
+async def run_forked_scenario_simulation(max_turns, scenario, make_agents, verbose=True):
+    """
+    Play the first scenario["fork_at_turn"] turns once, snapshot the conversation
+    and continue one branch per entry of scenario["branches"] from the snapshot,
+    each with fresh agents. Returns one result per branch. Turns copied from the
+    shared prefix are marked shared_prefix in every branch but the first, so their
+    LLM cost is only counted once. If the conversation ends before the fork turn,
+    the remaining branches run from scratch.
+    """
+    branches = scenario["branches"]
+    fork_turn = scenario["fork_at_turn"]
+    fork_id = str(uuid.uuid4())
+
+    def tag(result, branch, **fork_info):
+        result["scenario_id"] = branch["scenario_id"]
+        result["rollout"] = branch["rollout"]
+        result["fork"] = {"fork_id": fork_id, "fork_turn": fork_turn, "branch": branch["rollout"], **fork_info}
+        return result
 
-async def run_batch_simulations(max_turns, scenarios_config, customer_model_config, salesbot_model_config, customer_client_config, salesbot_client_config):
+    run_metrics.conversation_started()
+    shopperbot, salesbot = make_agents()
+    prefix = ConversationState.start()
+    try:
+        with span("conversation_prefix", "simulation", fork_turn=fork_turn):
+            await advance_conversation(prefix, max_turns, shopperbot, salesbot, verbose=verbose, until_turn=fork_turn)
+        snapshot = ConversationSnapshot.take(prefix, shopperbot, salesbot)
+    except Exception:
+        run_metrics.conversation_finished("error")
+        raise
+    finally:
+        await salesbot.cleanup()
+
+    if prefix.outcome != "incomplete":
+        run_metrics.conversation_finished(prefix.outcome)
+        results = [tag(conversation_result(prefix, shopperbot, verbose=verbose), branches[0], ended_before_fork=True)]
+        for branch in branches[1:]:
+            shopperbot, salesbot = make_agents()
+            result = await run_scenario_simulation(max_turns, shopperbot, salesbot, branch, verbose=verbose)
+            if result is not None:
+                results.append(tag(result, branch, ended_before_fork=True))
+        return results
+
+    async def run_branch(index, branch):
+        if index:
+            run_metrics.conversation_started()
+        shopperbot, salesbot = make_agents()
+        state = snapshot.restore(shopperbot, salesbot)
+        if index:
+            for turn in state.conversation_log:
+                turn["shared_prefix"] = True
+        result = None
+        try:
+            result = await run_simulation(max_turns, shopperbot, salesbot, verbose=verbose, state=state)
+        finally:
+            run_metrics.conversation_finished(result["outcome"] if result is not None else "error")
+            await salesbot.cleanup()
+        return tag(result, branch, ended_before_fork=False) if result is not None else None
+
+    results = await asyncio.gather(*[run_branch(i, branch) for i, branch in enumerate(branches)])
+    return [r for r in results if r is not None]
+
+
+async def run_planned_scenario(max_turns, scenario, make_agents, verbose=True):
+    """Results of one planned scenario: a single rollout, or every branch of a forked one."""
+    if "branches" in scenario:
+        return await run_forked_scenario_simulation(max_turns, scenario, make_agents, verbose=verbose)
+    shopperbot, salesbot = make_agents()
+    result = await run_scenario_simulation(max_turns, shopperbot, salesbot, scenario, verbose=verbose)
+    return [result] if result is not None else []
+
+
+async def run_batch_simulations(max_turns, scenarios_config, customer_model_config, salesbot_model_config, customer_client_config, salesbot_client_config, shard=None):
     """
     Run multiple simulations with a shared AI client and controlled concurrency.
     If scenarios_config is provided, it determines the number of rollouts per scenario.
+    If shard is an (index, count) tuple, only that shard's slice of the scenarios is run.
     Results are saved incrementally as they complete.
     """
 
@@ -176,47 +407,37 @@ async def run_batch_simulations(max_turns, scenarios_config, customer_model_conf
     salesbot_client = create_client_from_model_name(**salesbot_client_config)
 
 
-    personas = load_personas("laptop")
-    tasks = []
-    async def gather_in_batches(tasks, batch_size):
-        results = []
-        for i in tqdm.tqdm(range(0, len(tasks), batch_size)):
-            batch = tasks[i:i+batch_size]
-            batch_results = await asyncio.gather(*batch, return_exceptions=True)
-            results.extend(batch_results)
-        return results
-    
-    async def run_simulation_task_and_close(max_turns, shopperbot, salesbot):
-        result = await run_simulation(max_turns, shopperbot, salesbot)
-        await salesbot.cleanup()
-        return result
-
-    # Use scenarios configuration to determine simulations
-    for scenario_config in scenarios_config['scenarios']:
-        # Generate all unique combinations for this scenario
-        unique_scenarios = generate_scenario_combinations(scenario_config)
-        num_rollouts = scenario_config.get('num_rollouts_per_unique_scenario', 1)
+    persona_registry = get_persona_registry(scenarios_config.get('product', 'laptop'))
+    # A fork group plays one conversation per branch
+    num_scenarios = sum(len(s.get("branches", [s])) for s in plan_scenarios(scenarios_config, shard))
+    batch_size = 5
 
-        for unique_scenario in unique_scenarios:
-            for _ in range(num_rollouts):
-                # Enrich unique_scenario with persona
-                selected_preferences = [p for p in personas if p["persona_background"] == unique_scenario["persona"]][0]
-                big_5_specifications = unique_scenario.get('big_5_specification', {})
-                shopperbot = CustomerSimulator(selected_preferences, shopperbot_client, customer_model_config, big_5_traits=big_5_specifications)
-                salesbot = SalesAgent(
-                    ai_client=salesbot_client,
-                    salesbot_model_params=salesbot_model_config
+    # Agents and coroutines are only created for the batch about to run
+    print(f"{bcolors.HEADER}Starting {num_scenarios} simulations in batches of {batch_size}...{bcolors.ENDC}")
+    scenarios = plan_scenarios(scenarios_config, shard)
+    results = []
+    with tqdm.tqdm(total=num_scenarios) as progress:
+        while True:
+            batch = list(islice(scenarios, batch_size))
+            if not batch:
+                break
+            tasks = []
+            for scenario in batch:
+                make_agents = lambda scenario=scenario: create_scenario_agents(
+                    scenario, persona_registry, shopperbot_client, salesbot_client, customer_model_config, salesbot_model_config
                 )
-                task = run_simulation_task_and_close(max_turns, shopperbot, salesbot)
-                tasks.append(task)
-    # Run all simulations concurrently
-    print(f"{bcolors.HEADER}Starting {len(tasks)} concurrent simulations...{bcolors.ENDC}")
-    results = await gather_in_batches(tasks, 5)
+                tasks.append(run_planned_scenario(max_turns, scenario, make_agents))
+            results.extend(await asyncio.gather(*tasks, return_exceptions=True))
+            progress.update(sum(len(s.get("branches", [s])) for s in batch))
+
+    # Filter out exceptions; forked scenarios return one result per branch
+    all_results = [r for scenario_results in results if not isinstance(scenario_results, Exception) for r in scenario_results]
+    print_simulation_summary(all_results)
+    return all_results
 
-    # Filter out exceptions and None results
-    all_results = [r for r in results if r is not None and not isinstance(r, Exception)]
 
-    # Summary statistics
+def print_simulation_summary(all_results):
+    """Print outcome and generation statistics for a list of simulation results."""
     if all_results:
         print("\nSIMULATION SUMMARY")
         print("=" * 50)
@@ -232,7 +453,38 @@ async def run_batch_simulations(max_turns, scenarios_config, customer_model_conf
         for outcome in set(outcomes):
             count = outcomes.count(outcome)
             print(f"  {outcome}: {count} ({count/len(all_results)*100:.1f}%)")
-    return all_results
+
+        # Turns replayed from a forked conversation's shared prefix were generated once
+        turn_stats = [turn["generation_stats"] for r in all_results for turn in r["conversation"]
+                      if turn.get("generation_stats") and not turn.get("shared_prefix")]
+        if turn_stats:
+            ttfts = [t["time_to_first_token"] for t in turn_stats if t.get("time_to_first_token") is not None]
+            print(f"\nGeneration stats ({len(turn_stats)} turns):")
+            if ttfts:
+                print(f"  Average time to first token: {sum(ttfts)/len(ttfts):.2f}s")
+            print(f"  Turns halted on stop sequence: {sum(1 for t in turn_stats if t.get('halted_on_stop'))}")
+            print(f"  Streamed tokens dropped after a cutoff: {sum(t.get('dropped_tokens', 0) for t in turn_stats)}")
+
+        cache_stats = [turn["lookup_cache"] for r in all_results for turn in r["conversation"] if turn.get("lookup_cache")]
+        if cache_stats:
+            hits = sum(c["hits"] for c in cache_stats)
+            lookups = hits + sum(c["misses"] for c in cache_stats)
+            prefetched = sum(c["prefetched"] for c in cache_stats)
+            print(f"\nLookup prefetch ({len(cache_stats)} salesperson turns):")
+            print(f"  Cache hit rate: {hits}/{lookups} ({hits / lookups * 100 if lookups else 0:.1f}%)")
+            print(f"  Prefetches used: {sum(c['prefetch_hits'] for c in cache_stats)}/{prefetched}")
+            print(f"  Lookup latency saved: {sum(c['latency_saved'] for c in cache_stats):.1f}s")
+
+        budget_stats = [turn["context_budget"] for r in all_results for turn in r["conversation"] if turn.get("context_budget")]
+        if budget_stats:
+            trimmed = [b for b in budget_stats if b["trimmed"]]
+            print(f"\nContext budget ({len(budget_stats)} salesperson turns):")
+            print(f"  Turns trimmed: {len(trimmed)}/{len(budget_stats)}")
+            print(f"  Largest prompt before trimming: {max(b['prompt_tokens_before'] for b in budget_stats)} tokens "
+                  f"(budget {min(b['budget'] for b in budget_stats)})")
+            print(f"  Tokens dropped: {sum(b['tokens_dropped'] for b in trimmed)} "
+                  f"({sum(b['folded_messages'] for b in trimmed)} history messages summarized, "
+                  f"{sum(b['dropped_chunks'] for b in trimmed)} retrieved chunks dropped)")
 
 
 def default_json_serializer(obj):
@@ -247,11 +499,10 @@ def default_json_serializer(obj):
         }
     raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
 
-def enrich_results_with_ideal_recommendations(results):
-    """Enriches the results with ideal recommendations from reference_ideal_recommendations.json."""
+def enrich_results_with_ideal_recommendations(results, product='laptop'):
+    """Enriches the results with the ideal recommendations computed from the personas and product catalogs."""
 
-    with open('reference_ideal_recommendations.json', 'r') as f:
-        ideal_recommendations = json.load(f)
+    ideal_recommendations = load_ideal_recommendations(product)
 
     for result in results:
         persona_background = result.get('shopper_persona').get('name', '')
@@ -261,12 +512,83 @@ def enrich_results_with_ideal_recommendations(results):
 
 
 def save_results(results, filename=None):
-    """Save simulation results to JSON file."""
+    """Save simulation results to a results store directory, or to a legacy JSON file if filename ends in .json."""
     if filename is None:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"simulation_results_{timestamp}.json"
+        filename = f"simulation_results_{timestamp}"
+
+    if filename.endswith(".json"):
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2, default=default_json_serializer)
+    else:
+        write_results_store(results, filename, default=default_json_serializer)
+
+    print(f"{bcolors.OKGREEN}Results saved to {filename}{bcolors.ENDC}")
+
 
-    with open(filename, 'w') as f:
-        json.dump(results, f, indent=2, default=default_json_serializer)
+def save_shard_manifest(save_dir, shard, scenarios):
+    """Record which shard this run covered and the scenario ids it was assigned."""
+    shard_index, num_shards = shard
+    manifest = {
+        "shard_index": shard_index,
+        "num_shards": num_shards,
+        "scenario_ids": [b["scenario_id"] for s in scenarios for b in s.get("branches", [s])],
+        "timestamp": datetime.now().isoformat(),
+    }
+    with open(os.path.join(save_dir, "shard_manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
 
-    print(f"{bcolors.OKGREEN}Results saved to {filename}{bcolors.ENDC}")
\ No newline at end of file
+
+def merge_shard_results(shard_dirs, output_dir, results_name="results"):
+    """
+    Merge the results of several shard runs into output_dir/results_name.
+    Results are deduplicated by scenario_id, preferring non-error outcomes.
+    Returns a report of missing shards and scenarios.
+    """
+    merged = {}
+    found_shards = set()
+    expected_ids = set()
+    num_shards = None
+
+    for shard_dir in shard_dirs:
+        manifest_path = os.path.join(shard_dir, "shard_manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if num_shards is not None and manifest["num_shards"] != num_shards:
+                raise ValueError(f"{shard_dir} was run with {manifest['num_shards']} shards, expected {num_shards}")
+            num_shards = manifest["num_shards"]
+            found_shards.add(manifest["shard_index"])
+            expected_ids.update(manifest["scenario_ids"])
+        else:
+            print(f"{bcolors.WARNING}WARNING: no shard_manifest.json in {shard_dir}{bcolors.ENDC}")
+
+        try:
+            shard_results = iter_results(shard_dir)
+            for result in shard_results:
+                key = result.get("scenario_id") or result["conversation_id"]
+                existing = merged.get(key)
+                if existing is None or (existing.get("outcome") == "error" and result.get("outcome") != "error"):
+                    merged[key] = result
+        except FileNotFoundError:
+            print(f"{bcolors.WARNING}WARNING: no results in {shard_dir}{bcolors.ENDC}")
+            continue
+
+    os.makedirs(output_dir, exist_ok=True)
+    save_results(list(merged.values()), os.path.join(output_dir, results_name))
+
+    missing_shards = sorted(set(range(num_shards)) - found_shards) if num_shards else []
+    missing_scenarios = sorted(expected_ids - set(merged))
+    if missing_shards:
+        print(f"{bcolors.FAIL}Missing shards: {missing_shards} of {num_shards}{bcolors.ENDC}")
+    if missing_scenarios:
+        print(f"{bcolors.WARNING}{len(missing_scenarios)} assigned scenarios have no result{bcolors.ENDC}")
+    print(f"Merged {len(merged)} results from {len(shard_dirs)} shard directories")
+
+    return {
+        "num_shards": num_shards,
+        "found_shards": sorted(found_shards),
+        "missing_shards": missing_shards,
+        "missing_scenario_ids": missing_scenarios,
+        "total_results": len(merged),
+    }
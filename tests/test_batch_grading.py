@@ -0,0 +1,94 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("litellm")
+from usersimeval.batch_grading import ingest_batch, prepare_batch
+
+DIMENSIONS = ["COMPREHENSION", "BIG5_OPENNESS"]
+NUM_TRIES = 3
+COMPREHENSION_BY_CONVERSATION = {"conv-a": 4, "conv-b": 2}
+
+
+def make_rollout(conversation_id, outcome="accepted"):
+    return {
+        "conversation_id": conversation_id,
+        "outcome": outcome,
+        "conversation": [
+            {"speaker": "Salesperson", "text": "Hello! What are you looking for today?", "turn": 0},
+            {"speaker": "Shopper", "text": "A light laptop for travel, under $900.", "turn": 1},
+            {"speaker": "Salesperson", "text": "The Dell XPS 13 weighs 2.6 pounds.", "turn": 1},
+            {"speaker": "Shopper", "text": "Sounds great. [ACCEPT]", "turn": 2},
+        ],
+        "shopper_persona": {"name": "Ana", "age": 34, "background": "Consultant"},
+        "shopper_preferences": "Light, under $900",
+        "shopper_emotion": "neutral",
+        "shopper_big5_traits": {"openness": "High"},
+    }
+
+
+def fake_result_line(line, conversation_id):
+    """A provider result for one batch request line, in that provider's download format."""
+    if "params" in line:
+        score = COMPREHENSION_BY_CONVERSATION[conversation_id]
+        return {
+            "custom_id": line["custom_id"],
+            "result": {"type": "succeeded", "message": {"content": [
+                {"type": "text", "text": f"<score>{score}</score>"},
+            ]}},
+        }
+    return {
+        "custom_id": line["custom_id"],
+        "response": {"status_code": 200, "body": {"choices": [{"message": {
+            "content": "<rate>High</rate><justification>Curious about new options.</justification>",
+        }}]}},
+        "error": None,
+    }
+
+
+def test_prepare_and_ingest_batch(tmp_path):
+    input_file = tmp_path / "rollouts.json"
+    rollouts = [make_rollout("conv-a"), make_rollout("conv-b"), make_rollout("conv-c", outcome="error")]
+    input_file.write_text(json.dumps(rollouts))
+    output_dir = str(tmp_path / "eval")
+
+    manifest = prepare_batch(str(input_file), output_dir, DIMENSIONS, num_tries_per_conversation=NUM_TRIES)
+
+    assert manifest["conversation_ids"] == ["conv-a", "conv-b"]
+    assert manifest["skipped_conversation_ids"] == ["conv-c"]
+    assert len(manifest["requests"]) == 2 * len(DIMENSIONS) * NUM_TRIES
+    assert set(manifest["request_files"]) == {"openai", "anthropic"}
+
+    # Preparing again yields the same custom ids
+    again = prepare_batch(str(input_file), str(tmp_path / "again"), DIMENSIONS, num_tries_per_conversation=NUM_TRIES)
+    assert again["requests"] == manifest["requests"]
+
+    results_file = tmp_path / "results.jsonl"
+    with open(results_file, "w") as out:
+        for files in manifest["request_files"].values():
+            for path in files:
+                with open(path) as f:
+                    for raw in f:
+                        line = json.loads(raw)
+                        conversation_id = manifest["requests"][line["custom_id"]][0]
+                        out.write(json.dumps(fake_result_line(line, conversation_id)) + "\n")
+
+    results, skip_info = ingest_batch(output_dir, [str(results_file)])
+
+    with open(os.path.join(output_dir, "breakdown_scores.json")) as f:
+        breakdown = json.load(f)
+    assert breakdown == results
+    scores = {r["conversation_id"]: r["dimension_scores"] for r in breakdown}
+    assert scores == {
+        "conv-a": {"COMPREHENSION": 4.0, "BIG5_OPENNESS": "High"},
+        "conv-b": {"COMPREHENSION": 2.0, "BIG5_OPENNESS": "High"},
+    }
+    assert all(len(r["judgment_verbose"]["COMPREHENSION"]) == NUM_TRIES for r in breakdown)
+
+    with open(os.path.join(output_dir, "aggregate_eval_scores.json")) as f:
+        aggregate = json.load(f)
+    assert aggregate["COMPREHENSION_SCORE"] == 3.0
+    assert aggregate["BIG5_OPENNESS_SCORE"] == 1.0
+    assert aggregate["skipped_dialogues"] == {"skipped_count": 1, "skipped_conversation_ids": ["conv-c"]}
+    assert skip_info["skipped_conversation_ids"] == ["conv-c"]
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("faiss")
+from langchain.vectorstores import FAISS
+
+from salessim.services.constants import Document
+from salessim.services.embedders import EMBEDDING_BACKENDS, create_embedder
+
+BACKEND_REQUIREMENTS = {
+    "torch": "sentence_transformers",
+    "onnx": "onnxruntime",
+    "onnx-int8": "onnxruntime",
+}
+
+
+@pytest.mark.parametrize("backend", EMBEDDING_BACKENDS)
+def test_faiss_similarity_search(backend):
+    pytest.importorskip(BACKEND_REQUIREMENTS[backend])
+    if backend.startswith("onnx"):
+        pytest.importorskip("transformers")
+    embedder = create_embedder(backend)
+    docs = [
+        Document(page_content="Lightweight ultrabook with 16GB memory and long battery life", metadata={"id": "0"}),
+        Document(page_content="Gaming laptop with a dedicated RTX graphics card", metadata={"id": "1"}),
+        Document(page_content="Buying guide: how much RAM does a laptop need", metadata={"id": "2"}),
+    ]
+    db = FAISS.from_documents(docs, embedder)
+
+    results = db.similarity_search("laptop for gaming with a good GPU", k=2)
+
+    assert len(results) == 2
+    assert results[0].metadata["id"] == "1"
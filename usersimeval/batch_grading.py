@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Offline grading through provider batch jobs.
+
+batch-prepare writes every (conversation, dimension, try) grader request as
+batch-format JSONL, one file set per provider:
+
+    batch_requests/requests.openai.00000.jsonl      OpenAI Batch API lines (custom_id, method, url, body)
+    batch_requests/requests.anthropic.00000.jsonl   Anthropic Message Batches lines (custom_id, params)
+    batch_requests/manifest.json                    input file, dimensions, conversation order and
+                                                    custom_id -> (conversation_id, dimension, try)
+
+In combined Big-5 mode the five traits share one request per try. Custom ids
+are derived from the conversation id, dimension and try, so preparing the
+same results again yields the same ids. Submitting the files is
+left to the provider's tooling; batch-ingest reads the downloaded result files
+(either provider's format) back into breakdown_scores.json and the aggregate
+scores, exactly as `usersimeval run` would have written them.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from usersimeval.convert_rollouts_to_txt import write_transcript_source
+from usersimeval.model_grader import (
+    UserSimulatorJudge,
+    dimension_provider,
+    expand_feedback,
+    format_feedback,
+    grading_units,
+    load_input_file,
+    resolve_dimensions,
+    score_dimension,
+    write_aggregate_scores,
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIR = "batch_requests"
+BATCH_MANIFEST_FILE = "manifest.json"
+# Both providers cap a batch at 50k-100k requests; stay under the smaller limit
+MAX_REQUESTS_PER_FILE = 50000
+
+
+def batch_custom_id(conversation_id: str, dimension: str, try_idx: int) -> str:
+    """Stable id within the 64-character [a-zA-Z0-9_-] limit both providers accept."""
+    digest = hashlib.sha1(f"{conversation_id}\x00{dimension}".encode("utf-8")).hexdigest()[:32]
+    return f"{digest}-{try_idx}"
+
+
+def to_batch_line(provider: str, custom_id: str, request: Dict) -> Dict:
+    if provider == "openai":
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": request,
+        }
+    # Anthropic takes the system prompt as a top-level parameter
+    system = "\n".join(m["content"] for m in request["messages"] if m["role"] == "system")
+    params = {
+        "model": request["model"],
+        "max_tokens": request["max_tokens"],
+        "temperature": request["temperature"],
+        "messages": [m for m in request["messages"] if m["role"] != "system"],
+    }
+    if system:
+        params["system"] = system
+    return {"custom_id": custom_id, "params": params}
+
+
+class _BatchFileWriter:
+    """Writes batch lines for one provider, rolling over to a new file every max_requests lines."""
+
+    def __init__(self, batch_dir: str, provider: str, max_requests: int):
+        self.batch_dir = batch_dir
+        self.provider = provider
+        self.max_requests = max_requests
+        self.files: List[str] = []
+        self._handle = None
+        self._count = 0
+
+    def write(self, line: Dict):
+        if self._handle is None or self._count >= self.max_requests:
+            self.close()
+            path = os.path.join(self.batch_dir, f"requests.{self.provider}.{len(self.files):05d}.jsonl")
+            self._handle = open(path, "w", encoding="utf-8")
+            self.files.append(path)
+            self._count = 0
+        self._handle.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self._count += 1
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+def prepare_batch(input_file: str, output_dir: str, dimensions: List[str], num_tries_per_conversation: int = 5,
+                  big5_mode: str = "per_trait", max_requests_per_file: int = MAX_REQUESTS_PER_FILE) -> Dict:
+    """Write grader requests for every conversation as batch JSONL files and return the manifest."""
+    dimensions = resolve_dimensions(dimensions)
+    units = grading_units(dimensions, big5_mode)
+    judge = UserSimulatorJudge(num_tries_per_conversation=num_tries_per_conversation, big5_mode=big5_mode)
+    batch_dir = os.path.join(output_dir, BATCH_DIR)
+    os.makedirs(batch_dir, exist_ok=True)
+
+    writers = {}
+    requests = {}
+    conversation_ids = []
+    skipped = []
+    for idx, conversation_data in enumerate(load_input_file(input_file)):
+        conversation_id = conversation_data.get('conversation_id', str(idx))
+        # Conversations with an "error" outcome are skipped, as in interactive grading
+        if conversation_data.get('outcome', '') == 'error':
+            skipped.append(conversation_id)
+            continue
+        conversation_ids.append(conversation_id)
+        conversation_history, persona, formatted_conversation = judge.parse_conversation(conversation_data)
+        for dimension in units:
+            request = judge.build_dimension_request(dimension, conversation_history, persona, formatted_conversation)
+            provider = dimension_provider(dimension)
+            if provider not in writers:
+                writers[provider] = _BatchFileWriter(batch_dir, provider, max_requests_per_file)
+            for try_idx in range(num_tries_per_conversation):
+                custom_id = batch_custom_id(conversation_id, dimension, try_idx)
+                writers[provider].write(to_batch_line(provider, custom_id, request))
+                requests[custom_id] = [conversation_id, dimension, try_idx]
+
+    for writer in writers.values():
+        writer.close()
+
+    manifest = {
+        "input_file": os.path.abspath(input_file),
+        "dimensions": dimensions,
+        "big5_mode": big5_mode,
+        "grading_units": units,
+        "num_tries_per_conversation": num_tries_per_conversation,
+        "conversation_ids": conversation_ids,
+        "skipped_conversation_ids": skipped,
+        "request_files": {provider: writer.files for provider, writer in writers.items()},
+        "requests": requests,
+    }
+    with open(os.path.join(batch_dir, BATCH_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return manifest
+
+
+def parse_batch_result(line: Dict) -> Tuple[str, Optional[str], str]:
+    """Return (custom_id, content or None on failure, reasoning) from an OpenAI or Anthropic result line."""
+    custom_id = line.get("custom_id")
+    if "result" in line:
+        # Anthropic Message Batches: {"custom_id", "result": {"type": "succeeded", "message": {...}}}
+        result = line["result"]
+        if result.get("type") != "succeeded":
+            return custom_id, None, ""
+        blocks = result["message"].get("content", [])
+        content = "".join(b.get("text", "") for b in blocks if b.get("type") == "text")
+        reasoning = "".join(b.get("thinking", "") for b in blocks if b.get("type") == "thinking")
+        return custom_id, content, reasoning
+
+    # OpenAI Batch API: {"custom_id", "response": {"status_code", "body": {...}}, "error"}
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        return custom_id, None, ""
+    message = response["body"]["choices"][0]["message"]
+    return custom_id, message.get("content") or "", message.get("reasoning_content") or ""
+
+
+def ingest_batch(output_dir: str, result_files: List[str]) -> Tuple[List[Dict], Dict]:
+    """Score downloaded batch results and write breakdown_scores.json and aggregate scores."""
+    batch_dir = os.path.join(output_dir, BATCH_DIR)
+    with open(os.path.join(batch_dir, BATCH_MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    requests = manifest["requests"]
+
+    # (conversation_id, grading unit) -> {try: feedback}
+    feedback_by_key = defaultdict(dict)
+    failed = 0
+    unknown = 0
+    for result_file in result_files:
+        with open(result_file, "r", encoding="utf-8") as f:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                custom_id, content, reasoning = parse_batch_result(json.loads(raw))
+                if custom_id not in requests:
+                    unknown += 1
+                    continue
+                if content is None:
+                    failed += 1
+                    continue
+                conversation_id, dimension, try_idx = requests[custom_id]
+                feedback_by_key[(conversation_id, dimension)][try_idx] = format_feedback(dimension, content, reasoning)
+
+    missing = len(requests) - failed - sum(len(tries) for tries in feedback_by_key.values())
+    if failed or missing or unknown:
+        logger.warning(f"Batch results: {failed} failed, {missing} missing, {unknown} with unknown custom ids")
+
+    results = []
+    skipped_dialogues = list(manifest["skipped_conversation_ids"])
+    for conversation_id in manifest["conversation_ids"]:
+        dimension_scores = {}
+        judgment_verbose = {}
+        try:
+            for unit in manifest.get("grading_units", manifest["dimensions"]):
+                tries = feedback_by_key.get((conversation_id, unit))
+                if not tries:
+                    continue
+                unit_feedback = [tries[try_idx] for try_idx in sorted(tries)]
+                for dimension, feedback in expand_feedback(unit, unit_feedback, manifest["dimensions"]).items():
+                    dimension_scores[dimension] = score_dimension(dimension, feedback)
+                    judgment_verbose[dimension] = feedback
+        except Exception as e:
+            logger.error(f"Error scoring conversation {conversation_id}: {e}")
+            continue
+        if not dimension_scores:
+            continue
+        results.append({
+            "conversation_id": conversation_id,
+            "dimension_scores": dimension_scores,
+            "judgment_verbose": judgment_verbose,
+        })
+
+    with open(os.path.join(output_dir, "breakdown_scores.json"), "w", encoding="utf-8") as out_f:
+        json.dump(results, out_f, indent=2, ensure_ascii=False)
+
+    skip_info = {
+        "skipped_count": len(skipped_dialogues),
+        "skipped_conversation_ids": skipped_dialogues
+    }
+    write_aggregate_scores(results, manifest["dimensions"], manifest["input_file"], output_dir, skip_info)
+    write_transcript_source(output_dir, manifest["input_file"])
+    return results, skip_info
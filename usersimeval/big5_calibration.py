@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Calibration of the combined Big-5 grader against the per-trait graders.
+
+Grades the same conversations in both Big-5 modes and reports, per trait, how
+often the final scores agree, Cohen's kappa and the confusion matrix
+(per-trait rows, combined columns).
+
+Usage: usersimeval big5-calibrate --input_file usersimeval/example-dialogues.json --output_dir calibration/
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from typing import Dict, List
+
+from usersimeval.model_grader import UserSimulatorJudge, load_input_file, score_dimension
+from usersimeval.sales.grader_prompts import BIG5_TRAITS
+
+logger = logging.getLogger(__name__)
+
+BIG5_LEVELS = ["Low", "Neutral", "High"]
+
+
+def cohen_kappa(labels_a: List[str], labels_b: List[str]) -> float:
+    """Chance-corrected agreement between two raters; 1.0 when both always agree."""
+    total = len(labels_a)
+    if total == 0:
+        return 0.0
+    observed = sum(a == b for a, b in zip(labels_a, labels_b)) / total
+    counts_a = Counter(labels_a)
+    counts_b = Counter(labels_b)
+    expected = sum(counts_a[label] * counts_b[label] for label in counts_a) / (total * total)
+    if expected == 1.0:
+        return 1.0
+    return (observed - expected) / (1 - expected)
+
+
+def calibration_report(per_trait_scores: Dict[str, Dict[str, str]], combined_scores: Dict[str, Dict[str, str]]) -> Dict:
+    """Compare {conversation_id: {trait: level}} from the two modes on the conversations both scored."""
+    report = {"traits": {}}
+    all_a, all_b = [], []
+    for trait in BIG5_TRAITS:
+        pairs = [
+            (per_trait_scores[cid][trait], combined_scores[cid][trait])
+            for cid in per_trait_scores
+            if trait in per_trait_scores[cid] and trait in combined_scores.get(cid, {})
+        ]
+        labels_a = [a for a, _ in pairs]
+        labels_b = [b for _, b in pairs]
+        all_a.extend(labels_a)
+        all_b.extend(labels_b)
+        confusion = {a: {b: 0 for b in BIG5_LEVELS} for a in BIG5_LEVELS}
+        for a, b in pairs:
+            confusion.setdefault(a, {}).setdefault(b, 0)
+            confusion[a][b] += 1
+        report["traits"][trait] = {
+            "conversations": len(pairs),
+            "agreement": sum(a == b for a, b in pairs) / len(pairs) if pairs else 0.0,
+            "cohen_kappa": cohen_kappa(labels_a, labels_b),
+            "confusion": confusion,
+        }
+    report["overall"] = {
+        "ratings": len(all_a),
+        "agreement": sum(a == b for a, b in zip(all_a, all_b)) / len(all_a) if all_a else 0.0,
+        "cohen_kappa": cohen_kappa(all_a, all_b),
+    }
+    return report
+
+
+async def grade_big5(judge: UserSimulatorJudge, conversations: List[Dict], max_concurrency: int = 4) -> Dict[str, Dict[str, str]]:
+    """Big-5 scores per conversation_id for one grading mode."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    scores = {}
+
+    async def grade(conversation_id, conversation_data):
+        async with semaphore:
+            judgment = await judge.judge_conversation(conversation_data, BIG5_TRAITS)
+        if judgment.get("status") == "error":
+            logger.error(f"Error grading conversation {conversation_id}: {judgment['error']}")
+            return
+        try:
+            scores[conversation_id] = {
+                trait: score_dimension(trait, feedback["feedback"]) for trait, feedback in judgment.items()
+            }
+        except Exception as e:
+            logger.error(f"Error scoring conversation {conversation_id}: {e}")
+
+    await asyncio.gather(*[grade(cid, data) for cid, data in conversations])
+    return scores
+
+
+async def run_calibration(input_file: str, output_dir: str, num_tries_per_conversation: int = 5,
+                          max_concurrency: int = 4) -> Dict:
+    conversations = [
+        (conversation_data.get('conversation_id', str(idx)), conversation_data)
+        for idx, conversation_data in enumerate(load_input_file(input_file))
+        if conversation_data.get('outcome', '') != 'error'
+    ]
+    per_trait_judge = UserSimulatorJudge(num_tries_per_conversation, big5_mode="per_trait")
+    combined_judge = UserSimulatorJudge(num_tries_per_conversation, big5_mode="combined")
+    per_trait_scores = await grade_big5(per_trait_judge, conversations, max_concurrency)
+    combined_scores = await grade_big5(combined_judge, conversations, max_concurrency)
+
+    report = calibration_report(per_trait_scores, combined_scores)
+    report["input_file"] = input_file
+    report["num_tries_per_conversation"] = num_tries_per_conversation
+    report["requests_per_conversation"] = {
+        "per_trait": len(BIG5_TRAITS),
+        "combined": 1,
+    }
+    report["scores"] = {
+        cid: {"per_trait": per_trait_scores.get(cid), "combined": combined_scores.get(cid)}
+        for cid, _ in conversations
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "big5_calibration.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+def print_calibration_report(report: Dict):
+    print(f"\n{'trait':<26}{'n':>5}{'agreement':>11}{'kappa':>8}")
+    print("-" * 50)
+    for trait, stats in report["traits"].items():
+        print(f"{trait:<26}{stats['conversations']:>5}{stats['agreement']:>11.1%}{stats['cohen_kappa']:>8.2f}")
+    overall = report["overall"]
+    print("-" * 50)
+    print(f"{'overall':<26}{overall['ratings']:>5}{overall['agreement']:>11.1%}{overall['cohen_kappa']:>8.2f}")
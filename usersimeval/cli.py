@@ -26,6 +26,9 @@ def viz_command(args):
     if args.port:
         sys.argv.extend(['--port', str(args.port)])
 
+    if args.results:
+        sys.argv.extend(['--results', args.results])
+
     try:
         # Call the main function from visualization_server
         visualization_server.main()
@@ -51,6 +54,12 @@ def run_command(args):
     if args.num_tries_per_conversation:
         sys.argv.extend(['--num_tries_per_conversation', str(args.num_tries_per_conversation)])
 
+    if args.export_transcripts:
+        sys.argv.append('--export_transcripts')
+
+    if args.big5_mode:
+        sys.argv.extend(['--big5_mode', args.big5_mode])
+
     try:
         # Run the async main function from model_grader
         asyncio.run(model_grader.main())
@@ -58,6 +67,40 @@ def run_command(args):
         # Restore original sys.argv
         sys.argv = original_argv
 
+def export_transcripts_command(args):
+    """Handle the export-transcripts subcommand."""
+    from .convert_rollouts_to_txt import convert_conversations_to_txt
+
+    convert_conversations_to_txt(args.input_file, args.output_dir, num_workers=args.workers)
+
+def batch_prepare_command(args):
+    """Handle the batch-prepare subcommand."""
+    from .batch_grading import prepare_batch
+
+    manifest = prepare_batch(args.input_file, args.output_dir, args.dimensions,
+                             num_tries_per_conversation=args.num_tries_per_conversation,
+                             big5_mode=args.big5_mode)
+    print(f"Wrote {len(manifest['requests'])} grader requests for {len(manifest['conversation_ids'])} conversations:")
+    for provider, files in manifest['request_files'].items():
+        for path in files:
+            print(f"  {provider}: {path}")
+
+def batch_ingest_command(args):
+    """Handle the batch-ingest subcommand."""
+    from .batch_grading import ingest_batch
+
+    results, _ = ingest_batch(args.output_dir, args.results_files)
+    print(f"Successfully processed {len(results)} conversations")
+
+def big5_calibrate_command(args):
+    """Handle the big5-calibrate subcommand."""
+    from .big5_calibration import print_calibration_report, run_calibration
+
+    report = asyncio.run(run_calibration(args.input_file, args.output_dir,
+                                         num_tries_per_conversation=args.num_tries_per_conversation))
+    print_calibration_report(report)
+    print(f"Calibration report saved to {args.output_dir}/big5_calibration.json")
+
 def main():
     """Main CLI entry point."""
     parser = argparse.ArgumentParser(description='UserSimEval tools')
@@ -71,6 +114,8 @@ def main():
                            type=int,
                            default=8000,
                            help='Port to serve on (default: 8000)')
+    viz_parser.add_argument('--results',
+                           help='Simulation results to render transcripts from (default: read from the evaluation directory)')
 
     # run subcommand
     run_parser = subparsers.add_parser('run', help='Run model grader on conversations')
@@ -82,6 +127,48 @@ def main():
                            help='Dimensions to evaluate')
     run_parser.add_argument('--num_tries_per_conversation', type=int,
                            help='Number of tries per conversation')
+    run_parser.add_argument('--export_transcripts', action='store_true',
+                           help='Also write every transcript to human_readable_conversations/')
+    run_parser.add_argument('--big5_mode', choices=['per_trait', 'combined'],
+                           help='Rate each Big-5 trait separately (default) or all five in one call')
+
+    # export-transcripts subcommand
+    export_parser = subparsers.add_parser('export-transcripts', help='Bulk export human-readable transcripts')
+    export_parser.add_argument('--input_file', required=True,
+                           help='Simulation results (output directory, results store or JSON file)')
+    export_parser.add_argument('--output_dir', required=True,
+                           help='Directory to write conversation_{id}.txt files to')
+    export_parser.add_argument('--workers', type=int,
+                           help='Rendering processes (default: number of CPUs)')
+
+    # batch-prepare subcommand
+    prepare_parser = subparsers.add_parser('batch-prepare', help='Write grader requests as provider batch JSONL files')
+    prepare_parser.add_argument('--input_file', required=True,
+                           help='Simulation results (output directory, results store or JSON file)')
+    prepare_parser.add_argument('--output_dir', required=True,
+                           help='Evaluation output directory; requests are written to its batch_requests/ folder')
+    prepare_parser.add_argument('--dimensions', nargs='+', required=True,
+                           help='Dimensions to evaluate')
+    prepare_parser.add_argument('--num_tries_per_conversation', type=int, default=5,
+                           help='Number of tries per conversation (default: 5)')
+    prepare_parser.add_argument('--big5_mode', choices=['per_trait', 'combined'], default='per_trait',
+                           help='Rate each Big-5 trait separately or all five in one call')
+
+    # batch-ingest subcommand
+    ingest_parser = subparsers.add_parser('batch-ingest', help='Score downloaded batch results')
+    ingest_parser.add_argument('--output_dir', required=True,
+                           help='Evaluation output directory used with batch-prepare')
+    ingest_parser.add_argument('--results_files', nargs='+', required=True,
+                           help='Batch result JSONL files (OpenAI or Anthropic format)')
+
+    # big5-calibrate subcommand
+    calibrate_parser = subparsers.add_parser('big5-calibrate', help='Compare the combined Big-5 grader with the per-trait graders')
+    calibrate_parser.add_argument('--input_file', default='usersimeval/example-dialogues.json',
+                           help='Conversations to grade (default: usersimeval/example-dialogues.json)')
+    calibrate_parser.add_argument('--output_dir', required=True,
+                           help='Directory for big5_calibration.json')
+    calibrate_parser.add_argument('--num_tries_per_conversation', type=int, default=5,
+                           help='Number of tries per conversation (default: 5)')
 
     args = parser.parse_args()
 
@@ -89,6 +176,14 @@ def main():
         viz_command(args)
     elif args.command == 'run':
         run_command(args)
+    elif args.command == 'export-transcripts':
+        export_transcripts_command(args)
+    elif args.command == 'batch-prepare':
+        batch_prepare_command(args)
+    elif args.command == 'batch-ingest':
+        batch_ingest_command(args)
+    elif args.command == 'big5-calibrate':
+        big5_calibrate_command(args)
     else:
         parser.print_help()
         sys.exit(1)
@@ -1,79 +1,236 @@
 #!/usr/bin/env python3
+"""
+Human-readable transcripts of simulated conversations.
+
+Transcripts are rendered on demand: the rollout viewer asks a TranscriptRenderer
+for one conversation at a time and keeps recently rendered transcripts in a
+bounded LRU. export_transcripts remains for bulk export to .txt files; it renders
+in a process pool and only rewrites files whose content changed.
+"""
+
+import hashlib
 import json
 import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-def convert_conversations_to_txt(json_file_path, output_dir="mistral_conversations_comprehension"):
-    """Convert JSON conversations to individual human-readable text files."""
+from common.results_store import ResultsStore, iter_results, resolve_results_path
+
+# Written to an evaluation output directory so the viewer can find the graded results
+TRANSCRIPT_SOURCE_FILE = "transcript_source.json"
+# Content hashes of exported transcripts, used to skip unchanged files
+EXPORT_MANIFEST_FILE = ".transcripts_manifest.json"
+
+
+def render_transcript(conversation_data: dict, position: int) -> str:
+    """Render one conversation; position is its 0-based order in the results."""
+    persona = conversation_data.get('shopper_persona', {})
+    preferences = conversation_data.get('shopper_preferences', {})
+    emotion = conversation_data.get('shopper_emotion', 'neutral')
+
+    lines = []
+    # Header with persona information
+    lines.append("=" * 80 + "\n")
+    lines.append(f"CONVERSATION #{position+1}\n")
+    lines.append("=" * 80 + "\n\n")
+
+    # Persona details
+    lines.append("SHOPPER PERSONA:\n")
+    lines.append("-" * 40 + "\n")
+    lines.append(f"Name: {persona.get('name', 'Unknown')}\n")
+    lines.append(f"Age: {persona.get('age', 'Unknown')}\n")
+    lines.append(f"Background: {persona.get('background', 'Not specified')}\n")
+    lines.append(f"Personality: {persona.get('shopper_big5_traits', 'Not specified')}\n")
+    lines.append(f"Speaking Style: {persona.get('speaking_style', 'Not specified')}\n")
+    lines.append(f"Current Emotion: {emotion}\n")
+    if persona.get('concerns'):
+        lines.append(f"Concerns: {', '.join(persona['concerns'])}\n")
+
+    if persona.get('knowledge_level'):
+        lines.append(f"Knowledge Level: {persona['knowledge_level']}\n")
+
+    lines.append("\nSHOPPER PREFERENCES:\n")
+    lines.append("-" * 40 + "\n")
+    lines.append(f"Preferences: {preferences}\n")
+
+    lines.append("\n" + "=" * 80 + "\n")
+    lines.append("CONVERSATION\n")
+    lines.append("=" * 80 + "\n\n")
+
+    # The conversation itself
+    conversation = conversation_data.get('conversation', [])
+    for turn in conversation:
+        speaker = turn.get('speaker', 'Unknown')
+        text = turn.get('text', '')
+        turn_num = turn.get('turn', 0)
+
+        lines.append(f"[Turn {turn_num}] {speaker.upper()}:\n")
+        lines.append(f"{text}\n\n")
+
+    lines.append("=" * 80 + "\n")
+    lines.append("END OF CONVERSATION\n")
+    lines.append("=" * 80 + "\n")
+    return "".join(lines)
+
+
+def transcript_conversation_id(conversation_data: dict, position: int) -> str:
+    return str(conversation_data.get('conversation_id', position + 1))
+
+
+class TranscriptRenderer:
+    """Renders transcripts by conversation_id with a bounded LRU of rendered text. Thread-safe."""
+
+    def __init__(self, results_path: str, max_entries: int = 256):
+        self.results_path = resolve_results_path(results_path)
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = ResultsStore(self.results_path) if ResultsStore.exists(self.results_path) else None
+        self._positions: Optional[Dict[str, int]] = None
+        # Legacy results.json has no random access, so its records are kept after the first scan
+        self._legacy_records: Optional[Dict[str, dict]] = None
+
+    def _load_positions(self):
+        if self._store is not None:
+            positions = {conversation_id: i for i, conversation_id in enumerate(self._store.ids())}
+        else:
+            records = {}
+            positions = {}
+            for i, record in enumerate(iter_results(self.results_path)):
+                conversation_id = transcript_conversation_id(record, i)
+                records[conversation_id] = record
+                positions[conversation_id] = i
+            self._legacy_records = records
+        self._positions = positions
+
+    def _lookup(self, conversation_id: str) -> Optional[Tuple[dict, int]]:
+        with self._lock:
+            if self._positions is None:
+                self._load_positions()
+        position = self._positions.get(conversation_id)
+        if position is None:
+            return None
+        if self._store is not None:
+            record = self._store.get(conversation_id)
+        else:
+            record = self._legacy_records[conversation_id]
+        return record, position
 
-    # Create output directory if it doesn't exist
-    if os.path.exists(output_dir):
-        # Remove the directory and all its contents if it exist
-        import shutil
-        shutil.rmtree(output_dir)
-    Path(output_dir).mkdir(exist_ok=True)
-
-    # Load the JSON data
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    # Process each conversation
-    if "simulations" in data:
-        data = data["simulations"]
-    for i, conversation_data in enumerate(data):
-        # Extract persona and preferences
-        persona = conversation_data.get('shopper_persona', {})
-        preferences = conversation_data.get('shopper_preferences', {})
-        emotion = conversation_data.get('shopper_emotion', 'neutral')
-
-        # Create filename
-        conversation_id = conversation_data.get('conversation_id', i + 1)
-        filename = f"conversation_{conversation_id}.txt"
-        filepath = Path(output_dir) / filename
-
-        # Generate the text content
-        with open(filepath, 'w', encoding='utf-8') as f:
-            # Write header with persona information
-            f.write("=" * 80 + "\n")
-            f.write(f"CONVERSATION #{i+1}\n")
-            f.write("=" * 80 + "\n\n")
-
-            # Persona details
-            f.write("SHOPPER PERSONA:\n")
-            f.write("-" * 40 + "\n")
-            f.write(f"Name: {persona.get('name', 'Unknown')}\n")
-            f.write(f"Age: {persona.get('age', 'Unknown')}\n")
-            f.write(f"Background: {persona.get('background', 'Not specified')}\n")
-            f.write(f"Personality: {persona.get('shopper_big5_traits', 'Not specified')}\n")
-            f.write(f"Speaking Style: {persona.get('speaking_style', 'Not specified')}\n")
-            f.write(f"Current Emotion: {emotion}\n")
-            #f.write(f"Big5 Traits: {big5_traits}\n")
-            if persona.get('concerns'):
-                f.write(f"Concerns: {', '.join(persona['concerns'])}\n")
-
-            if persona.get('knowledge_level'):
-                f.write(f"Knowledge Level: {persona['knowledge_level']}\n")
-
-            f.write("\nSHOPPER PREFERENCES:\n")
-            f.write("-" * 40 + "\n")
-            f.write(f"Preferences: {preferences}\n")
-
-            f.write("\n" + "=" * 80 + "\n")
-            f.write("CONVERSATION\n")
-            f.write("=" * 80 + "\n\n")
-
-            # Write the conversation
-            conversation = conversation_data.get('conversation', [])
-            for turn in conversation:
-                speaker = turn.get('speaker', 'Unknown')
-                text = turn.get('text', '')
-                turn_num = turn.get('turn', 0)
-
-                f.write(f"[Turn {turn_num}] {speaker.upper()}:\n")
-                f.write(f"{text}\n\n")
-
-            f.write("=" * 80 + "\n")
-            f.write("END OF CONVERSATION\n")
-            f.write("=" * 80 + "\n")
-
-    print(f"Converted {len(data)} conversations to text files in '{output_dir}' directory")
+    def get(self, conversation_id) -> Optional[str]:
+        conversation_id = str(conversation_id)
+        with self._lock:
+            if conversation_id in self._cache:
+                self._cache.move_to_end(conversation_id)
+                return self._cache[conversation_id]
+
+        found = self._lookup(conversation_id)
+        if found is None:
+            return None
+        transcript = render_transcript(*found)
+
+        with self._lock:
+            self._cache[conversation_id] = transcript
+            self._cache.move_to_end(conversation_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return transcript
+
+
+def write_transcript_source(output_dir: str, results_path: str):
+    """Record which results an evaluation graded, so the viewer can render its transcripts."""
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, TRANSCRIPT_SOURCE_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"results_path": os.path.abspath(results_path)}, f, indent=2)
+
+
+def read_transcript_source(base_dir: str) -> Optional[str]:
+    source_path = os.path.join(base_dir, TRANSCRIPT_SOURCE_FILE)
+    if not os.path.exists(source_path):
+        return None
+    with open(source_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("results_path")
+
+
+def _render_chunk(chunk: List[Tuple[int, dict]]) -> List[Tuple[str, str, str]]:
+    """Worker: render a chunk of (position, record) pairs to (filename, content, sha1)."""
+    rendered = []
+    for position, record in chunk:
+        content = render_transcript(record, position)
+        filename = f"conversation_{transcript_conversation_id(record, position)}.txt"
+        rendered.append((filename, content, hashlib.sha1(content.encode('utf-8')).hexdigest()))
+    return rendered
+
+
+def _render_in_pool(chunks, num_workers: Optional[int]):
+    """Yield _render_chunk results in order, keeping at most two chunks per worker in flight."""
+    num_workers = num_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        window = 2 * num_workers
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_render_chunk, chunk))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_transcripts(json_file_path, output_dir, num_workers: Optional[int] = None, chunk_size: int = 64) -> Dict[str, int]:
+    """
+    Bulk export every conversation to output_dir/conversation_{id}.txt.
+    Rendering runs in a process pool with a bounded number of chunks in flight,
+    so memory stays flat on large result files. Files whose content hash matches the previous
+    export are left untouched, and transcripts of conversations no longer in the
+    results are removed.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(output_dir) / EXPORT_MANIFEST_FILE
+    previous = {}
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+
+    current = {}
+    stats = {"written": 0, "unchanged": 0, "removed": 0}
+    chunks = _chunked(enumerate(iter_results(json_file_path)), chunk_size)
+    for rendered in _render_in_pool(chunks, num_workers):
+        for filename, content, digest in rendered:
+            current[filename] = digest
+            filepath = Path(output_dir) / filename
+            if previous.get(filename) == digest and filepath.exists():
+                stats["unchanged"] += 1
+                continue
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(content)
+            stats["written"] += 1
+
+    for filename in previous.keys() - current.keys():
+        stale_path = Path(output_dir) / filename
+        if stale_path.exists():
+            stale_path.unlink()
+            stats["removed"] += 1
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(current, f)
+    return stats
+
+
+def convert_conversations_to_txt(json_file_path, output_dir="mistral_conversations_comprehension", num_workers=None):
+    """Convert JSON conversations to individual human-readable text files."""
+    stats = export_transcripts(json_file_path, output_dir, num_workers=num_workers)
+    print(f"Converted {stats['written'] + stats['unchanged']} conversations to text files in '{output_dir}' directory "
+          f"({stats['written']} written, {stats['unchanged']} unchanged, {stats['removed']} removed)")
+    return stats
@@ -6,16 +6,17 @@ Model grader using gpt-4o and claude-sonnet-4-5, the models used during grader d
 import json
 import os
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 from pathlib import Path
 import logging
 from datetime import datetime
-from usersimeval.convert_rollouts_to_txt import convert_conversations_to_txt
+from usersimeval.convert_rollouts_to_txt import convert_conversations_to_txt, write_transcript_source
+from common.results_store import iter_results
 from usersimeval.utils import aggregate_big5_scores, aggregate_float_scores, get_big5_scores, get_mode_score, extract_scores
 
 from usersimeval.sales.grader_prompts import *
 try:
-    from common.ai_client import LiteLLMClient
+    from common.ai_client import LiteLLMClient, choice_reasoning
 except ImportError:
     print("Please install required packages: pip install litellm")
     exit(1)
@@ -24,30 +25,119 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 
-def load_input_file(input_file: str) -> List[Dict]:
-    with open(input_file, 'r', encoding='utf-8') as f:
+def load_input_file(input_file: str) -> Iterator[Dict]:
+    """Stream conversations from a results store, simulation output directory or JSON file."""
+    try:
+        yield from iter_results(input_file)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing JSON file: {e}")
+        raise
+
+
+BIG5_MODES = ["per_trait", "combined"]
+
+# Structured output for the combined Big-5 grader: a justification and rate per trait
+BIG5_COMBINED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "big5_ratings",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                trait: {
+                    "type": "object",
+                    "properties": {
+                        "justification": {"type": "string"},
+                        "rate": {"type": "string", "enum": ["Low", "Neutral", "High"]},
+                    },
+                    "required": ["justification", "rate"],
+                    "additionalProperties": False,
+                }
+                for trait in BIG5_TRAITS
+            },
+            "required": BIG5_TRAITS,
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def dimension_provider(dimension_name: str) -> str:
+    """Big-5 traits are graded by gpt-4o, every other dimension by claude-sonnet-4-5."""
+    return "openai" if dimension_name in BIG5_TRAITS or dimension_name == BIG5_COMBINED else "anthropic"
+
+
+def grading_units(dimensions: List[str], big5_mode: str = "per_trait") -> List[str]:
+    """The prompts to send per conversation: in combined mode the requested Big-5 traits share one."""
+    if big5_mode != "combined" or not any(d in BIG5_TRAITS for d in dimensions):
+        return list(dimensions)
+    return [d for d in dimensions if d not in BIG5_TRAITS] + [BIG5_COMBINED]
+
+
+def split_combined_big5_feedback(content: str) -> Dict[str, str]:
+    """Split one combined Big-5 response into per-trait feedback in the per-trait grader's format."""
+    ratings = json.loads(content)
+    feedback = {}
+    for trait in BIG5_TRAITS:
+        rating = ratings[trait]
+        rate = rating["rate"].strip().capitalize()
+        feedback[trait] = f"<rate>{rate}</rate><justification>{rating['justification']}</justification>"
+    return feedback
+
+
+def expand_feedback(unit: str, feedback: List[str], dimensions: List[str]) -> Dict[str, List[str]]:
+    """Map the feedback of one grading unit back to the requested dimensions."""
+    if unit != BIG5_COMBINED:
+        return {unit: feedback}
+    by_trait = {trait: [] for trait in BIG5_TRAITS if trait in dimensions}
+    for content in feedback:
         try:
-            data = json.load(f)
-            # Handle both single objects and arrays
-            if isinstance(data, list):
-                conversations = data
-            else:
-                conversations = [data]
-            return conversations
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing JSON file: {e}")
-            raise
+            split = split_combined_big5_feedback(content)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Unparseable combined Big-5 response, dropping this try: {e}")
+            continue
+        for trait in by_trait:
+            by_trait[trait].append(split[trait])
+    return {trait: tries for trait, tries in by_trait.items() if tries}
+
+
+def format_feedback(dimension_name: str, content: str, reasoning: str = "") -> str:
+    """Turn one grader completion into the feedback string stored in judgment_verbose."""
+    if dimension_name in BIG5_TRAITS or dimension_name == BIG5_COMBINED:
+        return content.strip()
+    # Format response with reasoning if available
+    if reasoning:
+        return f"{content}<justification>{reasoning}</justification>"
+    return content
+
+
+def score_dimension(dimension_name: str, feedback: List[str]):
+    """Reduce the sampled feedback for one dimension to its score."""
+    if dimension_name in BIG5_TRAITS:
+        votes = []
+        justifications = []
+        for score in feedback:
+            vote = score.split("<rate>")[1].split("</rate>")[0]
+            justification = score.split("<justification>")[1].split("</justification>")[0]
+            votes.append(vote)
+            justifications.append(justification)
+        return get_big5_scores(votes, dimension_name)
+    scores = extract_scores(feedback)
+    return get_mode_score(scores)
 
 
 class UserSimulatorJudge:
-    def __init__(self, num_tries_per_conversation: int = 10):
+    def __init__(self, num_tries_per_conversation: int = 10, big5_mode: str = "per_trait"):
         """
         Initialize the LLM judge using ai_client
 
         Args:
             num_tries_per_conversation: Number of tries per conversation
+            big5_mode: "per_trait" sends one prompt per Big-5 trait, "combined" rates all five in one call
         """
         self.num_tries_per_conversation = num_tries_per_conversation
+        self.big5_mode = big5_mode
         # Use ai_client for all model interactions
         self.openai_client = LiteLLMClient(
             api_key=os.environ.get("OPENAI_API_KEY"),
@@ -68,7 +158,7 @@ class UserSimulatorJudge:
 
         return "\n".join(formatted)
 
-    async def preprocess_big5_prompt(self, conversation_history: List[Dict]) -> str:
+    def _shopper_transcript(self, conversation_history: List[Dict]) -> str:
         shopper_utterances = []
         for turn in conversation_history:
             if turn['speaker'] == 'Shopper':
@@ -77,67 +167,85 @@ class UserSimulatorJudge:
         transcript = "\nUtterance: ".join(shopper_utterances)
         return transcript
 
-    async def get_feedback_for_dimension(self, dimension_name, conversation_history, persona, formatted_conversation):
-        for attempt in range(3):
-            try:
-                if dimension_name in BIG5_TRAITS:
-                    transcript = await self.preprocess_big5_prompt( conversation_history)
-                    prompt = DIMENSION_NAMES_TO_PROMPTS[dimension_name].format(transcript=transcript)
-                    response = await self.openai_client.async_chat_completion(
-                        messages=[
-                            {"role": "user", "content": prompt}
-                        ],
-                        model="gpt-4o",
-                        max_tokens=1000,
-                        temperature=0.3
-                    )
-                    return response['choices'][0].message.content.strip()
-                else:
-                    prompt = DIMENSION_NAMES_TO_PROMPTS[dimension_name]
-                    user_content = f"Here is the persona of the shopper and the conversation to evaluate:\nPersona:\n{persona}\nConversation:\n{formatted_conversation}"
-                    response = await self.anthropic_client.async_chat_completion(
-                        messages=[
-                            {"role": "system", "content": prompt},
-                            {"role": "user", "content": user_content}
-                        ],
-                        model="claude-sonnet-4-5",
-                        max_tokens=4000,
-                        temperature=0.3
-                    )
-                    # Format response with reasoning if available
-                    if response['reasoning']:
-                        return f"{response['choices'][0].message.content}<justification>{response['reasoning']}</justification>"
-                    else:
-                        return response['choices'][0].message.content
-            except Exception as e:
-                print("Retrying")
-                if attempt < 2:
-                    await asyncio.sleep(2)
-                else:
-                    raise
-                    
+    async def preprocess_big5_prompt(self, conversation_history: List[Dict]) -> str:
+        return self._shopper_transcript(conversation_history)
+
+    def parse_conversation(self, conversation_data: Dict[str, Any]):
+        """Return (conversation_history, persona, formatted_conversation) for a results record."""
+        conversation_history = eval(conversation_data.get('conversation', [])) if type(conversation_data.get('conversation', [])) is str else conversation_data.get('conversation', [])
+        persona = eval(conversation_data.get('shopper_persona', '')) if type(conversation_data.get('shopper_persona', '')) is str else conversation_data.get('shopper_persona', '')
+        preferences = conversation_data.get('shopper_preferences', '')
+        emotion = conversation_data.get('shopper_emotion', '')
+        persona.update({'preferences': preferences, 'emotion': emotion})
+        formatted_conversation = self._format_conversation(conversation_history)
+        return conversation_history, persona, formatted_conversation
+
+    def build_dimension_request(self, dimension_name, conversation_history, persona, formatted_conversation) -> Dict:
+        """Model, messages and sampling parameters of one grader judgment."""
+        if dimension_name == BIG5_COMBINED:
+            transcript = self._shopper_transcript(conversation_history)
+            return {
+                "model": "gpt-4o",
+                "messages": [
+                    {"role": "user", "content": BIG5_COMBINED_DIMENSION.format(transcript=transcript)}
+                ],
+                "max_tokens": 2500,
+                "temperature": 0.3,
+                "response_format": BIG5_COMBINED_RESPONSE_FORMAT,
+            }
+        if dimension_name in BIG5_TRAITS:
+            transcript = self._shopper_transcript(conversation_history)
+            prompt = DIMENSION_NAMES_TO_PROMPTS[dimension_name].format(transcript=transcript)
+            return {
+                "model": "gpt-4o",
+                "messages": [
+                    {"role": "user", "content": prompt}
+                ],
+                "max_tokens": 1000,
+                "temperature": 0.3,
+            }
+        prompt = DIMENSION_NAMES_TO_PROMPTS[dimension_name]
+        user_content = f"Here is the persona of the shopper and the conversation to evaluate:\nPersona:\n{persona}\nConversation:\n{formatted_conversation}"
+        return {
+            "model": "claude-sonnet-4-5",
+            "messages": [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": user_content}
+            ],
+            "max_tokens": 4000,
+            "temperature": 0.3,
+        }
+
+    async def get_feedback_for_dimension(self, dimension_name, conversation_history, persona, formatted_conversation, num_samples=1):
+        """Sample num_samples judgments of one dimension from a single request."""
+        request = self.build_dimension_request(dimension_name, conversation_history, persona, formatted_conversation)
+        client = self.openai_client if dimension_provider(dimension_name) == "openai" else self.anthropic_client
+        # Transient provider errors are retried with backoff inside the AI client
+        response = await client.async_chat_completion(**request, n=num_samples)
+        return [
+            format_feedback(dimension_name, choice.message.content, choice_reasoning(choice))
+            for choice in response['choices']
+        ]
+
     async def judge_conversation(self, conversation_data: Dict[str, Any], dimensions: List[str]) -> Dict[str, Any]:
         """
         Judge a single conversation and return feedback
         """
         try:
-            conversation_history = eval(conversation_data.get('conversation', [])) if type(conversation_data.get('conversation', [])) is str else conversation_data.get('conversation', [])
-            persona = eval(conversation_data.get('shopper_persona', '')) if type(conversation_data.get('shopper_persona', '')) is str else conversation_data.get('shopper_persona', '')
-            preferences = conversation_data.get('shopper_preferences', '')
-            emotion = conversation_data.get('shopper_emotion', '')
-            persona.update({'preferences': preferences, 'emotion': emotion})
-            formatted_conversation = self._format_conversation(conversation_history)
+            conversation_history, persona, formatted_conversation = self.parse_conversation(conversation_data)
             dimension_results = {}
 
-            # Process each dimension
-            for _, dimension_name in enumerate(dimensions, 1):
-                    feedbacks = await asyncio.gather(
-                        *[self.get_feedback_for_dimension(dimension_name, conversation_history, persona, formatted_conversation) for _ in range(self.num_tries_per_conversation)]
+            # Process each dimension (the Big-5 traits share one prompt in combined mode)
+            for unit in grading_units(dimensions, self.big5_mode):
+                    feedbacks = await self.get_feedback_for_dimension(
+                        unit, conversation_history, persona, formatted_conversation,
+                        num_samples=self.num_tries_per_conversation
                     )
-                    dimension_results[dimension_name] = {
-                        "status": "success",
-                        "feedback": feedbacks,
-                    }
+                    for dimension_name, dimension_feedback in expand_feedback(unit, feedbacks, dimensions).items():
+                        dimension_results[dimension_name] = {
+                            "status": "success",
+                            "feedback": dimension_feedback,
+                        }
         except Exception as e:
             logger.error(f"Error judging conversation: {e}")
             return {
@@ -154,6 +262,7 @@ class UserSimulatorJudge:
         input_path = Path(input_file)
         if not input_path.exists():
             raise FileNotFoundError(f"Input file not found: {input_file}")
+        logger.info(f"Streaming conversations from {input_file}")
 
         output_file = os.path.join(output_dir, f"breakdown_scores.json")
         results = []
@@ -182,20 +291,7 @@ class UserSimulatorJudge:
                 dimension_scores = {}
                 judgment_verbose = {}
                 for dim_name, feedbacks in judgment.items():
-                    if dim_name in BIG5_TRAITS:
-                        votes = []
-                        justifications = []
-                        scores = feedbacks["feedback"]
-                        for score in scores:
-                            vote = score.split("<rate>")[1].split("</rate>")[0]
-                            justification = score.split("<justification>")[1].split("</justification>")[0]
-                            votes.append(vote)
-                            justifications.append(justification)
-                        mode_score = get_big5_scores(votes, dim_name)
-                    else:
-                        scores = extract_scores(feedbacks["feedback"])
-                        mode_score = get_mode_score(scores)
-                    dimension_scores[dim_name] = mode_score
+                    dimension_scores[dim_name] = score_dimension(dim_name, feedbacks["feedback"])
                     judgment_verbose[dim_name] = feedbacks['feedback']
                 result = {
                     "conversation_id": conversation_id,
@@ -227,13 +323,28 @@ class UserSimulatorJudge:
 
         return results, skip_info
     
+def resolve_dimensions(dimensions: List[str]) -> List[str]:
+    """Expand ["ALL"] to every dimension and validate the rest."""
+    if dimensions == ["ALL"]:
+        return list(DIMENSION_NAMES_TO_PROMPTS.keys())
+    for dimension in dimensions:
+        if dimension not in DIMENSION_NAMES_TO_PROMPTS:
+            print(f"Dimension {dimension} not found in DIMENSION_NAMES_TO_PROMPTS")
+            raise ValueError(f"Dimension {dimension} not found in DIMENSION_NAMES_TO_PROMPTS")
+    return dimensions
+
 def write_aggregate_scores(results, dimensions, input_file, output_dir, skip_info=None, output_filename="aggregate_eval_scores.json"):
     """
     Calculate the average (mean) score per dimension across all conversations in results,
     and write the result to output_dir/output_filename as JSON.
     """
     import json
-    conversations = load_input_file(input_file)
+    # Align gold Big-5 traits with results by conversation id, streaming the input
+    traits_by_id = {
+        conversation.get('conversation_id', str(idx)): {"shopper_big5_traits": conversation.get("shopper_big5_traits", {})}
+        for idx, conversation in enumerate(load_input_file(input_file))
+    }
+    conversations = [traits_by_id.get(result["conversation_id"], {}) for result in results]
     final_output = {}
     for dimension in dimensions:
         if dimension in BIG5_TRAITS:
@@ -259,22 +370,22 @@ async def main():
     parser.add_argument("--output_dir", help="Output file (auto-generated if not provided)")
     parser.add_argument("--dimensions", required=True, nargs="+", help="Dimensions to evaluate")
     parser.add_argument("--num_tries_per_conversation", type=int, default=5, help="Number of tries per conversation")
+    parser.add_argument("--big5_mode", choices=BIG5_MODES, default="per_trait", help="Rate each Big-5 trait with its own prompt, or all five in one structured call")
+    parser.add_argument("--export_transcripts", action="store_true", help="Also write every transcript to human_readable_conversations/ (the viewer renders them on demand otherwise)")
     args = parser.parse_args()
     if args.output_dir is None:
         args.output_dir = f"judge_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     os.makedirs(args.output_dir, exist_ok=True)
-    convert_conversations_to_txt(args.input_file, os.path.join(args.output_dir, "human_readable_conversations"))
+    # The viewer renders transcripts from the graded results on demand
+    write_transcript_source(args.output_dir, args.input_file)
+    if args.export_transcripts:
+        convert_conversations_to_txt(args.input_file, os.path.join(args.output_dir, "human_readable_conversations"))
     judge = UserSimulatorJudge(
-        num_tries_per_conversation=args.num_tries_per_conversation
+        num_tries_per_conversation=args.num_tries_per_conversation,
+        big5_mode=args.big5_mode
     )
     if args.dimensions:
-        if args.dimensions == ["ALL"]:
-            args.dimensions = list(DIMENSION_NAMES_TO_PROMPTS.keys())
-        else:
-            for dimension in args.dimensions:
-                if dimension not in DIMENSION_NAMES_TO_PROMPTS:
-                    print(f"Dimension {dimension} not found in DIMENSION_NAMES_TO_PROMPTS")
-                    raise ValueError(f"Dimension {dimension} not found in DIMENSION_NAMES_TO_PROMPTS")
+        args.dimensions = resolve_dimensions(args.dimensions)
     results, skip_info = await judge.process_json_file(args.input_file, args.output_dir, args.dimensions)
     write_aggregate_scores(results, args.dimensions, args.input_file, args.output_dir, skip_info)
     
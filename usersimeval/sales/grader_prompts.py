@@ -239,4 +239,27 @@ DIMENSION_NAMES_TO_PROMPTS = {
    "BIG5_AGREEABLENESS": BIG5_AGREEABLENESS_DIMENSION,
    "BIG5_OPENNESS": BIG5_OPENNESS_DIMENSION,
 }
-BIG5_TRAITS = ["BIG5_EXTROVERSION", "BIG5_NEUROTICISM", "BIG5_CONSCIENTIOUSNESS", "BIG5_AGREEABLENESS", "BIG5_OPENNESS"]
\ No newline at end of file
+BIG5_TRAITS = ["BIG5_EXTROVERSION", "BIG5_NEUROTICISM", "BIG5_CONSCIENTIOUSNESS", "BIG5_AGREEABLENESS", "BIG5_OPENNESS"]
+
+## BIGFIVE, all traits in one call
+
+# Pseudo-dimension used when the five Big-5 traits are rated together
+BIG5_COMBINED = "BIG5_COMBINED"
+
+
+def _big5_rubric(prompt):
+    """The trait definition and indicators of a per-trait prompt, without its transcript and answer format."""
+    return prompt.split("Conversation transcript:")[0].strip()
+
+
+BIG5_COMBINED_DIMENSION = "Analyze the following conversation transcript and evaluate the person on five personality traits. Each trait is rated independently using its own guidelines below.\n\n" + "\n\n".join(
+    f"### {trait}\n{_big5_rubric(DIMENSION_NAMES_TO_PROMPTS[trait])}" for trait in BIG5_TRAITS
+) + """
+
+Conversation transcript:
+```
+{transcript}
+```
+
+Based solely on this conversation, rate the person's level of each trait above as: Low, Neutral, or High.
+Answer with a JSON object with one entry per trait (""" + ", ".join(BIG5_TRAITS) + """). Each entry has a "justification" with specific quotes from the conversation, followed by the "rate"."""
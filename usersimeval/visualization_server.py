@@ -2,23 +2,182 @@
 """
 HTTP server for rollout viewer that can be pointed to any base directory.
 Usage: python rollout_server.py [--base-dir <directory>] [--port <port>]
+
+Besides the static files, the server exposes a small JSON API over
+breakdown_scores.json so the viewer never downloads the whole file:
+
+    GET /api/conversations?offset=0&limit=60&filter=<dimension>:<score>
+        One page of conversation summaries (id and dimension scores), the
+        total number of matches and dimension score histograms over all matches.
+        filter is "<dimension>", "<dimension>:<score>" or "*:<score>".
+    GET /api/conversation/<conversation_id>
+        The full graded record plus its transcript. Transcripts are rendered on
+        demand from the graded simulation results (--results, or the path the
+        grader recorded in transcript_source.json); exported .txt files in
+        human_readable_conversations/ are used when no results are available.
+
+API responses are gzipped when the client accepts it and carry an ETag, so
+unchanged pages are answered with 304 Not Modified.
 """
 
 import argparse
+import gzip
+import hashlib
 import http.server
-import socketserver
+import json
 import os
 import sys
 import shutil
 import logging
 import signal
 import atexit
+import threading
+from collections import Counter
 from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+from usersimeval.convert_rollouts_to_txt import TranscriptRenderer, read_transcript_source
+
+DEFAULT_PAGE_SIZE = 60
+MAX_PAGE_SIZE = 500
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+
+def parse_filter(filter_str):
+    """Split "<dimension>[:<score>]" into (dimension, score); "*" or "all" means any dimension."""
+    if not filter_str:
+        return None, None
+    dimension, _, score = filter_str.partition(':')
+    dimension = None if dimension in ('', '*', 'all') else dimension
+    score = None if score in ('', '*', 'all') else score
+    return dimension, score
+
+
+class RolloutIndex:
+    """
+    In-memory index over breakdown_scores.json.
+    The file is re-read when its modification time changes, so the viewer can be
+    left running while the grader is still appending results.
+    """
+
+    def __init__(self, base_dir, transcript_renderer=None):
+        self.scores_path = Path(base_dir) / 'breakdown_scores.json'
+        self.conversations_dir = Path(base_dir) / 'human_readable_conversations'
+        self.transcript_renderer = transcript_renderer
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.version = ''
+        self.records = {}
+        self.summaries = []
+        self.dimensions = []
+        self.scores = []
+        self._histogram_cache = {}
+
+    def refresh(self):
+        try:
+            stat = self.scores_path.stat()
+        except FileNotFoundError:
+            return
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.scores_path, 'r', encoding='utf-8') as f:
+                    rollouts = json.load(f)
+            except json.JSONDecodeError as e:
+                # The grader rewrites the file after every conversation; keep the last good copy
+                logging.warning(f"Could not parse {self.scores_path}: {e}")
+                return
+
+            records = {}
+            summaries = []
+            dimensions = set()
+            scores = set()
+            for idx, rollout in enumerate(rollouts):
+                conversation_id = str(rollout.get('conversation_id', rollout.get('index', idx)))
+                dimension_scores = rollout.get('dimension_scores', {})
+                records[conversation_id] = rollout
+                summaries.append({"conversation_id": conversation_id, "dimension_scores": dimension_scores})
+                dimensions.update(dimension_scores)
+                scores.update(str(score) for score in dimension_scores.values())
+
+            self.records = records
+            self.summaries = summaries
+            self.dimensions = sorted(dimensions)
+            self.scores = sorted(scores)
+            self._histogram_cache = {}
+            self._mtime = mtime
+            self.version = f"{mtime[0]:x}-{mtime[1]:x}"
+
+    def filter(self, filter_str):
+        dimension, score = parse_filter(filter_str)
+        summaries = self.summaries
+        if dimension is not None:
+            summaries = [s for s in summaries if dimension in s["dimension_scores"]]
+            if score is not None:
+                summaries = [s for s in summaries if str(s["dimension_scores"][dimension]) == score]
+        elif score is not None:
+            summaries = [s for s in summaries if score in (str(v) for v in s["dimension_scores"].values())]
+        return summaries
+
+    def histograms(self, filter_str, summaries):
+        """Per-dimension score counts over the filtered conversations, cached per filter."""
+        key = (self.version, filter_str)
+        with self._lock:
+            cached = self._histogram_cache.get(key)
+        if cached is not None:
+            return cached
+        counters = {}
+        for summary in summaries:
+            for dimension, score in summary["dimension_scores"].items():
+                counters.setdefault(dimension, Counter())[str(score)] += 1
+        histograms = {dimension: dict(sorted(counts.items())) for dimension, counts in sorted(counters.items())}
+        with self._lock:
+            self._histogram_cache[key] = histograms
+        return histograms
+
+    def page(self, offset, limit, filter_str):
+        self.refresh()
+        summaries = self.filter(filter_str)
+        return {
+            "total": len(summaries),
+            "offset": offset,
+            "limit": limit,
+            "items": summaries[offset:offset + limit],
+            "histograms": self.histograms(filter_str, summaries),
+            "dimensions": self.dimensions,
+            "scores": self.scores,
+        }
+
+    def transcript(self, conversation_id):
+        if self.transcript_renderer is not None:
+            transcript = self.transcript_renderer.get(conversation_id)
+            if transcript is not None:
+                return transcript
+        path = self.conversations_dir / f"conversation_{conversation_id}.txt"
+        if not path.is_file():
+            return None
+        return path.read_text(encoding='utf-8')
+
+    def conversation(self, conversation_id):
+        self.refresh()
+        rollout = self.records.get(conversation_id)
+        if rollout is None:
+            return None
+        return {
+            "conversation_id": conversation_id,
+            "dimension_scores": rollout.get("dimension_scores", {}),
+            "judgment_verbose": rollout.get("judgment_verbose", {}),
+            "transcript": self.transcript(conversation_id),
+        }
 
 
 class RolloutHandler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, base_directory=None, **kwargs):
+    def __init__(self, *args, base_directory=None, rollout_index=None, **kwargs):
         self.base_directory = base_directory or os.getcwd()
+        self.rollout_index = rollout_index or RolloutIndex(self.base_directory)
         super().__init__(*args, directory=self.base_directory, **kwargs)
 
     def do_GET(self):
@@ -27,9 +186,61 @@ class RolloutHandler(http.server.SimpleHTTPRequestHandler):
             self.send_response(204)  # No Content
             self.end_headers()
             return
+        parsed = urlparse(self.path)
+        if parsed.path.startswith('/api/'):
+            self.handle_api(parsed)
+            return
         # Default to parent behavior
         super().do_GET()
 
+    def handle_api(self, parsed):
+        query = parse_qs(parsed.query)
+        if parsed.path == '/api/conversations':
+            try:
+                offset = max(int(query.get('offset', ['0'])[0]), 0)
+                limit = min(max(int(query.get('limit', [str(DEFAULT_PAGE_SIZE)])[0]), 1), MAX_PAGE_SIZE)
+            except ValueError:
+                self.send_json_error(400, "offset and limit must be integers")
+                return
+            filter_str = query.get('filter', [''])[0]
+            self.send_json(self.rollout_index.page(offset, limit, filter_str))
+        elif parsed.path.startswith('/api/conversation/'):
+            conversation_id = unquote(parsed.path[len('/api/conversation/'):])
+            conversation = self.rollout_index.conversation(conversation_id)
+            if conversation is None:
+                self.send_json_error(404, f"Conversation not found: {conversation_id}")
+                return
+            self.send_json(conversation)
+        else:
+            self.send_json_error(404, f"Unknown endpoint: {parsed.path}")
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if status == 200 and etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        use_gzip = len(body) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if use_gzip:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if status == 200:
+            self.send_header('ETag', etag)
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json_error(self, status, message):
+        self.send_json({"error": message}, status=status)
+
     def end_headers(self):
         # Add CORS headers to allow local file access
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -38,11 +249,14 @@ class RolloutHandler(http.server.SimpleHTTPRequestHandler):
         super().end_headers()
 
 
-def create_handler(base_directory):
+def create_handler(base_directory, transcript_renderer=None):
     """Create a handler class with the specified base directory."""
+    # Shared by all request threads so breakdown_scores.json is parsed once
+    rollout_index = RolloutIndex(base_directory, transcript_renderer)
+
     class CustomHandler(RolloutHandler):
         def __init__(self, *args, **kwargs):
-            super().__init__(*args, base_directory=base_directory, **kwargs)
+            super().__init__(*args, base_directory=base_directory, rollout_index=rollout_index, **kwargs)
     return CustomHandler
 
 
@@ -97,6 +311,12 @@ def main():
                        type=int,
                        default=8000,
                        help='Port to serve on (default: 8000)')
+    parser.add_argument('--results',
+                       help='Simulation results to render transcripts from (default: read from transcript_source.json)')
+    parser.add_argument('--transcript-cache-size',
+                       type=int,
+                       default=256,
+                       help='Number of rendered transcripts kept in memory (default: 256)')
 
     args = parser.parse_args()
 
@@ -134,17 +354,26 @@ def main():
             logging.warning(f"  - {file}")
         logging.warning("The rollout viewer may not work correctly.")
 
-    # Check for human_readable_conversations directory
+    # Transcripts are rendered on demand from the graded results when they can be found
+    transcript_renderer = None
+    results_path = args.results or read_transcript_source(str(base_dir))
+    if results_path:
+        try:
+            transcript_renderer = TranscriptRenderer(results_path, max_entries=args.transcript_cache_size)
+            logging.info(f"Rendering transcripts from: {transcript_renderer.results_path}")
+        except FileNotFoundError as e:
+            logging.warning(f"Cannot render transcripts: {e}")
+
     conversations_dir = base_dir / 'human_readable_conversations'
-    if not conversations_dir.exists():
-        logging.warning(f"'human_readable_conversations' directory not found in {base_dir}")
-        logging.warning("Conversation viewing will not work correctly.")
+    if transcript_renderer is None and not conversations_dir.exists():
+        logging.warning(f"No simulation results or 'human_readable_conversations' directory found for {base_dir}")
+        logging.warning("Conversation viewing will not work correctly. Pass --results <simulations_dir>.")
 
     # Create the handler with the specified base directory
-    handler_class = create_handler(str(base_dir))
+    handler_class = create_handler(str(base_dir), transcript_renderer)
 
-    # Start the server
-    with socketserver.TCPServer(("", args.port), handler_class) as httpd:
+    # Start the server; each request is handled on its own thread
+    with http.server.ThreadingHTTPServer(("", args.port), handler_class) as httpd:
         logging.info(f"Serving rollout viewer from: {base_dir}")
         logging.info(f"Server running at: http://localhost:{args.port}")
         logging.info(f"Open http://localhost:{args.port}/rollout_viewer.html in your browser")